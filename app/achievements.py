@@ -0,0 +1,63 @@
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+AchievementRule = namedtuple('AchievementRule', ['counter', 'threshold', 'name', 'description'])
+
+# Declarative badge table. Adding a row is enough: backfill() awards it to users
+# who already passed the threshold, and new events are matched in O(1).
+ACHIEVEMENT_RULES = [
+    AchievementRule('messages', 10, "Primeros Pasos", "Enviados 10 mensajes"),
+    AchievementRule('messages', 100, "Cien Mensajes", "Enviados 100 mensajes"),
+]
+
+
+class AchievementEngine:
+    """Awards badges from per-user counters kept in the user_counters table.
+
+    Counters only ever grow by one per event, so a rule fires exactly when its
+    counter equals the threshold; the unique (user_id, name) constraint makes
+    awarding idempotent even if an event is replayed.
+    """
+
+    def __init__(self, rules=ACHIEVEMENT_RULES):
+        self.rules = list(rules)
+        self._by_threshold = {}
+        for rule in self.rules:
+            self._by_threshold.setdefault((rule.counter, rule.threshold), []).append(rule)
+
+    def evaluate(self, counter, value):
+        """Rules crossed when counter reaches value."""
+        return self._by_threshold.get((counter, value), [])
+
+    def evaluate_range(self, counter, before, after):
+        """Rules crossed when counter jumps from before to after in one bulk event."""
+        return [rule for rule in self.rules if rule.counter == counter and before < rule.threshold <= after]
+
+    def award(self, cur, user_id, rules):
+        """Insert badges for rules, returning only the ones that were new."""
+        if not rules:
+            return []
+        cur.execute(
+            "INSERT INTO achievements (user_id, name, description) "
+            "SELECT %s, r.name, r.description FROM unnest(%s::varchar[], %s::text[]) AS r(name, description) "
+            "ON CONFLICT (user_id, name) DO NOTHING RETURNING name, description",
+            (user_id, [rule.name for rule in rules], [rule.description for rule in rules])
+        )
+        return [{'name': name, 'description': description} for name, description in cur.fetchall()]
+
+    def backfill(self, cur):
+        """Award every rule to users whose counters are already past its threshold."""
+        cur.execute(
+            "INSERT INTO achievements (user_id, name, description) "
+            "SELECT c.user_id, r.name, r.description FROM user_counters c "
+            "JOIN unnest(%s::varchar[], %s::int[], %s::varchar[], %s::text[]) "
+            "AS r(counter, threshold, name, description) ON c.name = r.counter AND c.value >= r.threshold "
+            "ON CONFLICT (user_id, name) DO NOTHING",
+            ([rule.counter for rule in self.rules], [rule.threshold for rule in self.rules],
+             [rule.name for rule in self.rules], [rule.description for rule in self.rules])
+        )
+        if cur.rowcount:
+            logger.info(f"Backfilled {cur.rowcount} achievements")
+        return cur.rowcount
@@ -0,0 +1,193 @@
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Queue lanes: lower runs first. Cache hits never reach the queue at all.
+LANE_FAST = 0
+LANE_STANDARD = 1
+LANE_BATCH = 2
+
+# Refill and take in one round trip, on the Redis clock so workers agree on time.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class Rejected(Exception):
+    """Request shed by admission control; retry_after is in whole seconds."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """Redis token bucket shared by every worker. Fails open if Redis is unavailable."""
+
+    def __init__(self, redis_client, rate, capacity, prefix):
+        self.redis = redis_client
+        self.rate = rate
+        self.capacity = capacity
+        self.prefix = prefix
+        self._script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def take(self, key='', cost=1):
+        """Take cost tokens; return 0 if granted, else seconds until they would be available."""
+        try:
+            return float(self._script(keys=[f"{self.prefix}{key}"], args=[self.rate, self.capacity, cost]))
+        except Exception as e:
+            logger.error(f"Rate limiter unavailable, admitting request: {e}")
+            return 0.0
+
+
+class Ticket:
+    """A held slot in the admission queue; release() is idempotent."""
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.acquired = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.queue.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionQueue:
+    """Per-process concurrency slots with a bounded, prioritised wait queue.
+
+    A request waits at most `timeout` seconds for a slot, and when `max_waiting`
+    requests are already queued new ones are shed at once. Admitted requests
+    therefore see bounded queueing delay instead of a backlog that grows with
+    the overload.
+    """
+
+    def __init__(self, slots, max_waiting, timeout):
+        self.slots = slots
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.available = slots
+        self.service_time = 1.0
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def retry_after(self):
+        """Estimated seconds until the current backlog drains."""
+        return self.service_time * (len(self._waiting) + 1) / self.slots
+
+    def acquire(self, lane=LANE_STANDARD):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            if self.available > 0 and not self._waiting:
+                self.available -= 1
+                return Ticket(self)
+            if len(self._waiting) >= self.max_waiting:
+                raise Rejected('queue_full', self.retry_after())
+            entry = (lane, next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+            while not (self.available > 0 and self._waiting[0] == entry):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                    raise Rejected('queue_timeout', self.retry_after())
+                self._cond.wait(remaining)
+            heapq.heappop(self._waiting)
+            self.available -= 1
+            return Ticket(self)
+
+    def release(self, ticket):
+        with self._cond:
+            self.available += 1
+            self.service_time = 0.9 * self.service_time + 0.1 * (time.monotonic() - ticket.acquired)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {'in_use': self.slots - self.available, 'waiting': len(self._waiting),
+                    'service_time': round(self.service_time, 3)}
+
+
+class AdmissionController:
+    """Admission control for /chat.
+
+    check_user() applies the per-user token bucket before any work is done.
+    admit() is called only for requests that need the model (cache hits skip
+    it): it waits for a slot in the prioritised queue and then for the global
+    bucket, which tracks the upstream rate limit across all workers, and for the
+    model's own bucket when model_rates has one ({model: (rate, burst)}).
+    """
+
+    def __init__(self, redis_client, user_rate, user_burst, global_rate, global_burst,
+                 slots=32, max_waiting=64, queue_timeout=10.0, model_rates=None, batch_rate=None, batch_burst=50):
+        self.user_bucket = TokenBucket(redis_client, user_rate, user_burst, 'ratelimit:user:')
+        # Batch prompts are metered per prompt in their own bucket, so a batch costs more than one chat.
+        self.batch_bucket = TokenBucket(redis_client, batch_rate or user_rate, batch_burst, 'ratelimit:batch:')
+        self.global_bucket = TokenBucket(redis_client, global_rate, global_burst, 'ratelimit:global')
+        self.model_buckets = {
+            model: TokenBucket(redis_client, rate, burst, f'ratelimit:model:{model}')
+            for model, (rate, burst) in (model_rates or {}).items()
+        }
+        self.queue = AdmissionQueue(slots, max_waiting, queue_timeout)
+
+    def check_user(self, user_id):
+        wait = self.user_bucket.take(user_id)
+        if wait > 0:
+            logger.warning(f"Rate limited user_id: {user_id}")
+            raise Rejected('user_rate', wait)
+
+    def check_batch(self, user_id, prompts):
+        wait = self.batch_bucket.take(user_id, cost=prompts)
+        if wait > 0:
+            logger.warning(f"Rate limited batch of {prompts} prompts for user_id: {user_id}")
+            raise Rejected('batch_rate', wait)
+
+    def admit(self, lane=LANE_STANDARD, model=None):
+        """Return a Ticket to release once the model call has finished."""
+        deadline = time.monotonic() + self.queue.timeout
+        ticket = self.queue.acquire(lane)
+        buckets = [('global_rate', self.global_bucket)]
+        if model in self.model_buckets:
+            buckets.append(('model_rate', self.model_buckets[model]))
+        for reason, bucket in buckets:
+            wait = bucket.take()
+            while wait > 0:
+                if time.monotonic() + wait > deadline:
+                    ticket.release()
+                    logger.warning(f"Shedding request: {reason.replace('_', ' ')} limit")
+                    raise Rejected(reason, wait)
+                time.sleep(wait)
+                wait = bucket.take()
+        return ticket
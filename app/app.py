@@ -1,50 +1,214 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, send_from_directory
+import os
+
+# Cooperative workers must patch the stdlib before anything opens a socket.
+ASYNC_MODE = os.getenv("ASYNC_MODE", "threading")
+if ASYNC_MODE == "eventlet":
+    import eventlet
+    eventlet.monkey_patch()
+    from psycogreen.eventlet import patch_psycopg
+    patch_psycopg()
+
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, send_from_directory, send_file, Response, stream_with_context
 from flask_socketio import SocketIO, emit
-from openai import OpenAI
 import psycopg2
-from psycopg2 import pool
-import os
 from dotenv import load_dotenv
-import bcrypt
-import re
 import redis
 import json
-import base64
 import datetime
-from apscheduler.schedulers.background import BackgroundScheduler
-from langdetect import detect, DetectorFactory
 from werkzeug.utils import secure_filename
 import logging
 import shutil
 import time
+import mimetypes
+import threading
+import uuid
+from response_cache import ResponseCache
+from memory import ConversationMemory, SUMMARY_TOKEN_BUDGET, extractive_summary
+from migrations import migrate
+from chat_loader import ChatDataLoader, StageTimer
+from achievements import AchievementEngine
+from scheduler import SchedulerService, JOBS_TABLE
+from uploads import UploadProcessor, save_upload
+from blobstore import BlobStore, LocalBlobBackend, S3BlobBackend, DIGEST_PATTERN
+from language import LanguageDetector
+from context_store import ContextStore, extract_context
+from settings_cache import SettingsCache, fetch_settings
+from database import ConnectionPool, PoolTimeout
+from admission import AdmissionController, Rejected, LANE_FAST, LANE_STANDARD
+from chat_batch import ChatBatch
+from write_behind import ConversationWriter
+from telemetry import Telemetry, otel_tracer
+from startup import Warmup, retry
+from llm_gateway import LLMGateway, OpenAIBackend, MockBackend, parse_model_map
+from realtime import Realtime
+from passwords import PasswordHasher, LoginThrottle
+from search import SEARCH_SQL, HIGHLIGHT_OPTIONS, highlight
+from archive import EXPORT_TABLES, FORMATS, iter_ndjson, iter_parquet, parse_ndjson, import_records
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Ensure consistent language detection
-DetectorFactory.seed = 0
-
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", os.urandom(24))
-socketio = SocketIO(app, cors_allowed_origins="*")  # Allow HTTPS for Render
+# The message queue lets any worker, scheduler thread or node emit to sockets held elsewhere.
+socketio = SocketIO(
+    app, cors_allowed_origins="*", async_mode=ASYNC_MODE,  # Allow HTTPS for Render
+    message_queue=os.getenv("SOCKETIO_MESSAGE_QUEUE", os.getenv("REDIS_URL")) or None,
+    channel=os.getenv("SOCKETIO_CHANNEL", "flask-socketio")
+)
+realtime = Realtime(socketio, batch_interval=float(os.getenv("SOCKETIO_BATCH_MS", 0)) / 1000)
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+if os.getenv("LLM_BACKEND", "openai") == "mock":
+    # LLM_MOCK_LATENCY: seconds per call, or per model as "gpt-4o=3,gpt-3.5-turbo=0.5"
+    mock_latency = os.getenv("LLM_MOCK_LATENCY", "0")
+    llm_backend = MockBackend(latency=parse_model_map(mock_latency) if '=' in mock_latency else float(mock_latency))
+else:
+    llm_backend = OpenAIBackend(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", 100)),
+        max_keepalive=int(os.getenv("LLM_MAX_KEEPALIVE", 20))
+    )
+llm = LLMGateway(
+    llm_backend,
+    timeouts=parse_model_map(os.getenv("LLM_TIMEOUTS")),
+    retries=int(os.getenv("LLM_RETRIES", 2)),
+    latency_budget=float(os.getenv("LLM_LATENCY_BUDGET", 45)),
+    hedge_after=float(os.getenv("LLM_HEDGE_AFTER")) if os.getenv("LLM_HEDGE_AFTER") else None
+)
 redis_client = redis.Redis.from_url(os.getenv("REDIS_URL"), decode_responses=True)
 
-# Database connection using DATABASE_URL
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+
+def embed_text(text):
+    """Embed a prompt for the semantic cache tier."""
+    return llm.embed(EMBEDDING_MODEL, text, dimensions=256)
+
+response_cache = ResponseCache(
+    redis_client,
+    ttl=int(os.getenv("CACHE_TTL", 3600)),
+    embed=embed_text if os.getenv("SEMANTIC_CACHE", "0") == "1" else None,
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92)),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 5000)),
+    scope=os.getenv("CACHE_SCOPE", "user")
+)
+
+def summarize_turns(previous, turns):
+    """Fold turns that left the memory window into the running summary."""
+    transcript = extractive_summary(previous, turns)
+    try:
+        summary, _ = llm.complete(
+            'gpt-3.5-turbo',
+            [
+                {"role": "system", "content": "Resume la conversación en pocas frases, conservando nombres, fechas y decisiones."},
+                {"role": "user", "content": transcript}
+            ],
+            max_tokens=SUMMARY_TOKEN_BUDGET,
+            temperature=0.3
+        )
+        return summary
+    except Exception as e:
+        logger.error(f"Failed to summarize conversation: {e}")
+        return transcript
+
+conversation_memory = ConversationMemory(redis_client, summarize=summarize_turns)
+achievement_engine = AchievementEngine()
+context_store = ContextStore(cap=int(os.getenv("CONTEXT_CAP", 20)))
+# Preferences and profile per user, so /chat doesn't query them on every turn.
+settings_cache = SettingsCache(
+    redis_client,
+    max_entries=int(os.getenv("SETTINGS_CACHE_SIZE", 10000)),
+    ttl=int(os.getenv("SETTINGS_CACHE_TTL", 3600))
+)
+
+admission = AdmissionController(
+    redis_client,
+    user_rate=float(os.getenv("USER_RATE_PER_MINUTE", 20)) / 60,
+    user_burst=int(os.getenv("USER_BURST", 10)),
+    global_rate=float(os.getenv("GLOBAL_RATE_PER_MINUTE", 500)) / 60,
+    global_burst=int(os.getenv("GLOBAL_BURST", 50)),
+    slots=int(os.getenv("LLM_CONCURRENCY", 32)),
+    max_waiting=int(os.getenv("ADMISSION_QUEUE_SIZE", 64)),
+    queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 10)),
+    # MODEL_RATE_PER_MINUTE="gpt-4o=60,gpt-3.5-turbo=300"; bursts from MODEL_BURST, same format
+    model_rates={
+        model: (per_minute / 60, parse_model_map(os.getenv("MODEL_BURST"), int).get(model, 10))
+        for model, per_minute in parse_model_map(os.getenv("MODEL_RATE_PER_MINUTE")).items()
+    },
+    batch_rate=float(os.getenv("BATCH_PROMPTS_PER_MINUTE", 100)) / 60,
+    batch_burst=int(os.getenv("CHAT_BATCH_MAX", 50))
+)
+chat_batch = ChatBatch(llm, admission, concurrency=int(os.getenv("CHAT_BATCH_CONCURRENCY", 4)))
+
+# Attempts are throttled per IP and per username before any bcrypt work is queued.
+login_throttle = LoginThrottle(
+    redis_client,
+    user_rate=float(os.getenv("LOGIN_RATE_PER_MINUTE", 5)) / 60,
+    user_burst=int(os.getenv("LOGIN_BURST", 5)),
+    ip_rate=float(os.getenv("LOGIN_IP_RATE_PER_MINUTE", 30)) / 60,
+    ip_burst=int(os.getenv("LOGIN_IP_BURST", 30)),
+    # LOGIN_THROTTLE=0 is for load tests only: every client shares one IP there.
+    enabled=os.getenv("LOGIN_THROTTLE", "1") == "1"
+)
+if ASYNC_MODE == "eventlet":
+    from eventlet import tpool
+    password_hasher = PasswordHasher(rounds=int(os.getenv("BCRYPT_ROUNDS", 12)), offload=tpool.execute,
+                                     max_pending=int(os.getenv("AUTH_HASH_QUEUE", 16)))
+else:
+    password_hasher = PasswordHasher(rounds=int(os.getenv("BCRYPT_ROUNDS", 12)),
+                                     max_workers=int(os.getenv("AUTH_HASH_WORKERS", 2)),
+                                     max_pending=int(os.getenv("AUTH_HASH_QUEUE", 16)))
+
+language_detector = LanguageDetector(
+    redis_client, threshold=float(os.getenv("LANGUAGE_CONFIDENCE", 0.8)),
+    memo_size=int(os.getenv("LANGUAGE_MEMO_SIZE", 10000))
+)
+
+# Database connection using DATABASE_URL. The pool is lazy so importing the app never
+# touches the database; warmup() primes it with backoff once the database answers.
 DATABASE_URL = os.getenv("DATABASE_URL")
-try:
-    db_pool = pool.SimpleConnectionPool(
-        1, 10,  # Reduced max connections for free tier
-        dsn=DATABASE_URL
+db_pool = ConnectionPool(
+    DATABASE_URL,
+    minconn=int(os.getenv("DB_POOL_MIN", 1)),
+    maxconn=int(os.getenv("DB_POOL_MAX", 10)),  # Reduced max connections for free tier
+    timeout=float(os.getenv("DB_POOL_TIMEOUT", 5)),
+    max_lifetime=float(os.getenv("DB_CONN_MAX_LIFETIME", 1800)),
+    statement_timeouts={
+        'interactive': int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 5000)),
+        'background': int(os.getenv("DB_BACKGROUND_STATEMENT_TIMEOUT_MS", 60000)),
+    },
+    lazy=True,
+    application_name=os.getenv("DB_APPLICATION_NAME", "chatbot")
+)
+
+scheduler_service = SchedulerService(redis_client, jobstore_url=DATABASE_URL)
+
+# WRITE_BEHIND=1: /chat answers once the model is done and exchanges are persisted
+# in batches from a Redis stream. Rows can reach /history a flush interval later.
+conversation_writer = None
+if os.getenv("WRITE_BEHIND", "0") == "1":
+    conversation_writer = ConversationWriter(
+        redis_client, db_pool, achievement_engine,
+        batch_size=int(os.getenv("WRITE_BEHIND_BATCH", 500)),
+        max_pending=int(os.getenv("WRITE_BEHIND_MAX_PENDING", 100000)),
+        on_awarded=lambda user_id, achievements: realtime.emit(user_id, 'achievement', achievements)
     )
-    logger.info("Database pool initialized")
-except Exception as e:
-    logger.error(f"Failed to initialize database pool: {e}")
-    raise
+
+# Prometheus metrics at /metrics; stage spans are exported when an OTLP endpoint is configured.
+telemetry = None
+if os.getenv("METRICS_ENABLED", "1") == "1":
+    telemetry = Telemetry(tracer=otel_tracer("chatbot") if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT") else None)
+    telemetry.init_app(app)
+    telemetry.instrument_llm(llm)
+    telemetry.instrument_scheduler(scheduler_service)
+    telemetry.stats.add('response_cache', response_cache.stats)
+    telemetry.stats.add('db_pool', db_pool.stats)
+    telemetry.stats.add('admission', admission.queue.stats)
+    telemetry.stats.add('settings_cache', settings_cache.stats)
+    if conversation_writer:
+        telemetry.stats.add('write_behind', conversation_writer.stats)
 
 # Ephemeral storage for file uploads
 UPLOAD_FOLDER = '/tmp/uploads'
@@ -55,27 +219,52 @@ except Exception as e:
     logger.error(f"Failed to create upload folder: {e}")
     raise
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['USE_X_SENDFILE'] = os.getenv("USE_X_SENDFILE", "0") == "1"
+
+if os.getenv("BLOB_BACKEND", "local") == "s3":
+    blob_backend = S3BlobBackend(
+        os.getenv("S3_BUCKET"),
+        staging=os.path.join(UPLOAD_FOLDER, '.staging'),
+        endpoint_url=os.getenv("S3_ENDPOINT_URL")
+    )
+else:
+    blob_backend = LocalBlobBackend(UPLOAD_FOLDER)
+blob_store = BlobStore(blob_backend, redis_client, ttl=int(os.getenv("UPLOAD_TTL", 24 * 3600)))
+
+if ASYNC_MODE == "eventlet":
+    from eventlet import tpool
+    upload_processor = UploadProcessor(redis_client, offload=tpool.execute)
+else:
+    upload_processor = UploadProcessor(redis_client, max_workers=int(os.getenv("UPLOAD_WORKERS", 4)))
 ALLOWED_EXTENSIONS = {'txt', 'jpg', 'jpeg', 'png'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def clean_upload_folder():
-    """Clean old files from upload folder (older than 24 hours)."""
+    """Purge uploads whose retention (UPLOAD_TTL, 24 hours by default) has passed."""
     try:
-        now = time.time()
-        for filename in os.listdir(app.config['UPLOAD_FOLDER']):
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            if os.path.isfile(file_path) and (now - os.path.getmtime(file_path)) > 24 * 3600:
-                os.remove(file_path)
-                logger.info(f"Cleaned old file: {filename}")
+        blob_store.purge_expired()
     except Exception as e:
         logger.error(f"Failed to clean upload folder: {e}")
 
+def store_upload(file_storage, process=False, expires=True):
+    """Stream an upload into the blob store and return (url, filename, artifact)."""
+    filename = secure_filename(file_storage.filename)
+    tmp_path, digest, size = save_upload(file_storage, blob_store.staging)
+    try:
+        artifact = upload_processor.process(tmp_path, file_storage.mimetype, digest) if process else None
+        url = blob_store.put(tmp_path, digest, filename, file_storage.mimetype, size, expires=expires)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    logger.info(f"File uploaded: {filename} ({size} bytes, sha256 {digest[:12]})")
+    return url, filename, artifact
+
 def notify_task(user_id, task_id, description):
     """Send task notification via SocketIO."""
+    conn = db_pool.getconn('background')
     try:
-        conn = db_pool.getconn()
         with conn.cursor() as cur:
             cur.execute(
                 "DELETE FROM tasks WHERE id = %s AND user_id = %s RETURNING id",
@@ -83,11 +272,11 @@ def notify_task(user_id, task_id, description):
             )
             if cur.fetchone():
                 conn.commit()
-                socketio.emit('task_notification', {
+                realtime.emit(user_id, 'task_notification', {
                     'user_id': user_id,
                     'description': description,
                     'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M')
-                }, to=str(user_id))
+                })
                 logger.info(f"Task {task_id} notified and deleted for user_id: {user_id}")
     except Exception as e:
         logger.error(f"Failed to notify task {task_id}: {e}")
@@ -95,150 +284,122 @@ def notify_task(user_id, task_id, description):
         db_pool.putconn(conn)
 
 def schedule_tasks():
-    """Schedule all pending tasks from the database."""
+    """Create jobs for pending tasks that are missing from the shared job store."""
+    conn = db_pool.getconn('background')
     try:
-        conn = db_pool.getconn()
         with conn.cursor() as cur:
             cur.execute(
-                "SELECT id, user_id, description, scheduled_time FROM tasks WHERE scheduled_time > CURRENT_TIMESTAMP"
+                "SELECT t.id, t.user_id, t.description, t.scheduled_time FROM tasks t "
+                "WHERE t.scheduled_time > CURRENT_TIMESTAMP "
+                f"AND NOT EXISTS (SELECT 1 FROM {JOBS_TABLE} j WHERE j.id = 'task:' || t.id)"
             )
             tasks = cur.fetchall()
-            scheduler = BackgroundScheduler()
-            for task_id, user_id, description, scheduled_time in tasks:
-                scheduler.add_job(
-                    notify_task,
-                    'date',
-                    run_date=scheduled_time,
-                    args=[user_id, task_id, description]
-                )
-            scheduler.start()
-            logger.info("Scheduled pending tasks")
+        conn.commit()
+        for task_id, user_id, description, scheduled_time in tasks:
+            scheduler_service.schedule_task(task_id, scheduled_time, user_id, task_id, description)
+        logger.info(f"Scheduled {len(tasks)} pending tasks missing from the job store")
     except Exception as e:
         logger.error(f"Failed to schedule tasks: {e}")
     finally:
         db_pool.putconn(conn)
 
+scheduler_service.register('notify_task', notify_task)
+scheduler_service.register('clean_upload_folder', clean_upload_folder)
+
 def init_db():
-    conn = db_pool.getconn()
+    """Bring the schema up to date through the versioned migrations."""
+    conn = db_pool.getconn('migration')
     try:
+        version = migrate(conn)
         with conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id SERIAL PRIMARY KEY,
-                    username VARCHAR(50) UNIQUE NOT NULL,
-                    password BYTEA NOT NULL
-                );
-            """)
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS user_profiles (
-                    user_id INTEGER PRIMARY KEY REFERENCES users(id),
-                    avatar VARCHAR(255),
-                    bio TEXT
-                );
-            """)
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS conversations (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES users(id),
-                    user_message TEXT NOT NULL,
-                    ai_response TEXT NOT NULL,
-                    file_url VARCHAR(255),
-                    file_name VARCHAR(100),
-                    avatar VARCHAR(255),
-                    edited BOOLEAN DEFAULT FALSE,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS user_preferences (
-                    user_id INTEGER PRIMARY KEY REFERENCES users(id),
-                    model VARCHAR(50) DEFAULT 'gpt-3.5-turbo',
-                    tone VARCHAR(50) DEFAULT 'formal',
-                    language VARCHAR(10) DEFAULT 'auto'
-                );
-            """)
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS conversation_context (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES users(id),
-                    key VARCHAR(100) NOT NULL,
-                    value TEXT NOT NULL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS tasks (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES users(id),
-                    description TEXT NOT NULL,
-                    scheduled_time TIMESTAMP NOT NULL
-                );
-            """)
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS achievements (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES users(id),
-                    name VARCHAR(100) NOT NULL,
-                    description TEXT NOT NULL,
-                    achieved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
-            conn.commit()
-            logger.info("Database initialized successfully")
+            achievement_engine.backfill(cur)
+        conn.commit()
+        logger.info(f"Database initialized successfully (schema version {version})")
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}")
         raise
     finally:
         db_pool.putconn(conn)
 
-def extract_context(message):
-    context = {}
-    names = re.findall(r'\b[A-Z][a-z]*\b', message)
-    if names:
-        context['names'] = list(set(names))
-    dates = re.findall(r'\b\d{1,2}/\d{1,2}/\d{4}\b|\b(hoy|mañana|ayer)\b', message)
-    if dates:
-        context['dates'] = list(set([d[0] or d[1] for d in dates]))
-    return context
-
-def check_achievements(user_id):
-    conn = db_pool.getconn()
+def remember_exchange(user_id, model, message, ai_response):
+    """Update conversation memory off the response path."""
+    socketio.start_background_task(conversation_memory.append, user_id, model, message, ai_response)
+
+def sse_event(data, event=None):
+    """Format a payload as a Server-Sent Events frame."""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+def stream_chat(loader, model, messages, message, cache_fields, file_url, file_name, language, response_extra):
+    """Stream completion deltas over SSE and the user's Socket.IO room, then persist the result."""
+    user_id = loader.user_id
+    timer = loader.timer
+    chunks = []
+    completed = False
+    started = time.perf_counter()
     try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) FROM conversations WHERE user_id = %s", (user_id,))
-            message_count = cur.fetchone()[0]
-            achievements = []
-            if message_count >= 100 and not achievement_exists(user_id, "Cien Mensajes"):
-                cur.execute(
-                    "INSERT INTO achievements (user_id, name, description) VALUES (%s, %s, %s) RETURNING id",
-                    (user_id, "Cien Mensajes", "Enviados 100 mensajes")
-                )
-                achievements.append({"name": "Cien Mensajes", "description": "Enviados 100 mensajes"})
-            if message_count >= 10 and not achievement_exists(user_id, "Primeros Pasos"):
-                cur.execute(
-                    "INSERT INTO achievements (user_id, name, description) VALUES (%s, %s, %s) RETURNING id",
-                    (user_id, "Primeros Pasos", "Enviados 10 mensajes")
-                )
-                achievements.append({"name": "Primeros Pasos", "description": "Enviados 10 mensajes"})
-            conn.commit()
-            return achievements
+        stream, answered_by = llm.stream(model, messages, max_tokens=500, temperature=0.7)
     except Exception as e:
-        logger.error(f"Failed to check achievements: {e}")
-        return []
-    finally:
-        db_pool.putconn(conn)
+        logger.error(f"OpenAI API error: {e}")
+        yield sse_event({'error': f'Error en la API de OpenAI: {str(e)}'}, event='error')
+        return
 
-def achievement_exists(user_id, name):
-    conn = db_pool.getconn()
     try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT 1 FROM achievements WHERE user_id = %s AND name = %s", (user_id, name))
-            return cur.fetchone() is not None
+        for delta in stream:
+            if not chunks:
+                timer.record('ttft', time.perf_counter() - started)
+            chunks.append(delta)
+            realtime.emit(user_id, 'chat_delta', {'delta': delta})
+            yield sse_event({'delta': delta})
+        completed = True
+    except GeneratorExit:
+        logger.warning(f"Client disconnected during stream for user_id: {user_id}")
+        raise
     except Exception as e:
-        logger.error(f"Failed to check achievement existence: {e}")
-        return False
+        logger.error(f"OpenAI stream error: {e}")
+        yield sse_event({'error': 'Error al procesar el mensaje'}, event='error')
     finally:
-        db_pool.putconn(conn)
+        stream.close()
+        timer.record('llm', time.perf_counter() - started)
+        if not completed:
+            realtime.emit(user_id, 'chat_aborted', {})
+
+    if not completed:
+        return
+
+    ai_response = "".join(chunks)
+    response_data = {'response': ai_response, **response_extra}
+    message_id, achievements = None, []
+    try:
+        message_id, achievements = loader.save(message, ai_response, file_url, file_name, language)
+        remember_exchange(user_id, model, message, ai_response)
+        logger.info(f"Streamed chat response generated for user_id: {user_id} ({timer.summary()})")
+    except Exception as e:
+        logger.error(f"Failed to persist streamed response: {e}")
+
+    # Don't serve a fallback model's answer to later requests for the original model.
+    if cache_fields and answered_by == model:
+        response_cache.set(user_id, message, *cache_fields, response_data)
+    realtime.emit(user_id, 'chat_done', response_data)
+    yield sse_event({**response_data, 'message_id': message_id}, event='done')
+
+    if achievements:
+        realtime.emit(user_id, 'achievement', achievements)
+        logger.info(f"Achievements awarded for user_id: {user_id}")
+
+LANGUAGE_NAMES = {'es': 'Español', 'en': 'Inglés', 'fr': 'Francés'}
+QUICK_REPLIES = ["Cuéntame más", "Explica en detalle", "¿Puedes dar un ejemplo?"]
+
+def chat_messages(data, message, language):
+    """Model messages for one user message, given the data returned by ChatDataLoader.load()."""
+    target_lang = LANGUAGE_NAMES.get(language, 'Español')
+    context_str = context_store.render(data['context'])
+    prompt = f"Eres un asistente útil que responde en un tono {data['tone']} en {target_lang}. Contexto: {context_str}\nUsuario: {message}"
+    return [
+        {"role": "system", "content": "Eres un asistente útil que responde de manera clara y precisa."},
+        *data['history'],
+        {"role": "user", "content": prompt}
+    ]
 
 @app.route('/')
 def index():
@@ -251,23 +412,29 @@ def login():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
-        conn = db_pool.getconn()
+        login_throttle.check(request.remote_addr, username)
         try:
-            with conn.cursor() as cur:
+            with db_pool.connection() as conn, conn.cursor() as cur:
                 cur.execute("SELECT id, password FROM users WHERE username = %s", (username,))
                 user = cur.fetchone()
-                if user and bcrypt.checkpw(password.encode('utf-8'), user[1]):
-                    session['user_id'] = user[0]
-                    session['username'] = username
-                    logger.info(f"User {username} logged in")
-                    return redirect(url_for('index'))
-                flash('Usuario o contraseña incorrectos', 'error')
-                logger.warning(f"Failed login attempt for username: {username}")
+            # The connection is back in the pool before the password is checked.
+            ok, new_hash = password_hasher.verify(password, user[1]) if user else (False, None)
+            if new_hash:
+                with db_pool.connection() as conn, conn.cursor() as cur:
+                    cur.execute("UPDATE users SET password = %s WHERE id = %s", (new_hash, user[0]))
+                logger.info(f"Rehashed password for {username} at cost {password_hasher.rounds}")
+            if ok:
+                session['user_id'] = user[0]
+                session['username'] = username
+                logger.info(f"User {username} logged in")
+                return redirect(url_for('index'))
+            flash('Usuario o contraseña incorrectos', 'error')
+            logger.warning(f"Failed login attempt for username: {username}")
+        except (Rejected, PoolTimeout):
+            raise
         except Exception as e:
             logger.error(f"Login error: {e}")
             flash('Error al iniciar sesión', 'error')
-        finally:
-            db_pool.putconn(conn)
     return render_template('login.html')
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -279,7 +446,8 @@ def register():
             flash('La contraseña debe tener al menos 6 caracteres', 'error')
             logger.warning("Registration failed: Password too short")
             return render_template('register.html')
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        login_throttle.check(request.remote_addr)
+        hashed_password = password_hasher.hash(password)
         conn = db_pool.getconn()
         try:
             with conn.cursor() as cur:
@@ -313,38 +481,237 @@ def logout():
     logger.info(f"User {username} logged out")
     return redirect(url_for('login'))
 
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+def encode_history_cursor(timestamp, message_id):
+    return f"{timestamp.isoformat()}|{message_id}"
+
+def decode_history_cursor(cursor):
+    """Parse a '<iso timestamp>|<id>' keyset cursor."""
+    timestamp, message_id = cursor.rsplit('|', 1)
+    return datetime.datetime.fromisoformat(timestamp), int(message_id)
+
+def decode_sync_token(token):
+    """Parse a '<iso updated_at>|<id>' sync token; a bare timestamp means id 0."""
+    if '|' in token:
+        return decode_history_cursor(token)
+    return datetime.datetime.fromisoformat(token), 0
+
+def serialize_history_row(row):
+    return {
+        'id': row[0],
+        'user_message': row[1],
+        'ai_response': row[2],
+        'timestamp': row[3].strftime('%H:%M:%S'),
+        'date': row[3].date().isoformat(),
+        'edited': row[4],
+        'file_url': row[5],
+        'file_name': row[6],
+        'avatar': row[7]
+    }
+
 @app.route('/history', methods=['GET'])
 def history():
+    """Keyset-paginated chat history.
+
+    Without parameters returns the newest page. ``before=<cursor>`` walks back to
+    older pages and ``since=<sync_token>`` returns only rows created or edited
+    after the token. Sync tokens are (updated_at, id) pairs, so rows sharing one
+    updated_at across a page boundary are not skipped. Responses carry an ETag so unchanged pages answer 304.
+    """
     if 'user_id' not in session:
         logger.warning("Unauthorized access attempt to /history")
         return jsonify({'error': 'No autenticado'}), 401
+    try:
+        limit = min(int(request.args.get('limit', HISTORY_PAGE_SIZE)), HISTORY_MAX_PAGE_SIZE)
+        before = decode_history_cursor(request.args['before']) if request.args.get('before') else None
+        since = decode_sync_token(request.args['since']) if request.args.get('since') else None
+    except ValueError:
+        logger.warning("Invalid pagination parameters for /history")
+        return jsonify({'error': 'Parámetros inválidos'}), 400
+    if limit < 1:
+        return jsonify({'error': 'Parámetros inválidos'}), 400
+
+    columns = ("SELECT c.id, c.user_message, c.ai_response, c.timestamp, c.edited, c.file_url, c.file_name, "
+               "p.avatar, c.updated_at "
+               "FROM conversations c JOIN user_profiles p ON c.user_id = p.user_id ")
     conn = db_pool.getconn()
     try:
         with conn.cursor() as cur:
-            cur.execute(
-                "SELECT c.id, c.user_message, c.ai_response, c.timestamp, c.edited, c.file_url, c.file_name, p.avatar "
-                "FROM conversations c JOIN user_profiles p ON c.user_id = p.user_id "
-                "WHERE c.user_id = %s ORDER BY c.timestamp ASC",
-                (session['user_id'],)
-            )
-            messages = [{
-                'id': row[0],
-                'user_message': row[1],
-                'ai_response': row[2],
-                'timestamp': row[3].strftime('%H:%M:%S'),
-                'edited': row[4],
-                'file_url': row[5],
-                'file_name': row[6],
-                'avatar': row[7]
-            } for row in cur.fetchall()]
-            logger.info(f"Retrieved chat history for user_id: {session['user_id']}")
-            return jsonify(messages)
+            if since is not None:
+                cur.execute(
+                    columns + "WHERE c.user_id = %s AND (c.updated_at, c.id) > (%s, %s) "
+                    "ORDER BY c.updated_at ASC, c.id ASC LIMIT %s",
+                    (session['user_id'], since[0], since[1], limit + 1)
+                )
+                rows = cur.fetchall()
+            else:
+                if before is not None:
+                    cur.execute(
+                        columns + "WHERE c.user_id = %s AND (c.timestamp, c.id) < (%s, %s) "
+                        "ORDER BY c.timestamp DESC, c.id DESC LIMIT %s",
+                        (session['user_id'], before[0], before[1], limit + 1)
+                    )
+                else:
+                    cur.execute(
+                        columns + "WHERE c.user_id = %s ORDER BY c.timestamp DESC, c.id DESC LIMIT %s",
+                        (session['user_id'], limit + 1)
+                    )
+                rows = cur.fetchall()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+
+            payload = {'has_more': has_more}
+            if since is not None:
+                payload['messages'] = [serialize_history_row(row) for row in rows]
+                payload['sync_token'] = (encode_history_cursor(rows[-1][8], rows[-1][0]) if rows
+                                         else encode_history_cursor(*since))
+            else:
+                rows.reverse()
+                payload['messages'] = [serialize_history_row(row) for row in rows]
+                payload['next_cursor'] = encode_history_cursor(rows[0][3], rows[0][0]) if has_more else None
+                if before is None:
+                    cur.execute(
+                        "SELECT updated_at, id FROM conversations WHERE user_id = %s "
+                        "ORDER BY updated_at DESC, id DESC LIMIT 1",
+                        (session['user_id'],)
+                    )
+                    latest = cur.fetchone()
+                    payload['sync_token'] = encode_history_cursor(*latest) if latest else \
+                        encode_history_cursor(datetime.datetime.min, 0)
+            logger.info(f"Retrieved chat history page for user_id: {session['user_id']}")
+        response = jsonify(payload)
+        response.add_etag()
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
     except Exception as e:
         logger.error(f"Failed to retrieve history: {e}")
         return jsonify({'error': 'Error al recuperar el historial'}), 500
     finally:
         db_pool.putconn(conn)
 
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
+SEARCH_MAX_OFFSET = 1000
+
+@app.route('/search', methods=['GET'])
+def search():
+    """Ranked full-text search over the user's messages and answers.
+
+    ``q`` accepts web-search syntax (quotes, ``or``, ``-word``) and is stemmed in
+    each message's own language. Pages are addressed with ``offset``; highlights
+    are HTML-escaped with matches in <mark>.
+    """
+    if 'user_id' not in session:
+        logger.warning("Unauthorized access attempt to /search")
+        return jsonify({'error': 'No autenticado'}), 401
+    query = request.args.get('q', '').strip()
+    try:
+        limit = min(int(request.args.get('limit', SEARCH_PAGE_SIZE)), SEARCH_MAX_PAGE_SIZE)
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'error': 'Parámetros inválidos'}), 400
+    if not query or limit < 1 or not 0 <= offset <= SEARCH_MAX_OFFSET:
+        logger.warning("Invalid search parameters")
+        return jsonify({'error': 'Parámetros inválidos'}), 400
+
+    conn = db_pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(SEARCH_SQL, {
+                'user_id': session['user_id'], 'query': query, 'limit': limit + 1, 'offset': offset, 'options': HIGHLIGHT_OPTIONS
+            })
+            rows = cur.fetchall()
+        conn.commit()
+        has_more = len(rows) > limit
+        results = [{
+            'id': row[0],
+            'timestamp': row[1].strftime('%H:%M:%S'),
+            'date': row[1].date().isoformat(),
+            'rank': row[2],
+            'user_message': highlight(row[3]),
+            'ai_response': highlight(row[4])
+        } for row in rows[:limit]]
+        logger.info(f"Search returned {len(results)} results for user_id: {session['user_id']}")
+        return jsonify({
+            'results': results,
+            'has_more': has_more,
+            'next_offset': offset + limit if has_more else None
+        })
+    except Exception as e:
+        logger.error(f"Failed to search history: {e}")
+        return jsonify({'error': 'Error al buscar en el historial'}), 500
+    finally:
+        db_pool.putconn(conn)
+
+# Each export holds a pool connection for as long as the client keeps reading.
+export_slots = threading.BoundedSemaphore(int(os.getenv("EXPORT_CONCURRENCY", 2)))
+
+def stream_export(user_id, export_format, tables):
+    with db_pool.connection('bulk') as conn:
+        if export_format == 'parquet':
+            yield from iter_parquet(conn, user_id, tables[0])
+        else:
+            yield from iter_ndjson(conn, user_id, tables)
+    logger.info(f"Exported {','.join(tables)} as {export_format} for user_id: {user_id}")
+
+@app.route('/export', methods=['GET'])
+def export_history():
+    """Stream the user's conversations, tasks and achievements.
+
+    ``format=ndjson`` (default) exports every table, or those named in ``table``,
+    one JSON object per line. ``format=parquet`` exports a single ``table``.
+    """
+    if 'user_id' not in session:
+        logger.warning("Unauthorized access attempt to /export")
+        return jsonify({'error': 'No autenticado'}), 401
+    export_format = request.args.get('format', 'ndjson')
+    tables = request.args.getlist('table') or list(EXPORT_TABLES)
+    if export_format not in FORMATS or any(table not in EXPORT_TABLES for table in tables) or \
+            (export_format == 'parquet' and len(tables) != 1):
+        logger.warning(f"Invalid export parameters: format={export_format}, tables={tables}")
+        return jsonify({'error': 'Parámetros inválidos'}), 400
+    if not export_slots.acquire(blocking=False):
+        raise Rejected('export', 5)
+
+    if export_format == 'parquet':
+        mimetype, filename = 'application/vnd.apache.parquet', f"{tables[0]}.parquet"
+    else:
+        mimetype, filename = 'application/x-ndjson', "history.ndjson"
+    response = Response(
+        stream_export(session['user_id'], export_format, tables),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"', 'X-Accel-Buffering': 'no'}
+    )
+    response.call_on_close(export_slots.release)
+    return response
+
+@app.route('/import', methods=['POST'])
+def import_history():
+    """Load an NDJSON export (the ``file`` field, or the raw body) into the user's history."""
+    if 'user_id' not in session:
+        logger.warning("Unauthorized access attempt to /import")
+        return jsonify({'error': 'No autenticado'}), 401
+    upload = request.files.get('file')
+    user_id = session['user_id']
+    try:
+        with db_pool.connection('bulk') as conn:
+            imported = import_records(conn, user_id, parse_ndjson(upload.stream if upload else request.stream),
+                                      achievement_engine)
+    except (ValueError, psycopg2.DataError) as e:
+        logger.warning(f"Invalid import for user_id {user_id}: {e}")
+        return jsonify({'error': 'Archivo de importación inválido'}), 400
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to import history: {e}")
+        return jsonify({'error': 'Error al importar el historial'}), 500
+    conversation_memory.forget(user_id)
+    if imported['tasks']:
+        schedule_tasks()
+    return jsonify({'success': 'Historial importado', 'imported': imported})
+
 @app.route('/preferences', methods=['GET', 'POST'])
 def preferences():
     if 'user_id' not in session:
@@ -366,11 +733,8 @@ def preferences():
 
                 avatar_url = None
                 if profile_picture and allowed_file(profile_picture.filename):
-                    filename = secure_filename(profile_picture.filename)
-                    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
                     try:
-                        profile_picture.save(filepath)
-                        avatar_url = f"/static/uploads/{filename}"
+                        avatar_url, filename, _ = store_upload(profile_picture, expires=False)
                         logger.info(f"Profile picture uploaded: {filename}")
                     except Exception as e:
                         logger.error(f"Failed to save profile picture: {e}")
@@ -385,30 +749,19 @@ def preferences():
                 cur.execute(
                     "INSERT INTO user_profiles (user_id, avatar, bio) "
                     "VALUES (%s, %s, %s) "
-                    "ON CONFLICT (user_id) DO UPDATE SET avatar = COALESCE(EXCLUDED.avatar, user_profiles.avatar), bio = EXCLUDED.bio",
+                    "ON CONFLICT (user_id) DO UPDATE SET avatar = COALESCE(EXCLUDED.avatar, user_profiles.avatar), bio = EXCLUDED.bio "
+                    "RETURNING avatar, bio",
                     (session['user_id'], avatar_url, bio)
                 )
+                avatar, bio = cur.fetchone()
                 conn.commit()
+                settings_cache.put(session['user_id'], {
+                    'model': model, 'tone': tone, 'language': language or 'auto', 'avatar': avatar, 'bio': bio
+                })
                 logger.info(f"Preferences updated for user_id: {session['user_id']}")
                 return jsonify({'success': 'Preferencias guardadas', 'avatar': avatar_url})
             else:
-                cur.execute(
-                    "SELECT model, tone, language FROM user_preferences WHERE user_id = %s",
-                    (session['user_id'],)
-                )
-                prefs = cur.fetchone()
-                cur.execute(
-                    "SELECT avatar, bio FROM user_profiles WHERE user_id = %s",
-                    (session['user_id'],)
-                )
-                profile = cur.fetchone()
-                return jsonify({
-                    'model': prefs[0] if prefs else 'gpt-3.5-turbo',
-                    'tone': prefs[1] if prefs else 'formal',
-                    'language': prefs[2] if prefs else 'auto',
-                    'avatar': profile[0] if profile else None,
-                    'bio': profile[1] if profile else ''
-                })
+                return jsonify(settings_cache.get(session['user_id'], lambda: fetch_settings(cur, session['user_id'])))
     except Exception as e:
         logger.error(f"Failed to handle preferences: {e}")
         return jsonify({'error': 'Error al procesar preferencias'}), 500
@@ -420,28 +773,28 @@ def chat():
     if 'user_id' not in session:
         logger.warning("Unauthorized access attempt to /chat")
         return jsonify({'error': 'No autenticado'}), 401
+    admission.check_user(session['user_id'])
 
     message = request.form.get('message', '')
     file = request.files.get('file')
+    stream_requested = request.form.get('stream') in ('1', 'true') or \
+        'text/event-stream' in request.headers.get('Accept', '')
     file_url = None
     file_name = None
     upload_warning = "Nota: Los archivos subidos son temporales y pueden eliminarse al reiniciar el servidor en el plan gratuito."
 
+    timer = telemetry.stage_timer() if telemetry else StageTimer()
+
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         try:
-            file.save(filepath)
-            file_url = f"/static/uploads/{filename}"
+            with timer.stage('upload'):
+                file_url, filename, artifact = store_upload(file, process=True)
             file_name = filename
-            logger.info(f"File uploaded: {filename}")
             if file.mimetype.startswith('text'):
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    message += f"\nArchivo: {f.read()}"
+                message += f"\nArchivo: {artifact['text']}"
             elif file.mimetype.startswith('image'):
-                with open(filepath, 'rb') as f:
-                    encoded_image = base64.b64encode(f.read()).decode('utf-8')
-                    message += f"\n[Imagen: {filename}]"
+                image_url = artifact['data_url']
+                message += f"\n[Imagen: {filename}]"
         except Exception as e:
             logger.error(f"Failed to save file: {e}")
             return jsonify({'error': 'Error al subir el archivo'}), 500
@@ -450,117 +803,252 @@ def chat():
         logger.warning("Empty message submitted")
         return jsonify({'error': 'Mensaje vacío'}), 400
 
-    cache_key = f"chat:{session['user_id']}:{hash(message)}"
-    cached_response = redis_client.get(cache_key)
-    if cached_response:
-        logger.info(f"Cache hit for user_id: {session['user_id']}, key: {cache_key}")
-        return json.loads(cached_response)
-
-    conn = db_pool.getconn()
+    user_id = session['user_id']
+    loader = ChatDataLoader(db_pool, user_id, achievement_engine, timer, context_store, settings_cache,
+                            conversation_writer)
     try:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT model, tone, language FROM user_preferences WHERE user_id = %s",
-                (session['user_id'],)
-            )
-            prefs = cur.fetchone()
-            model = prefs[0] if prefs else 'gpt-3.5-turbo'
-            tone = prefs[1] if prefs else 'formal'
-            language = prefs[2] if prefs else 'auto'
+        # Never hold a pool connection across the model call: with cooperative workers
+        # hundreds of chats can be waiting on OpenAI while the pool has ten connections.
+        data = loader.load(extract_context(message), conversation_memory)
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        logger.error(f"Chat processing error: {e}")
+        return jsonify({'error': 'Error al procesar el mensaje'}), 500
+    model, tone, language = data['model'], data['tone'], data['language']
 
-            detected_lang = detect(message) if message.strip() and language == 'auto' else language
-            lang_map = {'es': 'Español', 'en': 'Inglés', 'fr': 'Francés'}
-            target_lang = lang_map.get(detected_lang, 'Español')
+    with timer.stage('detect'):
+        detected_lang = language_detector.detect(message, user_id) if message.strip() and language == 'auto' else language
 
-            cur.execute(
-                "SELECT user_message, ai_response FROM conversations WHERE user_id = %s ORDER BY timestamp DESC LIMIT 5",
-                (session['user_id'],)
-            )
-            history = [{'role': 'user', 'content': row[0]} if i % 2 == 0 else {'role': 'assistant', 'content': row[1]} for i, row in enumerate(cur.fetchall())]
+    # Image prompts only carry the file name, so they are never served from cache.
+    cache_fields = None if file and file.mimetype.startswith('image') else (model, tone, detected_lang)
+    if cache_fields:
+        with timer.stage('cache'):
+            cached_response = response_cache.get(user_id, message, *cache_fields)
+        if cached_response:
+            logger.info(f"Cache hit for user_id: {user_id} ({timer.summary()})")
+            response = jsonify(cached_response)
+            response.headers['Server-Timing'] = timer.server_timing()
+            return response
 
-            context = extract_context(message)
-            for key, value in context.items():
-                cur.execute(
-                    "INSERT INTO conversation_context (user_id, key, value) VALUES (%s, %s, %s)",
-                    (session['user_id'], key, json.dumps(value))
-                )
+    messages = chat_messages(data, message, detected_lang)
 
-            cur.execute(
-                "SELECT key, value FROM conversation_context WHERE user_id = %s ORDER BY timestamp DESC LIMIT 10",
-                (session['user_id'],)
-            )
-            context_data = {row[0]: json.loads(row[1]) for row in cur.fetchall()}
-            context_str = "\n".join(f"{k}: {v}" for k, v in context_data.items())
-
-            prompt = f"Eres un asistente útil que responde en un tono {tone} en {target_lang}. Contexto: {context_str}\nUsuario: {message}"
-            messages = [
-                {"role": "system", "content": "Eres un asistente útil que responde de manera clara y precisa."},
-                *history,
-                {"role": "user", "content": prompt}
+    if file and file.mimetype.startswith('image'):
+        messages.append({
+            "role": "user",
+            "content": [
+                {"type": "text", "text": message},
+                {"type": "image_url", "image_url": {"url": image_url}}
             ]
+        })
 
-            if file and file.mimetype.startswith('image'):
-                messages.append({
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": message},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}}
-                    ]
-                })
+    response_extra = {
+        'quick_replies': QUICK_REPLIES,
+        'upload_warning': upload_warning if file else None
+    }
 
-            try:
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    max_tokens=500,
-                    temperature=0.7
-                )
-                ai_response = response.choices[0].message.content
-            except Exception as e:
-                logger.error(f"OpenAI API error: {e}")
-                return jsonify({'error': f'Error en la API de OpenAI: {str(e)}'}), 500
+    # Cheap requests jump ahead of gpt-4o and uploads when the model queue backs up.
+    lane = LANE_FAST if model == 'gpt-3.5-turbo' and not file else LANE_STANDARD
+    with timer.stage('queue'):
+        ticket = admission.admit(lane, model)
 
-            cur.execute(
-                "SELECT avatar FROM user_profiles WHERE user_id = %s",
-                (session['user_id'],)
-            )
-            avatar = cur.fetchone()[0]
+    if stream_requested:
+        generator = stream_chat(loader, model, messages, message,
+                                cache_fields, file_url, file_name, detected_lang, response_extra)
+        response = Response(
+            stream_with_context(generator),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+        response.call_on_close(ticket.release)
+        return response
 
-            cur.execute(
-                "INSERT INTO conversations (user_id, user_message, ai_response, file_url, file_name, avatar) "
-                "VALUES (%s, %s, %s, %s, %s, %s) RETURNING id",
-                (session['user_id'], message, ai_response, file_url, file_name, avatar)
-            )
-            conn.commit()
-
-            quick_replies = ["Cuéntame más", "Explica en detalle", "¿Puedes dar un ejemplo?"]
-            response_data = {
-                'response': ai_response,
-                'quick_replies': quick_replies,
-                'upload_warning': upload_warning if file else None
-            }
-            redis_client.setex(cache_key, 3600, json.dumps(response_data))
-            logger.info(f"Chat response generated for user_id: {session['user_id']}")
-
-            achievements = check_achievements(session['user_id'])
-            if achievements:
-                socketio.emit('achievement', achievements, to=str(session['user_id']))
-                logger.info(f"Achievements awarded for user_id: {session['user_id']}")
-
-            return jsonify(response_data)
+    try:
+        with ticket, timer.stage('llm'):
+            ai_response, answered_by = llm.complete(model, messages, max_tokens=500, temperature=0.7)
+    except Exception as e:
+        logger.error(f"OpenAI API error: {e}")
+        return jsonify({'error': f'Error en la API de OpenAI: {str(e)}'}), 500
+
+    try:
+        message_id, achievements = loader.save(message, ai_response, file_url, file_name, detected_lang)
+    except PoolTimeout:
+        raise
     except Exception as e:
         logger.error(f"Chat processing error: {e}")
         return jsonify({'error': 'Error al procesar el mensaje'}), 500
-    finally:
-        db_pool.putconn(conn)
+    remember_exchange(user_id, model, message, ai_response)
 
-@app.route('/static/uploads/<filename>')
-def uploaded_file(filename):
+    response_data = {'response': ai_response, **response_extra}
+    if cache_fields and answered_by == model:
+        response_cache.set(user_id, message, *cache_fields, response_data)
+    logger.info(f"Chat response generated for user_id: {user_id} ({timer.summary()})")
+
+    if achievements:
+        realtime.emit(user_id, 'achievement', achievements)
+        logger.info(f"Achievements awarded for user_id: {user_id}")
+
+    response = jsonify({**response_data, 'message_id': message_id})
+    response.headers['Server-Timing'] = timer.server_timing()
+    return response
+
+CHAT_BATCH_MAX = int(os.getenv("CHAT_BATCH_MAX", 50))
+
+def run_chat_batch(user_id, prompts):
+    """Answer a batch of prompts, yielding one result dict per prompt as it completes.
+
+    Preferences, context and history are loaded once for the whole batch. Cached
+    answers are returned without a model call; new answers are cached and
+    written with a single bulk insert before the final {'done': True} result.
+    If the caller stops early, the model calls not yet started are cancelled
+    and the answers already received are still saved.
+    """
+    timer = telemetry.stage_timer() if telemetry else StageTimer()
+    loader = ChatDataLoader(db_pool, user_id, achievement_engine, timer, context_store, settings_cache)
+    data = loader.load(extract_context("\n".join(prompts)), conversation_memory)
+    model, tone, language = data['model'], data['tone'], data['language']
+
+    languages, jobs, replies = [], [], {}
+    with timer.stage('detect'):
+        for prompt in prompts:
+            languages.append(language_detector.detect(prompt, user_id) if language == 'auto' else language)
+    with timer.stage('cache'):
+        for index, prompt in enumerate(prompts):
+            cached = response_cache.get(user_id, prompt, model, tone, languages[index])
+            if cached:
+                yield {'index': index, 'response': cached['response'], 'cached': True}
+            else:
+                jobs.append((index, chat_messages(data, prompt, languages[index])))
+
+    def save():
+        order = sorted(replies)
+        message_ids, achievements = loader.save_many([(prompts[i], replies[i], languages[i]) for i in order])
+        if achievements:
+            realtime.emit(user_id, 'achievement', achievements)
+        return order, message_ids
+
+    failed = 0
+    results = chat_batch.run(model, jobs)
     try:
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        with timer.stage('llm'):
+            for index, reply, answered_by, error in results:
+                if error:
+                    failed += 1
+                    yield {'index': index, 'error': error}
+                    continue
+                replies[index] = reply
+                if answered_by == model:
+                    # Same payload as /chat, so a pre-warmed answer is served there as is.
+                    response_cache.set(user_id, prompts[index], model, tone, languages[index],
+                                       {'response': reply, 'quick_replies': QUICK_REPLIES, 'upload_warning': None})
+                yield {'index': index, 'response': reply, 'model': answered_by}
+    except GeneratorExit:
+        results.close()
+        try:
+            save()
+            logger.warning(f"Chat batch for user_id: {user_id} stopped early; saved {len(replies)} of {len(prompts)}")
+        except Exception as e:
+            logger.error(f"Failed to save stopped chat batch for user_id: {user_id}: {e}")
+        raise
+
+    order, message_ids = save()
+    logger.info(f"Chat batch of {len(prompts)} prompts for user_id: {user_id} ({timer.summary()})")
+    yield {'done': True, 'completed': len(order), 'failed': failed,
+           'message_ids': dict(zip(order, message_ids or []))}
+
+def chat_batch_job(user_id, batch_id, prompts):
+    """Scheduler job: run a batch and deliver each result to the user's Socket.IO room."""
+    try:
+        for result in run_chat_batch(user_id, prompts):
+            realtime.emit(user_id, 'chat_batch_result', {'batch_id': batch_id, **result})
     except Exception as e:
-        logger.error(f"Failed to serve file {filename}: {e}")
+        logger.error(f"Chat batch {batch_id} failed: {e}")
+        realtime.emit(user_id, 'chat_batch_result', {'batch_id': batch_id, 'done': True, 'error': str(e)})
+
+scheduler_service.register('chat_batch', chat_batch_job)
+
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch_endpoint():
+    """Answer up to CHAT_BATCH_MAX prompts in one request.
+
+    Body: {"prompts": [...], "background": false}. Results stream back as NDJSON,
+    one line per prompt in completion order with its ``index``, then a final
+    line with ``done``. With ``background`` the batch runs as a scheduler job
+    and results are emitted as 'chat_batch_result' Socket.IO events.
+    """
+    if 'user_id' not in session:
+        logger.warning("Unauthorized access attempt to /chat/batch")
+        return jsonify({'error': 'No autenticado'}), 401
+    body = request.get_json(silent=True) or {}
+    prompts = body.get('prompts')
+    if not isinstance(prompts, list) or not 0 < len(prompts) <= CHAT_BATCH_MAX or \
+            not all(isinstance(prompt, str) and prompt.strip() for prompt in prompts):
+        logger.warning("Invalid chat batch submitted")
+        return jsonify({'error': 'Datos inválidos'}), 400
+    user_id = session['user_id']
+    admission.check_batch(user_id, len(prompts))
+
+    if body.get('background'):
+        batch_id = uuid.uuid4().hex
+        scheduler_service.schedule_now('chat_batch', f"batch:{batch_id}", user_id, batch_id, prompts)
+        logger.info(f"Chat batch {batch_id} of {len(prompts)} prompts queued for user_id: {user_id}")
+        return jsonify({'batch_id': batch_id}), 202
+
+    def generate():
+        results = run_chat_batch(user_id, prompts)
+        try:
+            for result in results:
+                yield json.dumps(result) + "\n"
+        except Exception as e:
+            logger.error(f"Chat batch error: {e}")
+            yield json.dumps({'done': True, 'error': 'Error al procesar el lote'}) + "\n"
+        finally:
+            # On disconnect, stop the batch now rather than whenever it is garbage collected.
+            results.close()
+
+    return Response(generate(), mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
+
+@app.errorhandler(Rejected)
+def handle_rejected(error):
+    response = jsonify({'error': 'Demasiadas solicitudes, inténtalo de nuevo en unos segundos'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+@app.errorhandler(PoolTimeout)
+def handle_pool_timeout(error):
+    logger.error(f"Database pool exhausted: {error} ({db_pool.stats()})")
+    response = jsonify({'error': 'Servicio ocupado, inténtalo de nuevo en unos segundos'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+@app.route('/static/uploads/<filename>')
+def uploaded_file(filename):
+    match = DIGEST_PATTERN.match(filename)
+    if not match:
+        # Uploads stored before the content-addressed store
+        try:
+            return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        except Exception as e:
+            logger.error(f"Failed to serve file {filename}: {e}")
+            return jsonify({'error': 'Archivo no encontrado'}), 404
+
+    digest = match.group(1)
+    metadata = blob_store.metadata(digest)
+    if not metadata and not blob_backend.exists(digest):
+        logger.warning(f"Blob not found: {filename}")
         return jsonify({'error': 'Archivo no encontrado'}), 404
+    path = blob_backend.path(digest)
+    if path is None:
+        return redirect(blob_backend.url(digest))
+    mimetype = metadata.get('mimetype') if metadata else mimetypes.guess_type(filename)[0]
+    # Content-addressed, so the digest is a strong ETag and the response never changes.
+    # conditional=True adds Range/If-None-Match handling and lets the server use sendfile.
+    response = send_file(path, mimetype=mimetype or 'application/octet-stream', conditional=True,
+                         etag=digest, max_age=31536000)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
 
 @app.route('/edit_message', methods=['POST'])
 def edit_message():
@@ -577,12 +1065,13 @@ def edit_message():
     try:
         with conn.cursor() as cur:
             cur.execute(
-                "UPDATE conversations SET user_message = %s, edited = TRUE "
+                "UPDATE conversations SET user_message = %s, edited = TRUE, updated_at = CURRENT_TIMESTAMP "
                 "WHERE id = %s AND user_id = %s RETURNING id",
                 (new_message, message_id, session['user_id'])
             )
             if cur.fetchone():
                 conn.commit()
+                conversation_memory.forget(session['user_id'])
                 logger.info(f"Message {message_id} edited for user_id: {session['user_id']}")
                 return jsonify({'success': 'Mensaje editado'})
             logger.warning(f"Message {message_id} not found or unauthorized for user_id: {session['user_id']}")
@@ -612,6 +1101,7 @@ def delete_message():
             )
             if cur.fetchone():
                 conn.commit()
+                conversation_memory.forget(session['user_id'])
                 logger.info(f"Message {message_id} deleted for user_id: {session['user_id']}")
                 return jsonify({'success': 'Mensaje eliminado'})
             logger.warning(f"Message {message_id} not found or unauthorized for user_id: {session['user_id']}")
@@ -650,14 +1140,7 @@ def tasks():
                 )
                 task_id = cur.fetchone()[0]
                 conn.commit()
-                scheduler = BackgroundScheduler()
-                scheduler.add_job(
-                    notify_task,
-                    'date',
-                    run_date=scheduled_time,
-                    args=[session['user_id'], task_id, description]
-                )
-                scheduler.start()
+                scheduler_service.schedule_task(task_id, scheduled_time, session['user_id'], task_id, description)
                 logger.info(f"Task {task_id} scheduled for user_id: {session['user_id']}")
                 return jsonify({'success': 'Tarea programada'})
             else:
@@ -697,6 +1180,7 @@ def delete_task():
             )
             if cur.fetchone():
                 conn.commit()
+                scheduler_service.remove_task(task_id)
                 logger.info(f"Task {task_id} deleted for user_id: {session['user_id']}")
                 return jsonify({'success': 'Tarea eliminada'})
             logger.warning(f"Task {task_id} not found or unauthorized for user_id: {session['user_id']}")
@@ -734,16 +1218,72 @@ def achievements():
 
 @socketio.on('connect')
 def handle_connect():
-    if 'user_id' in session:
-        emit('user_connected', {'user_id': session['user_id'], 'username': session['username']}, broadcast=True)
-        logger.info(f"WebSocket connected for user_id: {session['user_id']}")
+    if 'user_id' not in session:
+        return False
+    # Only this user's sockets get their events; the greeting goes to the new socket alone.
+    realtime.join(session['user_id'])
+    emit('user_connected', {'user_id': session['user_id'], 'username': session['username']})
+    logger.info(f"WebSocket connected for user_id: {session['user_id']}")
 
-if __name__ == '__main__':
-    init_db()
-    # Schedule cleanup of upload folder every 24 hours
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(clean_upload_folder, 'interval', hours=24)
-    scheduler.start()
+STARTUP_ATTEMPTS = int(os.getenv("STARTUP_ATTEMPTS", 8))
+startup = Warmup()
+
+def warmup():
+    """Bring dependencies up in order and preload everything the first request would otherwise pay for."""
+    startup.run([
+        ('redis', lambda: retry(redis_client.ping, "Redis connection", attempts=STARTUP_ATTEMPTS)),
+        ('database', lambda: retry(db_pool.prime, "Database connection", attempts=STARTUP_ATTEMPTS)),
+        ('migrations', init_db),
+        ('language_profiles', language_detector.warmup),
+        ('llm_client', llm_backend.warmup),
+        ('scheduler', start_scheduler),
+    ])
+
+def start_scheduler():
+    # One scheduler per process; only the leader fires jobs from the shared store
+    scheduler_service.start()
+    # Purge expired uploads every hour (cost is proportional to what expired)
+    scheduler_service.schedule_interval('clean_upload_folder', hours=1)
     # Schedule tasks at startup
     schedule_tasks()
-    socketio.run(app, host='0.0.0.0', port=int(os.getenv("PORT", 5000)))
\ No newline at end of file
+
+_app_created = False
+
+def create_app(block=False):
+    """Start this process's background services and warmup; return the WSGI app.
+
+    Importing this module opens no connections. The first call starts the
+    settings listener, the write-behind writer and warmup(), in the background
+    unless block is set: the process answers /healthz at once and /readyz once
+    warmup has finished. Later calls just return the app.
+    """
+    global _app_created
+    if _app_created:
+        return app
+    _app_created = True
+    # Fork the hashing workers before this process starts any threads of its own
+    password_hasher.warmup()
+    # Local settings copies are only served while subscribed to invalidations
+    settings_cache.start()
+    if conversation_writer:
+        conversation_writer.start()
+    if block:
+        warmup()
+    else:
+        socketio.start_background_task(warmup)
+    return app
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: warmup finished, so dependencies are reachable and caches are primed."""
+    status = startup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+if __name__ == '__main__':
+    create_app()
+    socketio.run(app, host='0.0.0.0', port=int(os.getenv("PORT", 5000)))
@@ -0,0 +1,324 @@
+"""Bulk export and import of a user's conversations, tasks and achievements.
+
+Exports read through server-side (named) cursors and are produced as generators,
+so memory stays constant however long the history is. Imports feed COPY FROM
+STDIN from a lazily parsed NDJSON stream.
+
+    DATABASE_URL=... python archive.py export alice -o alice.ndjson
+    DATABASE_URL=... python archive.py export alice --format parquet --table conversations -o alice.parquet
+    DATABASE_URL=... python archive.py import alice alice.ndjson
+"""
+import argparse
+import datetime
+import itertools
+import json
+import logging
+import os
+import sys
+from collections import namedtuple
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+# Rows per FETCH from the server-side cursor; one output chunk per batch.
+EXPORT_ITERSIZE = 2000
+
+ExportTable = namedtuple('ExportTable', ['name', 'columns', 'order_by'])
+
+# (column, kind) pairs. The first column is the row id, which is exported for
+# reference but never imported: rows get fresh ids in the target database.
+# updated_at isn't imported either: imported rows are new to delta sync, so they
+# take the import time and clients holding an earlier sync token receive them.
+NOT_IMPORTED = ('id', 'updated_at')
+
+EXPORT_TABLES = {
+    'conversations': ExportTable('conversations', [
+        ('id', 'int'), ('user_message', 'text'), ('ai_response', 'text'), ('file_url', 'text'),
+        ('file_name', 'text'), ('avatar', 'text'), ('edited', 'bool'), ('timestamp', 'timestamp'),
+        ('updated_at', 'timestamp'), ('language', 'text'),
+    ], 'timestamp, id'),
+    'tasks': ExportTable('tasks', [
+        ('id', 'int'), ('description', 'text'), ('scheduled_time', 'timestamp'),
+    ], 'scheduled_time, id'),
+    'achievements': ExportTable('achievements', [
+        ('id', 'int'), ('name', 'text'), ('description', 'text'), ('achieved_at', 'timestamp'),
+    ], 'achieved_at, id'),
+}
+
+FORMATS = ('ndjson', 'parquet')
+
+
+def fetch_batches(conn, user_id, table, itersize=EXPORT_ITERSIZE):
+    """Yield lists of up to itersize rows of one table, read through a named cursor.
+
+    A named cursor lives inside the connection's transaction, so the caller must
+    keep the connection checked out until the generator is exhausted or closed.
+    """
+    spec = EXPORT_TABLES[table]
+    columns = ", ".join(f'"{name}"' for name, _ in spec.columns)
+    with conn.cursor(name=f"export_{table}") as cur:
+        cur.itersize = itersize
+        cur.execute(
+            f"SELECT {columns} FROM {spec.name} WHERE user_id = %s ORDER BY {spec.order_by}",
+            (user_id,)
+        )
+        while True:
+            rows = cur.fetchmany(itersize)
+            if not rows:
+                return
+            yield rows
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime.datetime) else value
+
+
+def iter_ndjson(conn, user_id, tables=None, itersize=EXPORT_ITERSIZE):
+    """Yield NDJSON chunks (bytes), one per fetched batch, tables one after another.
+
+    Every line carries a "table" field so the stream can be imported as is.
+    """
+    for table in tables or EXPORT_TABLES:
+        names = [name for name, _ in EXPORT_TABLES[table].columns]
+        for rows in fetch_batches(conn, user_id, table, itersize):
+            lines = [
+                json.dumps({'table': table, **{name: _json_value(value) for name, value in zip(names, row)}},
+                           ensure_ascii=False)
+                for row in rows
+            ]
+            yield ("\n".join(lines) + "\n").encode('utf-8')
+
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever was written since the last drain."""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def iter_parquet(conn, user_id, table, itersize=EXPORT_ITERSIZE):
+    """Yield one table as a Parquet file in chunks (bytes), one row group per fetched batch."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_types = {'int': pa.int64(), 'text': pa.string(), 'bool': pa.bool_(), 'timestamp': pa.timestamp('us')}
+    schema = pa.schema([(name, arrow_types[kind]) for name, kind in EXPORT_TABLES[table].columns])
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression='zstd') as writer:
+        for rows in fetch_batches(conn, user_id, table, itersize):
+            columns = zip(*rows)
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+            ))
+            yield sink.drain()
+    # Closing the writer appends the footer.
+    yield sink.drain()
+
+
+def _copy_value(value, kind):
+    """Encode one value for COPY's text format."""
+    if value is None:
+        return "\\N"
+    if kind == 'bool':
+        return 't' if value else 'f'
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+class _CopyReader:
+    """File-like adapter that lets copy_expert pull COPY lines from a generator.
+
+    psycopg2 reports an exception raised by read() as QueryCanceled; the original
+    is kept in `error` so the caller can re-raise it.
+    """
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._buffer = b""
+        self.rows = 0
+        self.error = None
+
+    def read(self, size=-1):
+        chunks, length = [self._buffer], len(self._buffer)
+        while size < 0 or length < size:
+            try:
+                line = next(self._lines, None)
+            except Exception as e:
+                self.error = e
+                raise
+            if line is None:
+                break
+            encoded = line.encode('utf-8')
+            chunks.append(encoded)
+            length += len(encoded)
+            self.rows += 1
+        data = b"".join(chunks)
+        if size < 0:
+            self._buffer = b""
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def parse_ndjson(stream):
+    """Lazily decode an NDJSON byte or text stream into records."""
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON on line {number}: {e}") from e
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {number} is not a JSON object")
+        if record.get('table') not in EXPORT_TABLES:
+            raise ValueError(f"Unknown table on line {number}: {record.get('table')!r}")
+        yield record
+
+
+def _copy(cur, statement, reader):
+    try:
+        cur.copy_expert(statement, reader)
+    except psycopg2.Error:
+        if reader.error is not None:
+            raise reader.error from None
+        raise
+
+
+def _copy_records(cur, user_id, table, records):
+    """COPY one run of records into table (through a staging table for achievements)."""
+    columns = [(name, kind) for name, kind in EXPORT_TABLES[table].columns if name not in NOT_IMPORTED]
+    names = ", ".join(['user_id'] + [f'"{name}"' for name, _ in columns])
+    lines = (
+        "\t".join([str(user_id)] + [_copy_value(record.get(name), kind) for name, kind in columns]) + "\n"
+        for record in records
+    )
+    reader = _CopyReader(lines)
+    if table != 'achievements':
+        _copy(cur, f"COPY {table} ({names}) FROM STDIN", reader)
+        return reader.rows
+    # COPY can't skip duplicates, and (user_id, name) is unique.
+    cur.execute(f"CREATE TEMP TABLE import_achievements ON COMMIT DROP AS "
+                f"SELECT {names} FROM achievements WITH NO DATA")
+    _copy(cur, f"COPY import_achievements ({names}) FROM STDIN", reader)
+    cur.execute(f"INSERT INTO achievements ({names}) SELECT {names} FROM import_achievements "
+                f"ON CONFLICT (user_id, name) DO NOTHING")
+    inserted = cur.rowcount
+    cur.execute("DROP TABLE import_achievements")
+    return inserted
+
+
+def import_records(conn, user_id, records, achievement_engine=None):
+    """Bulk-load exported records for user_id and return rows imported per table.
+
+    Consecutive records of the same table go through a single COPY, so an export
+    file costs one COPY per table. The message counter is advanced by the number
+    of imported conversations and, given an engine, the user's achievements whose
+    threshold was crossed are awarded. The caller commits.
+
+    Malformed input raises ValueError, including values the database rejects
+    (bad timestamps, over-long or missing fields).
+    """
+    imported = dict.fromkeys(EXPORT_TABLES, 0)
+    with conn.cursor() as cur:
+        for table, group in itertools.groupby(records, key=lambda record: record['table']):
+            try:
+                imported[table] += _copy_records(cur, user_id, table, group)
+            except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+                raise ValueError(f"Invalid {table} record: {str(e).splitlines()[0]}") from e
+        if imported['conversations']:
+            cur.execute(
+                "INSERT INTO user_counters (user_id, name, value) VALUES (%s, 'messages', %s) "
+                "ON CONFLICT (user_id, name) DO UPDATE SET value = user_counters.value + EXCLUDED.value "
+                "RETURNING value",
+                (user_id, imported['conversations'])
+            )
+            if achievement_engine:
+                after = cur.fetchone()[0]
+                rules = achievement_engine.evaluate_range('messages', after - imported['conversations'], after)
+                achievement_engine.award(cur, user_id, rules)
+    logger.info(f"Imported {imported} for user_id: {user_id}")
+    return imported
+
+
+def _user_id(conn, username):
+    with conn.cursor() as cur:
+        cur.execute("SELECT id FROM users WHERE username = %s", (username,))
+        row = cur.fetchone()
+    if not row:
+        raise SystemExit(f"No such user: {username}")
+    return row[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--itersize", type=int, default=EXPORT_ITERSIZE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write a user's history to a file or stdout")
+    export.add_argument("username")
+    export.add_argument("--format", choices=FORMATS, default="ndjson")
+    export.add_argument("--table", action="append", choices=list(EXPORT_TABLES),
+                        help="table to export (repeatable; parquet takes exactly one)")
+    export.add_argument("-o", "--output", help="output file (default: stdout)")
+    load = commands.add_parser("import", help="load an NDJSON export into a user's history")
+    load.add_argument("username")
+    load.add_argument("input", nargs="?", help="NDJSON file (default: stdin)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    conn = psycopg2.connect(args.dsn)
+    try:
+        user_id = _user_id(conn, args.username)
+        if args.command == "export":
+            if args.format == "parquet":
+                if not args.table or len(args.table) != 1:
+                    parser.error("--format parquet needs exactly one --table")
+                chunks = iter_parquet(conn, user_id, args.table[0], args.itersize)
+            else:
+                chunks = iter_ndjson(conn, user_id, args.table, args.itersize)
+            output = open(args.output, "wb") if args.output else sys.stdout.buffer
+            try:
+                for chunk in chunks:
+                    output.write(chunk)
+            finally:
+                if args.output:
+                    output.close()
+        else:
+            from achievements import AchievementEngine
+            source = open(args.input, "rb") if args.input else sys.stdin.buffer
+            try:
+                import_records(conn, user_id, parse_ndjson(source), AchievementEngine())
+            finally:
+                if args.input:
+                    source.close()
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
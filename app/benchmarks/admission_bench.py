@@ -0,0 +1,85 @@
+"""Latency of admitted requests under overload, with and without the admission queue.
+
+Simulates an upstream that serves --capacity requests at a time in --service
+seconds each, and offers it --overload times that rate for --duration seconds
+(open loop: arrivals do not wait for earlier requests):
+
+    python benchmarks/admission_bench.py --capacity 8 --service 0.2 --overload 2
+
+Without admission every request eventually gets through and latency grows with
+the backlog; with it, excess requests are shed with a Retry-After and admitted
+ones keep roughly constant latency.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from admission import AdmissionQueue, Rejected  # noqa: E402
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def run(label, capacity, service, rate, duration, queue=None):
+    upstream = threading.Semaphore(capacity)
+    latencies, shed = [], []
+    lock = threading.Lock()
+
+    def request():
+        started = time.perf_counter()
+        try:
+            ticket = queue.acquire() if queue else None
+        except Rejected:
+            with lock:
+                shed.append(time.perf_counter() - started)
+            return
+        try:
+            with upstream:
+                time.sleep(service)
+        finally:
+            if ticket:
+                ticket.release()
+        with lock:
+            latencies.append(time.perf_counter() - started)
+
+    threads = []
+    started = time.perf_counter()
+    sent = 0
+    while time.perf_counter() - started < duration:
+        thread = threading.Thread(target=request, daemon=True)
+        thread.start()
+        threads.append(thread)
+        sent += 1
+        time.sleep(max(0.0, started + sent / rate - time.perf_counter()))
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    print(f"{label:<20} admitted {len(latencies):5d}  shed {len(shed):5d}  "
+          f"p50 {statistics.median(latencies) * 1000:7.0f} ms  p99 {percentile(latencies, 0.99) * 1000:7.0f} ms  "
+          f"max {latencies[-1] * 1000:7.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--capacity', type=int, default=8)
+    parser.add_argument('--service', type=float, default=0.2)
+    parser.add_argument('--overload', type=float, default=2.0)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--queue-size', type=int, default=16)
+    parser.add_argument('--queue-timeout', type=float, default=1.0)
+    args = parser.parse_args()
+
+    rate = args.capacity / args.service * args.overload
+    print(f"offered {rate:.0f} req/s against capacity {args.capacity / args.service:.0f} req/s")
+    run('no admission', args.capacity, args.service, rate, args.duration)
+    queue = AdmissionQueue(args.capacity, args.queue_size, args.queue_timeout)
+    run('admission queue', args.capacity, args.service, rate, args.duration, queue)
+
+
+if __name__ == '__main__':
+    main()
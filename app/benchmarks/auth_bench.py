@@ -0,0 +1,120 @@
+"""Chat latency during a login burst.
+
+Measures /chat p50/p99 with steady chat traffic alone, then again while
+--login-rate logins per second hit /login from the same client. Start
+fake_openai.py and the app first:
+
+    python benchmarks/fake_openai.py --latency 0.2
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 python app.py
+    python benchmarks/auth_bench.py --url http://127.0.0.1:5000 --login-rate 500
+
+All traffic comes from one IP, so with the default LOGIN_IP_RATE_PER_MINUTE
+almost every burst login is rejected before hashing (the credential-stuffing
+case), and --chat-users must stay below LOGIN_IP_BURST for the setup
+registrations to pass. To measure the hashing pool itself, start the app with
+LOGIN_THROTTLE=0 and compare against the previous inline bcrypt.
+"""
+import argparse
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+
+
+def make_session(base_url, username, password):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+    form = urllib.parse.urlencode({"username": username, "password": password}).encode()
+    opener.open(f"{base_url}/register", data=form, timeout=60).read()
+    return opener
+
+
+def chat_loop(base_url, opener, stop, latencies, errors):
+    while not stop.is_set():
+        form = urllib.parse.urlencode({"message": f"Pregunta {uuid.uuid4().hex}"}).encode()
+        started = time.perf_counter()
+        try:
+            with opener.open(f"{base_url}/chat", data=form, timeout=120) as response:
+                response.read()
+            latencies.append(time.perf_counter() - started)
+        except Exception:
+            errors.append(1)
+            time.sleep(0.1)
+
+
+def login_once(base_url, form, outcomes):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+    try:
+        with opener.open(f"{base_url}/login", data=form, timeout=60) as response:
+            response.read()
+            outcomes[response.status] += 1
+    except urllib.error.HTTPError as e:
+        outcomes[e.code] += 1
+    except Exception:
+        outcomes['error'] += 1
+
+
+def login_burst(base_url, username, rate, stop, outcomes, workers):
+    form = urllib.parse.urlencode({"username": username, "password": "wrong-password"}).encode()
+    with ThreadPoolExecutor(workers) as pool:
+        interval, next_at = 1.0 / rate, time.perf_counter()
+        while not stop.is_set():
+            pool.submit(login_once, base_url, form, outcomes)
+            next_at += interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def run_phase(args, openers, burst_user=None):
+    stop, latencies, errors, outcomes = threading.Event(), [], [], Counter()
+    threads = [threading.Thread(target=chat_loop, args=(args.url, opener, stop, latencies, errors))
+               for opener in openers]
+    if burst_user:
+        threads.append(threading.Thread(target=login_burst, args=(
+            args.url, burst_user, args.login_rate, stop, outcomes, args.login_workers)))
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, outcomes
+
+
+def report(label, latencies, errors, outcomes):
+    latencies.sort()
+    if not latencies:
+        print(f"{label:<18} no completed chats ({len(errors)} errors)")
+        return
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+    print(f"{label:<18} chats {len(latencies):>6}  p50 {statistics.median(latencies) * 1000:>8.1f} ms  "
+          f"p99 {p99 * 1000:>8.1f} ms  errors {len(errors)}"
+          + (f"  logins by status {dict(outcomes)}" if outcomes else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--chat-users", type=int, default=20)
+    parser.add_argument("--login-rate", type=float, default=500, help="login attempts per second")
+    parser.add_argument("--login-workers", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=30, help="seconds per phase")
+    args = parser.parse_args()
+
+    openers = [make_session(args.url, f"auth_{uuid.uuid4().hex[:12]}", "loadtest123")
+               for _ in range(args.chat_users)]
+    burst_user = f"auth_{uuid.uuid4().hex[:12]}"
+    make_session(args.url, burst_user, "loadtest123")
+
+    report("chat only", *run_phase(args, openers))
+    report(f"+{args.login_rate:.0f} logins/s", *run_phase(args, openers, burst_user))
+
+
+if __name__ == "__main__":
+    main()
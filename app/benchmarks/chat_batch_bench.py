@@ -0,0 +1,62 @@
+"""Batch throughput against the mock backend as the concurrency limit grows.
+
+No network access needed. Each model call takes --latency seconds; a batch of
+--prompts is answered by ChatBatch at several concurrency limits, compared with
+one call per round trip (the /chat-per-prompt baseline):
+
+    python benchmarks/chat_batch_bench.py --prompts 50 --latency 0.5 --concurrency 1 2 4 8 16
+
+Admission control is replaced with an in-process stand-in so the numbers show
+the fan-out itself rather than Redis rate limits.
+"""
+import argparse
+import contextlib
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chat_batch import ChatBatch  # noqa: E402
+from llm_gateway import LLMGateway, MockBackend  # noqa: E402
+
+
+class OpenAdmission:
+    """Admits everything immediately."""
+
+    def admit(self, lane=None, model=None):
+        return contextlib.nullcontext()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--prompts', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+    logging.getLogger('llm_gateway').setLevel(logging.ERROR)
+
+    gateway = LLMGateway(MockBackend(latency=args.latency), retries=0, fallbacks={})
+    jobs = [(i, [{'role': 'user', 'content': f'Resume el documento {i}'}]) for i in range(args.prompts)]
+
+    started = time.perf_counter()
+    for _, messages in jobs:
+        gateway.complete('gpt-3.5-turbo', messages, max_tokens=500)
+    sequential = time.perf_counter() - started
+    print(f"{'one call per request':<22} {sequential:7.2f}s  {args.prompts / sequential:6.1f} prompts/s")
+
+    for concurrency in args.concurrency:
+        batch = ChatBatch(gateway, OpenAdmission(), concurrency=concurrency)
+        started, first = time.perf_counter(), None
+        completed = 0
+        for _, reply, _, error in batch.run('gpt-3.5-turbo', jobs):
+            if first is None:
+                first = time.perf_counter() - started
+            completed += error is None
+        elapsed = time.perf_counter() - started
+        print(f"{f'batch, concurrency {concurrency}':<22} {elapsed:7.2f}s  {args.prompts / elapsed:6.1f} prompts/s  "
+              f"first result {first * 1000:6.0f} ms  completed {completed}/{args.prompts}")
+
+
+if __name__ == '__main__':
+    main()
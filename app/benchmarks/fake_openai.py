@@ -0,0 +1,102 @@
+"""Minimal stand-in for the OpenAI chat completions API used by the load tests.
+
+Run it and point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8001/v1.
+Every completion sleeps --latency seconds (default FAKE_OPENAI_LATENCY, else 2) to
+mimic a slow model:
+
+    python benchmarks/fake_openai.py --latency 0.5
+"""
+import argparse
+import json
+import os
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY = float(os.getenv("FAKE_OPENAI_LATENCY", 2.0))
+TOKENS = ["Esta ", "es ", "una ", "respuesta ", "simulada ", "del ", "modelo."]
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        if body.get("stream"):
+            self._stream(body)
+        else:
+            self._complete(body)
+
+    def _complete(self, body):
+        time.sleep(LATENCY)
+        payload = json.dumps({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-3.5-turbo"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(TOKENS)},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": len(TOKENS), "total_tokens": 10 + len(TOKENS)}
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _stream(self, body):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        delay = LATENCY / len(TOKENS)
+        for token in TOKENS + [None]:
+            time.sleep(delay)
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "gpt-3.5-turbo"),
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": token} if token else {},
+                    "finish_reason": None if token else "stop"
+                }]
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def main():
+    global LATENCY
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=LATENCY)
+    args = parser.parse_args()
+    LATENCY = args.latency
+    server = ThreadingHTTPServer((args.host, args.port), FakeOpenAIHandler)
+    server.daemon_threads = True
+    print(f"Fake OpenAI listening on http://{args.host}:{args.port}/v1 (latency {LATENCY}s)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
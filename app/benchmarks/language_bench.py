@@ -0,0 +1,108 @@
+"""Per-message cost and accuracy of language detection.
+
+Compares bare langdetect.detect (what /chat used to call) with LanguageDetector
+on short chat messages in the supported languages:
+
+    python benchmarks/language_bench.py --rounds 20
+
+Accuracy is reported on HELD_OUT, messages that played no part in choosing the
+stopword lists in language.py; keep it that way when tuning them, and add any
+message used for tuning to CORPUS instead. The first LanguageDetector pass
+starts with an empty memo; later passes show the cost for repeated messages.
+"""
+import argparse
+import os
+import sys
+import time
+
+from langdetect import DetectorFactory, detect
+from langdetect.lang_detect_exception import LangDetectException
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from language import LanguageDetector  # noqa: E402
+
+CORPUS = [
+    ('es', 'hola'), ('es', '¿Qué hora es?'), ('es', 'gracias por la ayuda'),
+    ('es', 'Recuérdame llamar a mi madre mañana'), ('es', 'no entiendo la respuesta'),
+    ('es', 'puedes explicarlo otra vez'), ('es', 'Quiero una receta de paella para cuatro personas'),
+    ('es', 'me gusta mucho este chatbot'), ('es', 'cuál es la capital de Francia'),
+    ('es', 'Estoy aprendiendo a programar en Python y tengo dudas con las listas'),
+    ('en', 'hello'), ('en', 'what time is it?'), ('en', 'thanks for the help'),
+    ('en', 'Remind me to call my mother tomorrow'), ('en', 'I do not understand the answer'),
+    ('en', 'can you explain it again'), ('en', 'I want a paella recipe for four people'),
+    ('en', 'what is the capital of France'), ('en', 'okay, thank you'),
+    ('en', 'I am learning to program in Python and I have questions about lists'),
+    ('fr', 'bonjour'), ('fr', 'quelle heure est-il ?'), ('fr', 'merci pour ton aide'),
+    ('fr', 'Rappelle-moi d\'appeler ma mère demain'), ('fr', 'je ne comprends pas la réponse'),
+    ('fr', 'peux-tu l\'expliquer encore une fois'), ('fr', 'Je veux une recette de paella pour quatre'),
+    ('fr', 'quelle est la capitale de la France'), ('fr', 'ça marche'),
+    ('fr', 'J\'apprends à programmer en Python et j\'ai des questions sur les listes'),
+]
+
+HELD_OUT = [
+    ('es', 'buenas'), ('es', 'vale'), ('es', 'y tú qué opinas'), ('es', 'no sé'),
+    ('es', 'Necesito ayuda con un correo para mi jefe'), ('es', 'Cuánto tarda el tren de Madrid a Sevilla'),
+    ('es', 'traduce esto al inglés por favor'), ('es', 'Hazme un resumen del último mensaje'),
+    ('es', 'Qué tiempo hace en Barcelona'), ('es', 'Dame tres ideas para cenar esta noche'),
+    ('es', 'el código no compila y no sé por qué'), ('es', 'Escribe un poema corto sobre el mar'),
+    ('es', 'Mi perro no quiere comer desde ayer'), ('es', 'Cómo se calcula el área de un círculo'),
+    ('es', 'perfecto, muchas gracias'), ('es', 'Organiza mi semana para estudiar para el examen'),
+    ('en', 'sure'), ('en', 'nope'), ('en', 'what do you think'), ('en', 'I have no idea'),
+    ('en', 'Help me write an email to my boss'), ('en', 'How long is the train from London to Leeds'),
+    ('en', 'translate this into Spanish please'), ('en', 'Summarize the last message for me'),
+    ('en', 'What is the weather like in Boston'), ('en', 'Give me three ideas for dinner tonight'),
+    ('en', 'the code does not compile and I do not know why'), ('en', 'Write a short poem about the sea'),
+    ('en', 'My dog has not eaten since yesterday'), ('en', 'How do you work out the area of a circle'),
+    ('en', 'perfect, thanks a lot'), ('en', 'Plan my week so I can study for the exam'),
+    ('fr', 'd\'accord'), ('fr', 'bof'), ('fr', 'et toi, tu en penses quoi'), ('fr', 'je sais pas'),
+    ('fr', 'Aide-moi à écrire un mail à mon patron'), ('fr', 'Combien de temps dure le train de Paris à Lyon'),
+    ('fr', 'traduis ceci en anglais s\'il te plaît'), ('fr', 'Fais-moi un résumé du dernier message'),
+    ('fr', 'Quel temps fait-il à Marseille'), ('fr', 'Donne-moi trois idées pour le dîner ce soir'),
+    ('fr', 'le code ne compile pas et je ne sais pas pourquoi'), ('fr', 'Écris un court poème sur la mer'),
+    ('fr', 'Mon chien ne mange plus depuis hier'), ('fr', 'Comment on calcule l\'aire d\'un cercle'),
+    ('fr', 'parfait, merci beaucoup'), ('fr', 'Organise ma semaine pour réviser mon examen'),
+]
+
+
+def bare_detect(message):
+    try:
+        return detect(message)
+    except LangDetectException:
+        return None
+
+
+def accuracy(func, corpus):
+    return sum(func(message) == expected for expected, message in corpus) / len(corpus)
+
+
+def run(label, func, rounds):
+    messages = [message for _, message in CORPUS + HELD_OUT]
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            func(message)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed / (rounds * len(messages)) * 1e6:9.1f} us/message  "
+          f"accuracy held-out {accuracy(func, HELD_OUT):.0%} ({len(HELD_OUT)} messages), "
+          f"tuning {accuracy(func, CORPUS):.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    DetectorFactory.seed = 0
+    started = time.perf_counter()
+    LanguageDetector.warmup()
+    print(f"profile load: {(time.perf_counter() - started) * 1000:.0f} ms (paid once at startup)")
+
+    run('langdetect.detect', bare_detect, args.rounds)
+    run('LanguageDetector (no memo)', lambda m: LanguageDetector(memo_size=0).detect(m), args.rounds)
+    detector = LanguageDetector()
+    run('LanguageDetector (cold)', detector.detect, 1)
+    run('LanguageDetector (memoised)', detector.detect, args.rounds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Tail latency of LLMGateway policies against the deterministic mock backend.
+
+No network access needed. A share of calls (--slow-ratio) takes --slow-latency
+seconds instead of --latency, the long tail that hedging and fallback target:
+
+    python benchmarks/llm_gateway_bench.py --calls 400 --concurrency 16 --hedge-after 0.4
+
+Scenarios: plain calls with no retries, hedged calls, and gpt-4o with a timeout
+short enough that slow calls fall back to gpt-3.5-turbo.
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_gateway import LLMGateway, MockBackend  # noqa: E402
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(label, gateway, model, calls, concurrency):
+    messages = [[{'role': 'user', 'content': f'Pregunta {i}'}] for i in range(calls)]
+
+    def one(message):
+        started = time.perf_counter()
+        try:
+            _, answered_by = gateway.complete(model, message, max_tokens=500)
+        except Exception:
+            answered_by = None
+        return time.perf_counter() - started, answered_by
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, messages))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for latency, _ in results)
+    failed = sum(1 for _, answered_by in results if answered_by is None)
+    fallbacks = sum(1 for _, answered_by in results if answered_by not in (None, model))
+    print(f"{label:<22} p50 {statistics.median(latencies) * 1000:7.0f} ms  "
+          f"p95 {percentile(latencies, 0.95) * 1000:7.0f} ms  p99 {percentile(latencies, 0.99) * 1000:7.0f} ms  "
+          f"{calls / elapsed:6.1f} calls/s  failed {failed}  fallbacks {fallbacks}  {gateway.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--slow-ratio', type=float, default=0.05)
+    parser.add_argument('--slow-latency', type=float, default=3.0)
+    parser.add_argument('--hedge-after', type=float, default=0.4)
+    args = parser.parse_args()
+    logging.getLogger('llm_gateway').setLevel(logging.ERROR)
+
+    def backend():
+        return MockBackend(latency=args.latency, slow_ratio=args.slow_ratio, slow_latency=args.slow_latency)
+
+    run('plain', LLMGateway(backend(), retries=0, fallbacks={}), 'gpt-3.5-turbo', args.calls, args.concurrency)
+    run('hedged', LLMGateway(backend(), retries=0, fallbacks={}, hedge_after=args.hedge_after,
+                             hedge_workers=args.concurrency * 2),
+        'gpt-3.5-turbo', args.calls, args.concurrency)
+    run('gpt-4o with fallback', LLMGateway(backend(), retries=0, timeouts={'gpt-4o': args.hedge_after * 2}),
+        'gpt-4o', args.calls, args.concurrency)
+
+
+if __name__ == '__main__':
+    main()
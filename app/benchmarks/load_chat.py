@@ -0,0 +1,87 @@
+"""Concurrent /chat load test.
+
+Start fake_openai.py, then run the app twice against it, once per worker mode:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 LOGIN_THROTTLE=0 ASYNC_MODE=threading python app.py
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 LOGIN_THROTTLE=0 ASYNC_MODE=eventlet python app.py
+
+and point this script at it to compare completed chats per second:
+
+    python benchmarks/load_chat.py --url http://127.0.0.1:5000 --users 200 --requests 2
+
+Every simulated user registers from this machine's IP, so without
+LOGIN_THROTTLE=0 registrations beyond LOGIN_IP_BURST are rejected with 429.
+Users whose session setup fails are reported and sit the run out.
+"""
+import argparse
+import statistics
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+
+
+def make_session(base_url, username, password):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+    form = urllib.parse.urlencode({"username": username, "password": password}).encode()
+    opener.open(f"{base_url}/register", data=form, timeout=30).read()
+    opener.open(f"{base_url}/login", data=form, timeout=30).read()
+    return opener
+
+
+def run_user(base_url, requests_per_user, barrier, latencies, errors, setup_errors):
+    try:
+        opener = make_session(base_url, f"load_{uuid.uuid4().hex[:12]}", "loadtest123")
+    except Exception as e:
+        setup_errors.append(e)
+        return
+    finally:
+        # Reached even when setup fails, so one rejected registration can't stall the run.
+        barrier.wait()
+    for i in range(requests_per_user):
+        form = urllib.parse.urlencode({"message": f"Pregunta de carga {uuid.uuid4().hex} #{i}"}).encode()
+        started = time.perf_counter()
+        try:
+            with opener.open(f"{base_url}/chat", data=form, timeout=120) as response:
+                response.read()
+            latencies.append(time.perf_counter() - started)
+        except Exception:
+            errors.append(1)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--users", type=int, default=100, help="concurrent chat users")
+    parser.add_argument("--requests", type=int, default=2, help="chat messages per user")
+    args = parser.parse_args()
+
+    latencies, errors, setup_errors = [], [], []
+    barrier = threading.Barrier(args.users + 1)
+    with ThreadPoolExecutor(max_workers=args.users) as executor:
+        for _ in range(args.users):
+            executor.submit(run_user, args.url, args.requests, barrier, latencies, errors, setup_errors)
+        barrier.wait()
+        started = time.perf_counter()
+    elapsed = time.perf_counter() - started
+
+    print(f"users={args.users} requests/user={args.requests} elapsed={elapsed:.2f}s")
+    if setup_errors:
+        print(f"session setup failed for {len(setup_errors)} users (first: {setup_errors[0]}); "
+              f"start the app with LOGIN_THROTTLE=0")
+    print(f"completed={len(latencies)} errors={len(errors)} throughput={len(latencies) / elapsed:.1f} chats/s")
+    if latencies:
+        print(f"latency p50={statistics.median(latencies):.2f}s "
+              f"p95={percentile(latencies, 0.95):.2f}s max={max(latencies):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
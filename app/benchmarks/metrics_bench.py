@@ -0,0 +1,68 @@
+"""Overhead of the Prometheus instrumentation.
+
+Times a trivial Flask route with five timed stages (the shape of /chat) with and
+without Telemetry installed, so the difference is the cost of the request
+histogram, the stage histograms and the before/after hooks:
+
+    python benchmarks/metrics_bench.py --requests 20000
+"""
+import argparse
+import os
+import sys
+import time
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chat_loader import StageTimer  # noqa: E402
+from telemetry import Telemetry  # noqa: E402
+
+STAGES = ('db_read', 'detect', 'cache', 'llm', 'db_write')
+
+
+def make_app(telemetry):
+    app = Flask(__name__)
+
+    @app.route('/chat', methods=['POST'])
+    def chat():
+        timer = telemetry.stage_timer() if telemetry else StageTimer()
+        for stage in STAGES:
+            with timer.stage(stage):
+                pass
+        return {'response': 'ok'}
+
+    if telemetry:
+        telemetry.init_app(app)
+    return app
+
+
+def run(label, telemetry, requests):
+    client = make_app(telemetry).test_client()
+    for _ in range(200):
+        client.post('/chat')
+    started = time.perf_counter()
+    for _ in range(requests):
+        client.post('/chat')
+    per_request = (time.perf_counter() - started) / requests
+    print(f"{label:<20} {per_request * 1e6:8.1f} us/request")
+    return per_request
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+
+    baseline = run('no metrics', None, args.requests)
+    telemetry = Telemetry()
+    instrumented = run('metrics enabled', telemetry, args.requests)
+    print(f"overhead: {(instrumented - baseline) * 1e6:.1f} us/request "
+          f"({(instrumented / baseline - 1) * 100:.1f}% of an empty request)")
+
+    started = time.perf_counter()
+    scrape = telemetry.metrics_view().get_data()
+    print(f"/metrics scrape: {(time.perf_counter() - started) * 1000:.1f} ms, {len(scrape)} bytes")
+
+
+if __name__ == '__main__':
+    main()
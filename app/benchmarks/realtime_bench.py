@@ -0,0 +1,170 @@
+"""Emit latency and server CPU with thousands of connected sockets.
+
+Starts a minimal Flask-SocketIO server (eventlet, Redis message queue) that
+delivers through Realtime, connects --clients simulated users, one room each,
+then streams --tokens events to --targets random users per round through the
+message queue, like a completion being streamed. Reports delivery latency, the
+server's CPU time per phase, and how many 'user_connected' frames the clients
+received while joining:
+
+    ulimit -n 65536
+    pip install "python-socketio[asyncio_client]"
+    REDIS_URL=redis://localhost:6379 python benchmarks/realtime_bench.py --clients 10000
+    REDIS_URL=redis://localhost:6379 python benchmarks/realtime_bench.py --clients 10000 --batch-ms 20
+    REDIS_URL=redis://localhost:6379 python benchmarks/realtime_bench.py --clients 2000 --legacy-broadcast
+
+--legacy-broadcast reproduces the old connect handler, which broadcast every
+join to every socket (O(N^2) frames) and joined no room.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def serve(port, redis_url, batch_ms, legacy_broadcast):
+    import eventlet
+    eventlet.monkey_patch()
+    from flask import Flask, jsonify, request
+    from flask_socketio import SocketIO, emit
+
+    sys.path.insert(0, APP_DIR)
+    from realtime import Realtime
+
+    app = Flask(__name__)
+    socketio = SocketIO(app, async_mode='eventlet', message_queue=redis_url)
+    realtime = Realtime(socketio, batch_interval=batch_ms / 1000)
+
+    @socketio.on('connect')
+    def connect():
+        user = request.args.get('user')
+        if legacy_broadcast:
+            emit('user_connected', {'user_id': user}, broadcast=True)
+        else:
+            realtime.join(user)
+            emit('user_connected', {'user_id': user})
+
+    @app.route('/emit', methods=['POST'])
+    def emit_tokens():
+        body = request.get_json()
+        for index in range(body['tokens']):
+            for user in body['users']:
+                realtime.emit(user, 'token', {'index': index, 'sent': time.time()})
+            socketio.sleep(0)
+        return jsonify({'ok': True})
+
+    socketio.run(app, host='127.0.0.1', port=port, log_output=False)
+
+
+def cpu_seconds(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+async def connect_clients(url, count, latencies, counters, concurrency):
+    import socketio
+
+    gate = asyncio.Semaphore(concurrency)
+    clients = []
+
+    def record(data):
+        latencies.append(time.time() - data['sent'])
+
+    async def connect(user):
+        client = socketio.AsyncClient(reconnection=False)
+        client.on('token', record)
+        client.on('batch', lambda events: [record(data) for event, data in events if event == 'token'])
+
+        def greeted(data):
+            counters['user_connected'] += 1
+        client.on('user_connected', greeted)
+        async with gate:
+            try:
+                await client.connect(f"{url}?user={user}", transports=['websocket'])
+                clients.append(client)
+            except Exception:
+                counters['connect_errors'] += 1
+
+    await asyncio.gather(*(connect(user) for user in range(count)))
+    return clients
+
+
+def post_emit(url, users, tokens):
+    body = json.dumps({'users': users, 'tokens': tokens}).encode()
+    request = urllib.request.Request(f"{url}/emit", data=body, headers={'Content-Type': 'application/json'})
+    urllib.request.urlopen(request, timeout=300).read()
+
+
+async def drive(args, server):
+    url = f"http://127.0.0.1:{args.port}"
+    latencies, counters = [], {'user_connected': 0, 'connect_errors': 0}
+
+    cpu, started = cpu_seconds(server.pid), time.perf_counter()
+    clients = await connect_clients(url, args.clients, latencies, counters, args.connect_concurrency)
+    await asyncio.sleep(2)
+    print(f"Connected {len(clients)} clients in {time.perf_counter() - started:.1f}s "
+          f"({counters['connect_errors']} errors), server CPU {cpu_seconds(server.pid) - cpu:.2f}s, "
+          f"user_connected frames received: {counters['user_connected']}")
+
+    loop = asyncio.get_running_loop()
+    cpu, started = cpu_seconds(server.pid), time.perf_counter()
+    for _ in range(args.rounds):
+        users = random.sample(range(args.clients), min(args.targets, args.clients))
+        await loop.run_in_executor(None, post_emit, url, users, args.tokens)
+    expected = args.rounds * min(args.targets, args.clients) * args.tokens
+    deadline = time.perf_counter() + 30
+    while len(latencies) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - started
+    print(f"Delivered {len(latencies)}/{expected} events in {elapsed:.1f}s, "
+          f"server CPU {cpu_seconds(server.pid) - cpu:.2f}s")
+    if latencies:
+        latencies.sort()
+        print(f"Emit latency ms: p50 {statistics.median(latencies) * 1000:.1f}  "
+              f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}  "
+              f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}  max {latencies[-1] * 1000:.1f}")
+    await asyncio.gather(*(client.disconnect() for client in clients), return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379"))
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--targets", type=int, default=100, help="users receiving a stream per round")
+    parser.add_argument("--tokens", type=int, default=50, help="events per stream")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--batch-ms", type=float, default=0)
+    parser.add_argument("--legacy-broadcast", action="store_true")
+    parser.add_argument("--connect-concurrency", type=int, default=200)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.redis_url, args.batch_ms, args.legacy_broadcast)
+        return
+
+    command = [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(args.port),
+               "--redis-url", args.redis_url, "--batch-ms", str(args.batch_ms)]
+    if args.legacy_broadcast:
+        command.append("--legacy-broadcast")
+    server = subprocess.Popen(command)
+    try:
+        time.sleep(2)
+        asyncio.run(drive(args, server))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
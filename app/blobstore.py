@@ -0,0 +1,186 @@
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+DIGEST_PATTERN = re.compile(r'^([0-9a-f]{64})(\.[a-z0-9]{1,5})?$')
+EXPIRY_INDEX = 'blob:expiry'
+PURGE_LOCK_MS = 30000
+
+# Purge claims a blob only if it is still expired when checked, in the same step
+# that takes it out of the index and locks it against puts until it is deleted.
+# KEYS: expiry index, purge lock. ARGV: digest, now, lock ms.
+PURGE_CLAIM_SCRIPT = """
+local expires_at = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not expires_at or tonumber(expires_at) > tonumber(ARGV[2]) then
+    return 0
+end
+if not redis.call('SET', KEYS[2], 1, 'NX', 'PX', ARGV[3]) then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+return 1
+"""
+
+# Records a blob unless a purge of the same digest is in flight (then returns 0).
+# KEYS: expiry index, purge lock, metadata hash. ARGV: digest, expires at ('' for
+# permanent), filename, mimetype, size, stored at.
+REGISTER_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[3], 'filename', ARGV[3], 'mimetype', ARGV[4], 'size', ARGV[5], 'stored_at', ARGV[6])
+if ARGV[2] == '' then
+    redis.call('HSET', KEYS[3], 'permanent', 1)
+    redis.call('ZREM', KEYS[1], ARGV[1])
+elseif not redis.call('HGET', KEYS[3], 'permanent') then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+end
+return 1
+"""
+
+
+class LocalBlobBackend:
+    """Blobs on local disk, sharded as <root>/ab/cd/<sha256>."""
+
+    def __init__(self, root):
+        self.root = root
+        self.staging = os.path.join(root, '.staging')
+        os.makedirs(self.staging, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def put(self, tmp_path, digest, mimetype):
+        target = self.path(digest)
+        if os.path.exists(target):
+            os.remove(tmp_path)
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp_path, target)
+
+    def delete(self, digest):
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+
+class S3BlobBackend:
+    """Blobs in an S3-compatible bucket (AWS, MinIO, R2...), served through presigned URLs."""
+
+    def __init__(self, bucket, staging, endpoint_url=None, prefix='uploads/', url_ttl=3600):
+        import boto3
+
+        self.client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.url_ttl = url_ttl
+        self.staging = staging
+        os.makedirs(self.staging, exist_ok=True)
+
+    def _key(self, digest):
+        return f"{self.prefix}{digest[:2]}/{digest}"
+
+    def path(self, digest):
+        return None
+
+    def exists(self, digest):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(digest))
+            return True
+        except ClientError:
+            return False
+
+    def put(self, tmp_path, digest, mimetype):
+        try:
+            if not self.exists(digest):
+                self.client.upload_file(tmp_path, self.bucket, self._key(digest),
+                                        ExtraArgs={'ContentType': mimetype,
+                                                   'CacheControl': 'public, max-age=31536000, immutable'})
+        finally:
+            os.remove(tmp_path)
+
+    def url(self, digest):
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self._key(digest)}, ExpiresIn=self.url_ttl
+        )
+
+    def delete(self, digest):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(digest))
+
+
+class BlobStore:
+    """Content-addressed upload store with deduplication and an expiry index.
+
+    Metadata lives in a Redis hash per blob, and expiring blobs are kept in a
+    sorted set scored by expiry time, so purging reads only what has expired.
+    Storing the same content again refreshes its expiry instead of copying it.
+    A blob stored again while it is being purged waits for the purge to finish
+    and is then stored afresh, so a new upload never points at deleted content.
+    """
+
+    def __init__(self, backend, redis_client, ttl=24 * 3600):
+        self.backend = backend
+        self.redis = redis_client
+        self.ttl = ttl
+        self._claim = redis_client.register_script(PURGE_CLAIM_SCRIPT)
+        self._register = redis_client.register_script(REGISTER_SCRIPT)
+
+    @property
+    def staging(self):
+        return self.backend.staging
+
+    @staticmethod
+    def _meta_key(digest):
+        return f"blob:{digest}"
+
+    @staticmethod
+    def _lock_key(digest):
+        return f"blob:purging:{digest}"
+
+    @staticmethod
+    def url(digest, filename):
+        extension = os.path.splitext(filename)[1].lower()
+        return f"/static/uploads/{digest}{extension}"
+
+    def put(self, tmp_path, digest, filename, mimetype, size, expires=True):
+        """Move a staged upload into the store. Permanent blobs (expires=False),
+        such as avatars, are never purged."""
+        keys = [EXPIRY_INDEX, self._lock_key(digest), self._meta_key(digest)]
+        args = [digest, time.time() + self.ttl if expires else '', filename, mimetype, size, int(time.time())]
+        # Registered first, so a purge that hasn't claimed the blob yet sees the new expiry.
+        while not self._register(keys=keys, args=args):
+            time.sleep(0.05)
+        self.backend.put(tmp_path, digest, mimetype)
+        return self.url(digest, filename)
+
+    def metadata(self, digest):
+        return self.redis.hgetall(self._meta_key(digest)) or None
+
+    def purge_expired(self, now=None):
+        """Delete blobs whose expiry has passed; cost is proportional to the number expired."""
+        now = time.time() if now is None else now
+        purged = 0
+        for digest in self.redis.zrangebyscore(EXPIRY_INDEX, '-inf', now):
+            if not self._claim(keys=[EXPIRY_INDEX, self._lock_key(digest)], args=[digest, now, PURGE_LOCK_MS]):
+                continue
+            try:
+                self.backend.delete(digest)
+                self.redis.delete(self._meta_key(digest))
+                purged += 1
+            except Exception as e:
+                logger.error(f"Failed to purge blob {digest}: {e}")
+                self.redis.zadd(EXPIRY_INDEX, {digest: now}, nx=True)
+            finally:
+                self.redis.delete(self._lock_key(digest))
+        if purged:
+            logger.info(f"Purged {purged} expired uploads")
+        return purged
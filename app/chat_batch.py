@@ -0,0 +1,52 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from admission import LANE_BATCH, Rejected
+
+logger = logging.getLogger(__name__)
+
+
+class ChatBatch:
+    """Fans a batch of prompts out to one model with bounded concurrency.
+
+    At most `concurrency` calls of a batch are in flight, and each one still
+    goes through admission control in the batch lane, so batches queue behind
+    interactive chats and respect the global and per-model rate limits.
+    Throughput therefore scales with the concurrency limit, not with the number
+    of HTTP requests a client makes.
+
+    Closing the generator returned by run() (the client went away) cancels the
+    calls that haven't started and returns without waiting for those in flight.
+    """
+
+    def __init__(self, llm, admission, concurrency=4, max_tokens=500, temperature=0.7):
+        self.llm = llm
+        self.admission = admission
+        self.concurrency = concurrency
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+    def _complete(self, model, messages):
+        with self.admission.admit(LANE_BATCH, model):
+            return self.llm.complete(model, messages, max_tokens=self.max_tokens, temperature=self.temperature)
+
+    def run(self, model, jobs):
+        """Complete (index, messages) jobs, yielding (index, reply, answered_by, error) as each finishes."""
+        if not jobs:
+            return
+        executor = ThreadPoolExecutor(min(self.concurrency, len(jobs)), thread_name_prefix='chat-batch')
+        try:
+            futures = {executor.submit(self._complete, model, messages): index for index, messages in jobs}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    reply, answered_by = future.result()
+                except Rejected as e:
+                    yield index, None, None, f"rate limited ({e.reason}), retry after {e.retry_after}s"
+                except Exception as e:
+                    logger.error(f"Batch prompt {index} failed: {e}")
+                    yield index, None, None, str(e)
+                else:
+                    yield index, reply, answered_by, None
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
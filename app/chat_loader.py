@@ -0,0 +1,230 @@
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+
+from context_store import ContextStore
+from settings_cache import fetch_settings
+
+logger = logging.getLogger(__name__)
+
+LOAD_SQL = """
+    WITH mentioned AS (
+        SELECT * FROM unnest(%(context_kinds)s::varchar[], %(context_values)s::text[]) AS t(kind, value)
+    ), touched AS (
+        INSERT INTO user_context (user_id, kind, value, last_seen)
+        SELECT %(user_id)s, kind, value, CURRENT_TIMESTAMP FROM mentioned
+        ON CONFLICT (user_id, kind, value) DO UPDATE SET last_seen = EXCLUDED.last_seen
+        RETURNING 1
+    ), evicted AS (
+        DELETE FROM user_context c
+        WHERE c.user_id = %(user_id)s
+          AND (c.kind, c.value) NOT IN (SELECT kind, value FROM mentioned)
+          AND (c.kind, c.value) IN (
+              SELECT kind, value FROM user_context
+              WHERE user_id = %(user_id)s AND (kind, value) NOT IN (SELECT kind, value FROM mentioned)
+              ORDER BY last_seen DESC OFFSET %(context_keep)s)
+        RETURNING 1
+    )
+    SELECT COALESCE(json_agg(json_build_array(c.kind, c.value) ORDER BY c.last_seen DESC), '[]'::json)
+    FROM (SELECT kind, value, last_seen FROM user_context
+          WHERE user_id = %(user_id)s ORDER BY last_seen DESC LIMIT %(context_cap)s) c
+"""
+
+SAVE_SQL = """
+    WITH new_message AS (
+        INSERT INTO conversations (user_id, user_message, ai_response, file_url, file_name, avatar, language)
+        VALUES (%(user_id)s, %(user_message)s, %(ai_response)s, %(file_url)s, %(file_name)s, %(avatar)s,
+                %(language)s)
+        RETURNING id
+    ), message_count AS (
+        INSERT INTO user_counters (user_id, name, value) VALUES (%(user_id)s, 'messages', 1)
+        ON CONFLICT (user_id, name) DO UPDATE SET value = user_counters.value + 1
+        RETURNING value
+    )
+    SELECT (SELECT id FROM new_message), (SELECT value FROM message_count)
+"""
+
+SAVE_MANY_SQL = """
+    WITH new_messages AS (
+        INSERT INTO conversations (user_id, user_message, ai_response, avatar, language)
+        SELECT %(user_id)s, m.user_message, m.ai_response, %(avatar)s, m.language
+        FROM unnest(%(user_messages)s::text[], %(ai_responses)s::text[], %(languages)s::varchar[])
+             WITH ORDINALITY AS m(user_message, ai_response, language, position)
+        ORDER BY m.position
+        RETURNING id
+    ), message_count AS (
+        INSERT INTO user_counters (user_id, name, value) VALUES (%(user_id)s, 'messages', %(count)s)
+        ON CONFLICT (user_id, name) DO UPDATE SET value = user_counters.value + EXCLUDED.value
+        RETURNING value
+    )
+    SELECT (SELECT array_agg(id ORDER BY id) FROM new_messages), (SELECT value FROM message_count)
+"""
+
+
+def fetch_recent_turns(cur, user_id, limit=20):
+    """Most recent exchanges in chronological order, used to seed conversation memory."""
+    cur.execute(
+        "SELECT user_message, ai_response FROM conversations WHERE user_id = %s "
+        "ORDER BY timestamp DESC, id DESC LIMIT %s",
+        (user_id, limit)
+    )
+    return list(reversed(cur.fetchall()))
+
+
+class StageTimer:
+    """Wall-clock time per pipeline stage plus the number of database statements issued.
+
+    observe, if given, is called with (stage, seconds) as each stage ends, and
+    tracer (an OpenTelemetry tracer) wraps each timed stage in a span.
+    """
+
+    def __init__(self, observe=None, tracer=None):
+        self.stages = {}
+        self.queries = 0
+        self.started = time.perf_counter()
+        self.observe = observe
+        self.tracer = tracer
+
+    @contextmanager
+    def stage(self, name):
+        span = self.tracer.start_as_current_span(f"chat.{name}") if self.tracer else nullcontext()
+        started = time.perf_counter()
+        try:
+            with span:
+                yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        if self.observe:
+            self.observe(name, seconds)
+
+    def summary(self):
+        parts = [f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.stages.items()]
+        parts.append(f"total={(time.perf_counter() - self.started) * 1000:.1f}ms")
+        parts.append(f"db_statements={self.queries}")
+        return " ".join(parts)
+
+    def server_timing(self):
+        """Value for the Server-Timing response header."""
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items())
+
+
+class ChatDataLoader:
+    """Request-scoped data access for /chat.
+
+    load() takes preferences and avatar from the settings cache and reads the
+    user's context entities while upserting the ones mentioned in the message, in
+    one statement; save() writes the exchange and bumps the message counter in
+    another, and only touches achievements when the counter crosses a badge
+    threshold. Each phase uses a single pooled connection, and no connection is
+    held while the model is generating. Given a write-behind writer, save()
+    queues the exchange instead and achievements are announced by the writer.
+    """
+
+    def __init__(self, db_pool, user_id, achievement_engine, timer=None, context_store=None, settings_cache=None,
+                 writer=None):
+        self.db_pool = db_pool
+        self.achievement_engine = achievement_engine
+        self.user_id = user_id
+        self.timer = timer or StageTimer()
+        self.context_store = context_store or ContextStore()
+        self.settings_cache = settings_cache
+        self.writer = writer
+        self.avatar = None
+
+    @contextmanager
+    def _cursor(self):
+        with self.db_pool.connection() as conn, conn.cursor() as cur:
+            yield cur
+
+    def load(self, new_context, memory):
+        """Return the user's settings, rendered context and prompt history."""
+        with self.timer.stage('db_read'), self._cursor() as cur:
+            def read_settings():
+                self.timer.queries += 1
+                return fetch_settings(cur, self.user_id)
+
+            if self.settings_cache:
+                settings = self.settings_cache.get(self.user_id, read_settings)
+            else:
+                settings = read_settings()
+            model = settings['model']
+            self.avatar = settings['avatar']
+
+            cur.execute(LOAD_SQL, {'user_id': self.user_id, **self.context_store.params(new_context)})
+            self.timer.queries += 1
+            # The statement sees the entity set as it was before this message's upsert.
+            context = self.context_store.merge(new_context, cur.fetchone()[0])
+
+            def seed_memory():
+                self.timer.queries += 1
+                return fetch_recent_turns(cur, self.user_id)
+
+            history = memory.messages(self.user_id, model, loader=seed_memory)
+
+        return {
+            'model': model,
+            'tone': settings['tone'],
+            'language': settings['language'],
+            'avatar': self.avatar,
+            'context': context,
+            'history': history,
+        }
+
+    def save(self, user_message, ai_response, file_url=None, file_name=None, language=None):
+        """Persist the exchange and return (conversation id, newly awarded achievements).
+
+        language is the detected language code; it selects the full-text search configuration.
+        """
+        if self.writer:
+            with self.timer.stage('db_write'):
+                message_id = self.writer.submit(self.user_id, user_message, ai_response, file_url, file_name,
+                                                self.avatar, language)
+            if message_id is not None:
+                return message_id, []
+        with self.timer.stage('db_write'), self._cursor() as cur:
+            cur.execute(SAVE_SQL, {
+                'user_id': self.user_id,
+                'user_message': user_message,
+                'ai_response': ai_response,
+                'file_url': file_url,
+                'file_name': file_name,
+                'avatar': self.avatar,
+                'language': language,
+            })
+            self.timer.queries += 1
+            message_id, message_count = cur.fetchone()
+            crossed = self.achievement_engine.evaluate('messages', message_count)
+            achievements = []
+            if crossed:
+                self.timer.queries += 1
+                achievements = self.achievement_engine.award(cur, self.user_id, crossed)
+        return message_id, achievements
+
+    def save_many(self, exchanges):
+        """Persist (user_message, ai_response, language) exchanges in one statement.
+
+        Returns (conversation ids in the order given, newly awarded achievements).
+        """
+        if not exchanges:
+            return [], []
+        user_messages, ai_responses, languages = (list(column) for column in zip(*exchanges))
+        with self.timer.stage('db_write'), self._cursor() as cur:
+            cur.execute(SAVE_MANY_SQL, {
+                'user_id': self.user_id,
+                'user_messages': user_messages,
+                'ai_responses': ai_responses,
+                'languages': languages,
+                'avatar': self.avatar,
+                'count': len(exchanges),
+            })
+            self.timer.queries += 1
+            message_ids, message_count = cur.fetchone()
+            crossed = self.achievement_engine.evaluate_range('messages', message_count - len(exchanges), message_count)
+            achievements = []
+            if crossed:
+                self.timer.queries += 1
+                achievements = self.achievement_engine.award(cur, self.user_id, crossed)
+        return message_ids, achievements
@@ -0,0 +1,59 @@
+import re
+
+# Compiled once at import instead of on every message.
+NAME_PATTERN = re.compile(r'\b[A-Z][a-z]*\b')
+DATE_PATTERN = re.compile(r'\b\d{1,2}/\d{1,2}/\d{4}\b|\b(?:hoy|mañana|ayer)\b')
+
+DEFAULT_CONTEXT_CAP = 20
+
+
+def extract_context(message):
+    """Entities mentioned in a message as {kind: [values]}, deduplicated in order of appearance."""
+    context = {}
+    names = list(dict.fromkeys(NAME_PATTERN.findall(message)))
+    if names:
+        context['names'] = names
+    dates = list(dict.fromkeys(DATE_PATTERN.findall(message)))
+    if dates:
+        context['dates'] = dates
+    return context
+
+
+class ContextStore:
+    """Bounded, deduplicated set of entities per user, kept in user_context.
+
+    Each (kind, value) is one row, upserted with its last_seen time, so repeated
+    mentions refresh an entity instead of adding rows. Once a user has more than
+    `cap` entities the least recently seen are evicted, which keeps both the table
+    and the rendered prompt context bounded. ChatDataLoader runs the update and
+    the read in the same statement as the rest of the /chat read.
+    """
+
+    def __init__(self, cap=DEFAULT_CONTEXT_CAP):
+        self.cap = cap
+
+    def params(self, new_context):
+        """SQL parameters for the upsert/evict/read in chat_loader.LOAD_SQL."""
+        pairs = [(kind, value) for kind, values in new_context.items() for value in values][:self.cap]
+        return {
+            'context_kinds': [kind for kind, _ in pairs],
+            'context_values': [value for _, value in pairs],
+            'context_cap': self.cap,
+            # Rows that survive eviction besides the ones touched by this message.
+            'context_keep': self.cap - len(pairs),
+        }
+
+    def merge(self, new_context, stored):
+        """Combine this message's entities with the stored ones (newest first) into {kind: [values]}."""
+        context, seen = {}, set()
+        pairs = [(kind, value) for kind, values in new_context.items() for value in values]
+        for kind, value in pairs + [tuple(pair) for pair in stored]:
+            if (kind, value) in seen or len(seen) >= self.cap:
+                continue
+            seen.add((kind, value))
+            context.setdefault(kind, []).append(value)
+        return context
+
+    @staticmethod
+    def render(context):
+        return "\n".join(f"{kind}: {', '.join(values)}" for kind, values in context.items())
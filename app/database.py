@@ -0,0 +1,223 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+logger = logging.getLogger(__name__)
+
+# statement_timeout in milliseconds per query class; 0 disables it.
+# 'bulk' covers archive exports and COPY imports, which run for as long as the data takes.
+STATEMENT_TIMEOUTS = {'interactive': 5000, 'background': 60000, 'migration': 0, 'bulk': 0}
+
+
+class PoolTimeout(PoolError):
+    """No connection became available within the pool's wait timeout."""
+
+
+class PooledConnection(extensions.connection):
+    """Connection that keeps its checkout's statement_timeout across transactions.
+
+    SET LOCAL ends with the transaction, and handlers often commit and carry on.
+    After a commit or rollback the timeout is set again when the next cursor is
+    opened, so it still covers the next transaction without an extra round trip
+    for a connection that is only being returned.
+    """
+
+    statement_timeout = None
+    _timeout_pending = False
+
+    def set_statement_timeout(self, milliseconds):
+        self.statement_timeout = milliseconds
+        with super().cursor() as cur:
+            cur.execute("SET LOCAL statement_timeout = %s", (milliseconds,))
+        self._timeout_pending = False
+
+    def clear_statement_timeout(self):
+        """Stop setting the timeout; the connection is going back to the pool."""
+        self.statement_timeout = None
+        self._timeout_pending = False
+
+    def cursor(self, *args, **kwargs):
+        if self._timeout_pending:
+            self.set_statement_timeout(self.statement_timeout)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        super().commit()
+        self._timeout_pending = self.statement_timeout is not None
+
+    def rollback(self):
+        super().rollback()
+        self._timeout_pending = self.statement_timeout is not None
+
+
+class ConnectionPool:
+    """Thread-safe psycopg2 connection pool with bounded waits.
+
+    getconn() blocks for at most `timeout` seconds when every connection is in
+    use, then raises PoolTimeout. Connections idle for longer than
+    `validate_after` seconds are checked with a round trip before being handed
+    out, and those older than `max_lifetime` are replaced.
+
+    Each checkout sets its query class's statement_timeout with SET LOCAL, so
+    it leaves no session state behind. This keeps the pool safe behind PgBouncer
+    in transaction mode. PooledConnection sets it again for every later
+    transaction on the same checkout, so it survives a commit mid-handler.
+    Connections are rolled back on return if a handler left a transaction open.
+
+    With lazy=True nothing is opened until the first checkout or prime(), so
+    constructing the pool never fails because the database is not up yet.
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=5.0, max_lifetime=1800.0, validate_after=30.0,
+                 statement_timeouts=None, lazy=False, **connect_kwargs):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.validate_after = validate_after
+        self.statement_timeouts = {**STATEMENT_TIMEOUTS, **(statement_timeouts or {})}
+        self.connect_kwargs = {'connect_timeout': 5, 'keepalives': 1, 'keepalives_idle': 30, **connect_kwargs}
+        self._idle = []
+        self._opened = {}
+        self._size = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self.metrics = {'checkouts': 0, 'waits': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0,
+                        'timeouts': 0, 'opened': 0, 'discarded': 0}
+        if not lazy:
+            self.prime()
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, connection_factory=PooledConnection, **self.connect_kwargs)
+        with self._cond:
+            self._opened[conn] = time.monotonic()
+            self.metrics['opened'] += 1
+        return conn
+
+    def prime(self):
+        """Open idle connections until the pool holds minconn."""
+        while True:
+            with self._cond:
+                if self._size >= min(self.minconn, self.maxconn):
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._opened.pop(conn, None)
+            self._size -= 1
+            self.metrics['discarded'] += 1
+            self._cond.notify()
+
+    def _expired(self, conn):
+        return time.monotonic() - self._opened.get(conn, 0) > self.max_lifetime
+
+    def _checkout(self, deadline):
+        """Wait for an idle connection or a free slot; returns (conn or None, idle since)."""
+        started = time.monotonic()
+        with self._cond:
+            while not self._idle and self._size >= self.maxconn:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.metrics['timeouts'] += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout:.1f}s")
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            waited = time.monotonic() - started
+            self.metrics['checkouts'] += 1
+            if waited > 0.001:
+                self.metrics['waits'] += 1
+                self.metrics['wait_seconds'] += waited
+                self.metrics['max_wait_seconds'] = max(self.metrics['max_wait_seconds'], waited)
+            if self._idle:
+                return self._idle.pop()
+            self._size += 1
+            return None, None
+
+    def getconn(self, query_class='interactive'):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn, idle_since = self._checkout(deadline)
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif conn.closed or self._expired(conn):
+                self._discard(conn)
+                continue
+            try:
+                with conn.cursor() as cur:
+                    if time.monotonic() - (idle_since or time.monotonic()) > self.validate_after:
+                        cur.execute("SELECT 1")
+                conn.set_statement_timeout(self.statement_timeouts.get(query_class, 0))
+                return conn
+            except psycopg2.Error as e:
+                logger.warning(f"Discarding broken database connection: {e}")
+                self._discard(conn)
+
+    def putconn(self, conn, close=False):
+        reusable = not close and not conn.closed and not self._expired(conn)
+        if reusable and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                reusable = False
+        if not reusable:
+            self._discard(conn)
+            return
+        conn.clear_statement_timeout()
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, query_class='interactive'):
+        """Check out a connection, commit on success and roll back on error."""
+        conn = self.getconn(query_class)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._cond:
+            return {'size': self._size, 'max': self.maxconn, 'idle': len(self._idle),
+                    'in_use': self._size - len(self._idle), 'waiting': self._waiting, **self.metrics}
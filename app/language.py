@@ -0,0 +1,153 @@
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+
+from langdetect import DetectorFactory, detect_langs
+from langdetect.detector_factory import init_factory
+from langdetect.lang_detect_exception import LangDetectException
+
+logger = logging.getLogger(__name__)
+
+# Ensure consistent language detection
+DetectorFactory.seed = 0
+
+SUPPORTED_LANGUAGES = ('es', 'en', 'fr')
+SHORT_MESSAGE_WORDS = 3
+
+# Characters that only occur in one of the supported languages.
+SCRIPT_MARKERS = {
+    'es': set('ñ¿¡'),
+    'fr': set('çœæèêëîïôùûÿ'),
+}
+
+# High-frequency function words and greetings, from general word-frequency lists rather
+# than from any test corpus (benchmarks/language_bench.py reports a held-out set).
+STOPWORDS = {
+    'es': {'el', 'la', 'los', 'las', 'de', 'del', 'que', 'y', 'en', 'un', 'una', 'es', 'por', 'para', 'con',
+           'no', 'se', 'lo', 'como', 'pero', 'mi', 'me', 'te', 'su', 'sus', 'al', 'este', 'esta', 'esto',
+           'eso', 'muy', 'sí', 'también', 'hay', 'son', 'fue', 'está', 'están', 'qué', 'cómo', 'cuál',
+           'dónde', 'cuándo', 'porque', 'yo', 'tú', 'usted', 'algo', 'todo', 'hola', 'gracias'},
+    'en': {'the', 'and', 'is', 'are', 'to', 'of', 'in', 'it', 'you', 'that', 'for', 'on', 'with', 'this',
+           'what', 'how', 'can', 'do', 'does', 'my', 'i', 'me', 'be', 'was', 'have', 'has', 'an', 'not',
+           'yes', 'where', 'why', 'when', 'which', 'there', 'they', 'we', 'your', 'will', 'should', 'from',
+           'could', 'would', 'hello', 'hi', 'thanks', 'please'},
+    'fr': {'le', 'la', 'les', 'de', 'des', 'du', 'et', 'est', 'un', 'une', 'que', 'qui', 'pour', 'dans',
+           'pas', 'je', 'tu', 'vous', 'nous', 'il', 'elle', 'ce', 'cette', 'avec', 'sur', 'mon', 'ma',
+           'au', 'aux', 'quel', 'quelle', 'ne', 'oui', 'très', 'sont', 'ont', 'mais', 'votre', 'son',
+           'comment', 'où', 'bonjour', 'merci'},
+}
+
+# Words shared between languages ('la', 'de', 'me') say nothing about which one it is.
+EXCLUSIVE_STOPWORDS = {
+    word: language
+    for language, words in STOPWORDS.items()
+    for word in words
+    if sum(word in other for other in STOPWORDS.values()) == 1
+}
+
+_WORDS = re.compile(r"[^\W\d_]+")
+
+
+def fast_detect(message):
+    """Script and stopword heuristics. Returns (language, confidence) or (None, 0.0)."""
+    text = message.lower()
+    for language, markers in SCRIPT_MARKERS.items():
+        if any(char in markers for char in text):
+            return language, 0.95
+    scores = dict.fromkeys(SUPPORTED_LANGUAGES, 0)
+    for word in _WORDS.findall(text):
+        language = EXCLUSIVE_STOPWORDS.get(word)
+        if language:
+            scores[language] += 1
+    matched = sum(scores.values())
+    if not matched:
+        return None, 0.0
+    language = max(scores, key=scores.get)
+    if scores[language] == matched:
+        return language, 0.95 if matched > 1 else 0.9
+    return language, scores[language] / matched
+
+
+class LanguageDetector:
+    """Message language detection with a heuristic fast path.
+
+    Order: memoised result by message digest, script/stopword heuristics,
+    then langdetect. Ambiguous results fall back to the user's last confidently
+    detected language, kept in Redis.
+    """
+
+    def __init__(self, redis_client=None, threshold=0.8, memo_size=10000, user_ttl=30 * 24 * 3600):
+        self.redis = redis_client
+        self.threshold = threshold
+        self.memo_size = memo_size
+        self.user_ttl = user_ttl
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def warmup():
+        """Load langdetect's language profiles now instead of on the first request."""
+        init_factory()
+
+    @staticmethod
+    def _digest(message):
+        return hashlib.blake2b(message.strip().lower().encode('utf-8'), digest_size=16).digest()
+
+    def _memo_get(self, key):
+        with self._lock:
+            result = self._memo.get(key)
+            if result is not None:
+                self._memo.move_to_end(key)
+            return result
+
+    def _memo_put(self, key, result):
+        with self._lock:
+            self._memo[key] = result
+            self._memo.move_to_end(key)
+            if len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+
+    def _user_language(self, user_id):
+        if self.redis is None or user_id is None:
+            return None
+        try:
+            return self.redis.get(f"lang:{user_id}")
+        except Exception as e:
+            logger.error(f"Failed to read last language for user_id {user_id}: {e}")
+            return None
+
+    def _remember(self, user_id, language):
+        if self.redis is None or user_id is None:
+            return
+        try:
+            self.redis.setex(f"lang:{user_id}", self.user_ttl, language)
+        except Exception as e:
+            logger.error(f"Failed to store last language for user_id {user_id}: {e}")
+
+    def classify(self, message):
+        """Return (language, confidence) for a message without any user fallback."""
+        key = self._digest(message)
+        result = self._memo_get(key)
+        if result is not None:
+            return result
+        result = fast_detect(message)
+        if result[1] < self.threshold:
+            try:
+                best = detect_langs(message)[0]
+                # langdetect is routinely "certain" about one or two words ('ok' -> 'sk').
+                prob = best.prob if len(_WORDS.findall(message)) >= SHORT_MESSAGE_WORDS else min(best.prob, 0.5)
+                result = (best.lang, prob)
+            except LangDetectException:
+                pass
+        self._memo_put(key, result)
+        return result
+
+    def detect(self, message, user_id=None, default='es'):
+        language, confidence = self.classify(message)
+        if language and confidence >= self.threshold:
+            if user_id is not None and self._user_language(user_id) != language:
+                self._remember(user_id, language)
+            return language
+        return self._user_language(user_id) or language or default
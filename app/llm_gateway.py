@@ -0,0 +1,281 @@
+import hashlib
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+
+import httpx
+import openai
+
+logger = logging.getLogger(__name__)
+
+# Seconds allowed per attempt (read timeout between chunks when streaming).
+MODEL_TIMEOUTS = {'gpt-4o': 30.0, 'gpt-3.5-turbo': 15.0}
+DEFAULT_TIMEOUT = 20.0
+FALLBACK_MODELS = {'gpt-4o': 'gpt-3.5-turbo'}
+
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError,
+    TimeoutError, ConnectionError,
+)
+
+
+def parse_model_map(value, cast=float):
+    """Parse 'gpt-4o=20,gpt-3.5-turbo=8' into {'gpt-4o': 20.0, 'gpt-3.5-turbo': 8.0}."""
+    result = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            model, setting = item.split('=', 1)
+            result[model.strip()] = cast(setting)
+    return result
+
+
+class OpenAIBackend:
+    """OpenAI API over a keep-alive connection pool. Retries are left to LLMGateway."""
+
+    # Set by LLMGateway.instrument(); called with (model, prompt_tokens, completion_tokens).
+    record_usage = None
+
+    def __init__(self, api_key=None, base_url=None, max_connections=100, max_keepalive=20,
+                 keepalive_expiry=30.0, connect_timeout=5.0):
+        self.connect_timeout = connect_timeout
+        self._settings = dict(api_key=api_key, base_url=base_url, max_connections=max_connections,
+                              max_keepalive=max_keepalive, keepalive_expiry=keepalive_expiry)
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """The OpenAI client, built on first use so importing the app stays cheap."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    settings = self._settings
+                    http_client = openai.DefaultHttpxClient(
+                        limits=httpx.Limits(max_connections=settings['max_connections'],
+                                            max_keepalive_connections=settings['max_keepalive'],
+                                            keepalive_expiry=settings['keepalive_expiry']),
+                        timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=self.connect_timeout),
+                    )
+                    self._client = openai.OpenAI(api_key=settings['api_key'], base_url=settings['base_url'],
+                                                 http_client=http_client, max_retries=0)
+        return self._client
+
+    def warmup(self):
+        return self.client
+
+    def _timeout(self, timeout):
+        return httpx.Timeout(timeout, connect=min(self.connect_timeout, timeout))
+
+    def complete(self, model, messages, timeout, **params):
+        response = self.client.chat.completions.create(
+            model=model, messages=messages, timeout=self._timeout(timeout), **params
+        )
+        if response.usage and self.record_usage:
+            self.record_usage(model, response.usage.prompt_tokens, response.usage.completion_tokens)
+        return response.choices[0].message.content
+
+    def stream(self, model, messages, timeout, **params):
+        """Open a streaming completion; the response headers have arrived when this returns."""
+        stream = self.client.chat.completions.create(
+            model=model, messages=messages, timeout=self._timeout(timeout), stream=True,
+            stream_options={'include_usage': True}, **params
+        )
+        return self._deltas(model, stream)
+
+    def _deltas(self, model, stream):
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                # With include_usage the final chunk has no choices, only token counts.
+                if getattr(chunk, 'usage', None) and self.record_usage:
+                    self.record_usage(model, chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+        finally:
+            stream.close()
+
+    def embed(self, model, text, timeout, dimensions=None):
+        kwargs = {'dimensions': dimensions} if dimensions else {}
+        response = self.client.embeddings.create(model=model, input=text, timeout=self._timeout(timeout), **kwargs)
+        return response.data[0].embedding
+
+
+class MockBackend:
+    """Deterministic offline backend for tests and benchmarks.
+
+    Replies and embeddings derive from a hash of the input. latency is seconds
+    per call, either a number or a {model: seconds} map; with slow_ratio set, that
+    share of calls (drawn from a seeded generator) takes slow_latency instead, to
+    model a long tail. A call slower than its timeout raises TimeoutError after
+    waiting the timeout, like a real one would.
+    """
+
+    record_usage = None
+
+    def __init__(self, latency=0.0, slow_ratio=0.0, slow_latency=2.0, seed=0):
+        self.latency = latency
+        self.slow_ratio = slow_ratio
+        self.slow_latency = slow_latency
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def warmup(self):
+        pass
+
+    def _delay(self, model):
+        latency = self.latency.get(model, 0.0) if isinstance(self.latency, dict) else self.latency
+        with self._lock:
+            slow = self._random.random() < self.slow_ratio
+        return max(latency, self.slow_latency) if slow else latency
+
+    def _wait(self, model, timeout):
+        delay = self._delay(model)
+        if delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"mock {model} timed out after {timeout:.2f}s")
+        time.sleep(delay)
+
+    @staticmethod
+    def reply(model, messages):
+        content = messages[-1]['content'] if messages else ''
+        if isinstance(content, list):
+            content = ' '.join(part.get('text', '') for part in content)
+        digest = hashlib.sha256(f"{model}\n{content}".encode('utf-8')).hexdigest()[:8]
+        return f"Respuesta simulada de {model} ({digest}): {content[-80:]}"
+
+    def _usage(self, model, messages, reply):
+        if self.record_usage:
+            prompt = sum(len(str(message.get('content', ''))) for message in messages)
+            self.record_usage(model, prompt // 4 + 1, len(reply) // 4 + 1)
+
+    def complete(self, model, messages, timeout, **params):
+        self._wait(model, timeout)
+        reply = self.reply(model, messages)
+        self._usage(model, messages, reply)
+        return reply
+
+    def stream(self, model, messages, timeout, **params):
+        self._wait(model, timeout)
+        reply = self.reply(model, messages)
+        self._usage(model, messages, reply)
+        words = reply.split(' ')
+        return (word if position == 0 else ' ' + word for position, word in enumerate(words))
+
+    def embed(self, model, text, timeout, dimensions=None):
+        generator = random.Random(hashlib.sha256(text.encode('utf-8')).digest())
+        return [generator.gauss(0, 1) for _ in range(dimensions or 256)]
+
+
+class LLMGateway:
+    """Single entry point for model calls.
+
+    Each attempt gets the model's timeout, failed attempts are retried with
+    jittered exponential backoff, and when a model keeps failing its fallback
+    (gpt-4o -> gpt-3.5-turbo) is tried, all within latency_budget seconds. The
+    primary model stops retrying early enough to leave the fallback one full
+    attempt. With hedge_after set, a non-streaming call that has not answered in
+    that many seconds is duplicated and whichever reply arrives first is used.
+    """
+
+    def __init__(self, backend, timeouts=None, fallbacks=None, retries=2, backoff=0.25,
+                 latency_budget=45.0, hedge_after=None, hedge_workers=16):
+        self.backend = backend
+        self.timeouts = {**MODEL_TIMEOUTS, **(timeouts or {})}
+        self.fallbacks = FALLBACK_MODELS if fallbacks is None else fallbacks
+        self.retries = retries
+        self.backoff = backoff
+        self.latency_budget = latency_budget
+        self.hedge_after = hedge_after
+        self.executor = ThreadPoolExecutor(hedge_workers, thread_name_prefix='llm-hedge') if hedge_after else None
+        self.metrics = {'calls': 0, 'retries': 0, 'fallbacks': 0, 'hedges': 0}
+        self._metrics_lock = threading.Lock()
+        self.observe = None
+
+    def instrument(self, observe=None, record_usage=None):
+        """Report each attempt as observe(model, outcome, seconds) and token usage per model."""
+        self.observe = observe
+        self.backend.record_usage = record_usage
+
+    def _count(self, name):
+        with self._metrics_lock:
+            self.metrics[name] += 1
+
+    def stats(self):
+        with self._metrics_lock:
+            return dict(self.metrics)
+
+    def timeout_for(self, model):
+        return self.timeouts.get(model, DEFAULT_TIMEOUT)
+
+    def complete(self, model, messages, **params):
+        """Return (text, model that answered)."""
+        call = self._hedged_complete if self.executor else self.backend.complete
+        return self._call(call, model, messages, **params)
+
+    def stream(self, model, messages, **params):
+        """Return (iterator of text deltas, model that answered). Only opening the stream is retried."""
+        return self._call(self.backend.stream, model, messages, **params)
+
+    def embed(self, model, text, dimensions=None):
+        return self._call(self.backend.embed, model, text, fallback=False, dimensions=dimensions)[0]
+
+    def _call(self, func, model, payload, fallback=True, **params):
+        self._count('calls')
+        deadline = time.monotonic() + self.latency_budget
+        chain = [model]
+        if fallback and self.fallbacks.get(model):
+            chain.append(self.fallbacks[model])
+        last_error = None
+        for position, candidate in enumerate(chain):
+            reserve = self.timeout_for(chain[position + 1]) if position + 1 < len(chain) else 0.0
+            for attempt in range(self.retries + 1):
+                remaining = deadline - time.monotonic() - reserve
+                if remaining <= 0:
+                    break
+                started = time.perf_counter()
+                try:
+                    result = func(candidate, payload, timeout=min(self.timeout_for(candidate), remaining), **params)
+                except RETRYABLE_ERRORS as e:
+                    self._observe(candidate, 'retryable_error', started)
+                    last_error = e
+                    logger.warning(f"LLM call to {candidate} failed (attempt {attempt + 1}): {e}")
+                    if attempt < self.retries:
+                        self._count('retries')
+                        self._sleep(attempt, deadline - time.monotonic() - reserve)
+                    continue
+                except Exception:
+                    self._observe(candidate, 'error', started)
+                    raise
+                self._observe(candidate, 'ok', started)
+                if candidate != model:
+                    self._count('fallbacks')
+                    logger.warning(f"LLM fell back from {model} to {candidate}")
+                return result, candidate
+        raise last_error or TimeoutError(f"LLM latency budget exhausted for {model}")
+
+    def _observe(self, model, outcome, started):
+        if self.observe:
+            self.observe(model, outcome, time.perf_counter() - started)
+
+    def _sleep(self, attempt, remaining):
+        # Full jitter: spreads retries from many workers instead of synchronising them.
+        delay = random.uniform(0, self.backoff * (2 ** attempt))
+        if 0 < delay < remaining:
+            time.sleep(delay)
+
+    def _hedged_complete(self, model, messages, timeout, **params):
+        started = time.monotonic()
+        futures = [self.executor.submit(self.backend.complete, model, messages, timeout, **params)]
+        done, _ = wait(futures, timeout=min(self.hedge_after, timeout))
+        remaining = timeout - (time.monotonic() - started)
+        if not done and remaining > 0:
+            self._count('hedges')
+            futures.append(self.executor.submit(self.backend.complete, model, messages, remaining, **params))
+        error = None
+        for future in as_completed(futures):
+            try:
+                return future.result()
+            except Exception as e:
+                error = e
+        raise error
@@ -0,0 +1,151 @@
+import json
+import logging
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Prompt tokens reserved for conversation history, per model.
+MODEL_TOKEN_BUDGETS = {
+    'gpt-3.5-turbo': 1500,
+    'gpt-4o': 4000,
+}
+DEFAULT_TOKEN_BUDGET = 1500
+SUMMARY_TOKEN_BUDGET = 300
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for es/en/fr text)."""
+    return len(text) // 4 + 1
+
+
+def truncate_to_tokens(text, budget):
+    """Keep the most recent part of text that fits in the token budget."""
+    max_chars = budget * 4
+    return text if len(text) <= max_chars else text[-max_chars:]
+
+
+def extractive_summary(previous, turns):
+    """Fallback summariser: append the dropped turns to the running summary."""
+    lines = [previous] if previous else []
+    lines.extend(f"Usuario: {turn['user']} | Asistente: {turn['assistant']}" for turn in turns)
+    return truncate_to_tokens("\n".join(lines), SUMMARY_TOKEN_BUDGET)
+
+
+class ConversationMemory:
+    """Per-user conversation window kept in Redis and updated on every write.
+
+    Each user's memory is one JSON document holding the running summary and an
+    ordered list of recent turns, so assembling a prompt is a single GET. Turns
+    that fall out of the token budget are folded into the summary.
+    """
+
+    def __init__(self, redis_client, summarize=None, ttl=7 * 24 * 3600, max_turns=50):
+        self.redis = redis_client
+        self.summarize = summarize or extractive_summary
+        self.ttl = ttl
+        self.max_turns = max_turns
+
+    def _key(self, user_id):
+        return f"memory:{user_id}"
+
+    @staticmethod
+    def budget(model):
+        return MODEL_TOKEN_BUDGETS.get(model, DEFAULT_TOKEN_BUDGET)
+
+    def _load(self, user_id, loader=None):
+        raw = self.redis.get(self._key(user_id))
+        if raw:
+            return json.loads(raw)
+        memory = {'summary': '', 'turns': []}
+        if loader:
+            memory['turns'] = [self._turn(user, assistant) for user, assistant in loader()]
+            self.redis.setex(self._key(user_id), self.ttl, json.dumps(memory))
+        return memory
+
+    @staticmethod
+    def _turn(user_message, ai_response):
+        return {
+            'user': user_message,
+            'assistant': ai_response,
+            'tokens': estimate_tokens(user_message) + estimate_tokens(ai_response)
+        }
+
+    def messages(self, user_id, model, loader=None):
+        """Chat messages (summary first, then turns oldest to newest) within the model budget.
+
+        loader is only called on a cold cache and must return (user_message, ai_response)
+        pairs in chronological order.
+        """
+        try:
+            memory = self._load(user_id, loader)
+        except Exception as e:
+            logger.error(f"Failed to load conversation memory for user_id {user_id}: {e}")
+            return []
+        budget = self.budget(model)
+        window = []
+        for turn in reversed(memory['turns']):
+            if turn['tokens'] > budget:
+                break
+            budget -= turn['tokens']
+            window.append(turn)
+        messages = []
+        if memory['summary']:
+            messages.append({'role': 'system', 'content': f"Resumen de la conversación previa: {memory['summary']}"})
+        for turn in reversed(window):
+            messages.append({'role': 'user', 'content': turn['user']})
+            messages.append({'role': 'assistant', 'content': turn['assistant']})
+        return messages
+
+    def append(self, user_id, model, user_message, ai_response):
+        """Record a finished exchange, folding overflow turns into the summary.
+
+        Summarising can be a model call, so it runs with no WATCH held. The memory
+        is then re-read and the summary applied only if the same turns overflow
+        from the same previous summary; otherwise it is recomputed.
+        """
+        key = self._key(user_id)
+        turn = self._turn(user_message, ai_response)
+        folded = None  # (previous summary, overflow turns, new summary)
+        try:
+            with self.redis.pipeline() as pipe:
+                while True:
+                    try:
+                        pipe.watch(key)
+                        raw = pipe.get(key)
+                        memory = json.loads(raw) if raw else {'summary': '', 'turns': []}
+                        memory['turns'].append(turn)
+                        overflow = self._trim(memory['turns'], self.budget(model))
+                        if overflow:
+                            if folded is None or folded[:2] != (memory['summary'], overflow):
+                                pipe.reset()
+                                folded = (memory['summary'], overflow, self.summarize(memory['summary'], overflow))
+                                continue
+                            memory['summary'] = folded[2]
+                        pipe.multi()
+                        pipe.setex(key, self.ttl, json.dumps(memory))
+                        pipe.execute()
+                        return
+                    except redis.WatchError:
+                        continue
+        except Exception as e:
+            logger.error(f"Failed to update conversation memory for user_id {user_id}: {e}")
+            self.forget(user_id)
+
+    def _trim(self, turns, budget):
+        """Drop the oldest turns beyond the budget or turn cap and return them."""
+        total = sum(turn['tokens'] for turn in turns)
+        cut = 0
+        while cut < len(turns) - 1 and (total > budget or len(turns) - cut > self.max_turns):
+            total -= turns[cut]['tokens']
+            cut += 1
+        overflow = turns[:cut]
+        del turns[:cut]
+        return overflow
+
+    def forget(self, user_id):
+        """Drop the cached memory so it is rebuilt from the database on next use."""
+        try:
+            self.redis.delete(self._key(user_id))
+        except Exception as e:
+            logger.error(f"Failed to reset conversation memory for user_id {user_id}: {e}")
@@ -0,0 +1,210 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for pg_advisory_xact_lock so only one worker migrates at a time.
+MIGRATION_LOCK_ID = 0x1A0D0C4E
+
+# Ordered list of (version, name, statements). Never edit an applied migration;
+# append a new one instead.
+MIGRATIONS = [
+    (1, "initial schema", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            password BYTEA NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_profiles (
+            user_id INTEGER PRIMARY KEY REFERENCES users(id),
+            avatar VARCHAR(255),
+            bio TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS conversations (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id),
+            user_message TEXT NOT NULL,
+            ai_response TEXT NOT NULL,
+            file_url VARCHAR(255),
+            file_name VARCHAR(100),
+            avatar VARCHAR(255),
+            edited BOOLEAN DEFAULT FALSE,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
+        """
+        CREATE TABLE IF NOT EXISTS user_preferences (
+            user_id INTEGER PRIMARY KEY REFERENCES users(id),
+            model VARCHAR(50) DEFAULT 'gpt-3.5-turbo',
+            tone VARCHAR(50) DEFAULT 'formal',
+            language VARCHAR(10) DEFAULT 'auto'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS conversation_context (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id),
+            key VARCHAR(100) NOT NULL,
+            value TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS tasks (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id),
+            description TEXT NOT NULL,
+            scheduled_time TIMESTAMP NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS achievements (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id),
+            name VARCHAR(100) NOT NULL,
+            description TEXT NOT NULL,
+            achieved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (2, "indexes for hot query paths", [
+        # /history pages and conversation memory seeding: user_id = ? ORDER BY timestamp, id
+        "CREATE INDEX IF NOT EXISTS idx_conversations_user_timestamp ON conversations (user_id, timestamp, id)",
+        # /history?since= delta sync
+        "CREATE INDEX IF NOT EXISTS idx_conversations_user_updated ON conversations (user_id, updated_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_context_user_timestamp ON conversation_context (user_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_scheduled_time ON tasks (scheduled_time)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user ON tasks (user_id)",
+        # Keep the oldest copy of any duplicated badge before enforcing uniqueness.
+        """
+        DELETE FROM achievements a USING achievements b
+        WHERE a.user_id = b.user_id AND a.name = b.name AND a.id > b.id
+        """,
+        "ALTER TABLE achievements ADD CONSTRAINT achievements_user_name_key UNIQUE (user_id, name)",
+    ]),
+    (3, "materialized per-user counters", [
+        """
+        CREATE TABLE IF NOT EXISTS user_counters (
+            user_id INTEGER REFERENCES users(id),
+            name VARCHAR(50) NOT NULL,
+            value BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, name)
+        )
+        """,
+        """
+        INSERT INTO user_counters (user_id, name, value)
+        SELECT user_id, 'messages', COUNT(*) FROM conversations
+        WHERE user_id IS NOT NULL GROUP BY user_id
+        ON CONFLICT (user_id, name) DO NOTHING
+        """,
+    ]),
+    (4, "bounded per-user context store", [
+        """
+        CREATE TABLE IF NOT EXISTS user_context (
+            user_id INTEGER REFERENCES users(id),
+            kind VARCHAR(20) NOT NULL,
+            value TEXT NOT NULL,
+            last_seen TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, kind, value)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_user_context_last_seen ON user_context (user_id, last_seen)",
+        # Carry over each user's 20 most recently mentioned entities (ContextStore's default cap).
+        # conversation_context is no longer written after this migration.
+        """
+        INSERT INTO user_context (user_id, kind, value, last_seen)
+        SELECT user_id, kind, value, last_seen FROM (
+            SELECT c.user_id, c.key AS kind, e.value, MAX(c.timestamp) AS last_seen,
+                   row_number() OVER (PARTITION BY c.user_id ORDER BY MAX(c.timestamp) DESC) AS rank
+            FROM conversation_context c
+            CROSS JOIN LATERAL json_array_elements_text(
+                CASE WHEN json_typeof(c.value::json) = 'array' THEN c.value::json
+                     ELSE json_build_array(c.value::json #>> '{}') END
+            ) AS e(value)
+            WHERE c.user_id IS NOT NULL AND c.key IN ('names', 'dates')
+            GROUP BY c.user_id, c.key, e.value
+        ) ranked
+        WHERE rank <= 20
+        ON CONFLICT DO NOTHING
+        """,
+    ]),
+    (5, "full-text search over conversations", [
+        # Text search configuration for a detected language code; unknown codes get 'simple'.
+        """
+        CREATE OR REPLACE FUNCTION search_config(language VARCHAR) RETURNS regconfig
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT (CASE language WHEN 'es' THEN 'spanish' WHEN 'en' THEN 'english'
+                                  WHEN 'fr' THEN 'french' ELSE 'simple' END)::regconfig
+        $$
+        """,
+        "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS language VARCHAR(10)",
+        # Recomputed by Postgres whenever a message is inserted or edited. Adding it rewrites
+        # the table once; rows written before this migration have no language and use 'simple'.
+        """
+        ALTER TABLE conversations ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector(search_config(language), user_message), 'A') ||
+            setweight(to_tsvector(search_config(language), ai_response), 'B')
+        ) STORED
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_conversations_search ON conversations USING GIN (search_vector)",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(cur):
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return cur.fetchone()[0]
+
+
+def migrate(conn, target=None):
+    """Apply pending migrations up to target (default: latest) and return the new version.
+
+    Creating the version table and each migration run in their own transaction
+    under an advisory lock, so several workers booting at once apply them exactly once.
+    """
+    target = LATEST_VERSION if target is None else target
+    with conn.cursor() as cur:
+        # Bootstrap the version table under the same lock: concurrent CREATE TABLE IF
+        # NOT EXISTS statements can still collide on the catalog's unique indexes.
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(200) NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.commit()
+
+        version = 0
+        for migration_version, name, statements in MIGRATIONS:
+            if migration_version > target:
+                break
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            version = current_version(cur)
+            if migration_version <= version:
+                conn.commit()
+                continue
+            try:
+                for statement in statements:
+                    cur.execute(statement)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                    (migration_version, name)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                logger.error(f"Migration {migration_version} ({name}) failed")
+                raise
+            version = migration_version
+            logger.info(f"Applied migration {migration_version}: {name}")
+    return version
@@ -0,0 +1,91 @@
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+from admission import Rejected, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+def hash_rounds(hashed):
+    """Work factor of a bcrypt hash ('$2b$12$...' -> 12)."""
+    return int(hashed.split(b'$')[2])
+
+
+def hash_password(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def verify_password(password, hashed, rounds):
+    """Check password; return (ok, new hash if the stored one used another work factor)."""
+    if not bcrypt.checkpw(password, hashed):
+        return False, None
+    if hash_rounds(hashed) != rounds:
+        return True, hash_password(password, rounds)
+    return True, None
+
+
+class PasswordHasher:
+    """bcrypt off the request thread, on a bounded process pool.
+
+    Each hash is ~250 ms of CPU at the default work factor, so doing it inline
+    lets a login burst starve chat traffic in the same worker. At most
+    max_pending hashes are queued or running per process; beyond that requests
+    are rejected instead of piling up. offload, when given, replaces the pool
+    (eventlet.tpool.execute under cooperative workers; bcrypt releases the GIL).
+    """
+
+    def __init__(self, rounds=12, max_workers=2, max_pending=16, timeout=10.0, offload=None):
+        self.rounds = rounds
+        self.timeout = timeout
+        self.offload = offload
+        self.executor = None if offload else ProcessPoolExecutor(max_workers)
+        self._pending = threading.BoundedSemaphore(max_pending)
+
+    def warmup(self):
+        """Start the worker processes now, before the app starts any threads."""
+        if self.executor:
+            self.executor.submit(hash_rounds, b'$2b$04$').result()
+
+    def _run(self, func, *args):
+        if not self._pending.acquire(blocking=False):
+            logger.warning("Shedding authentication request: hashing backlog full")
+            raise Rejected('auth_busy', 1)
+        try:
+            if self.offload:
+                return self.offload(func, *args)
+            return self.executor.submit(func, *args).result(timeout=self.timeout)
+        finally:
+            self._pending.release()
+
+    def hash(self, password):
+        return self._run(hash_password, password.encode('utf-8'), self.rounds)
+
+    def verify(self, password, hashed):
+        """Return (ok, new hash or None); store the new hash when it is given."""
+        return self._run(verify_password, password.encode('utf-8'), bytes(hashed), self.rounds)
+
+
+class LoginThrottle:
+    """Per-IP and per-username attempt limits, checked before any hashing is done.
+
+    enabled=False turns check() into a no-op, for load tests that register many
+    users from one machine.
+    """
+
+    def __init__(self, redis_client, user_rate, user_burst, ip_rate, ip_burst, enabled=True):
+        self.enabled = enabled
+        self.user_bucket = TokenBucket(redis_client, user_rate, user_burst, 'ratelimit:login:user:')
+        self.ip_bucket = TokenBucket(redis_client, ip_rate, ip_burst, 'ratelimit:login:ip:')
+
+    def check(self, ip, username=None):
+        if not self.enabled:
+            return
+        wait = self.ip_bucket.take(ip)
+        if wait <= 0 and username:
+            wait = self.user_bucket.take(username.lower()[:64])
+        if wait > 0:
+            logger.warning(f"Throttled authentication attempt from {ip} for username: {username}")
+            raise Rejected('login_rate', wait)
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+_TRAILING_PUNCTUATION = re.compile(r'[\s.!?¿¡,;:]+$')
+_LEADING_PUNCTUATION = re.compile(r'^[\s¿¡]+')
+
+
+def normalize_prompt(message):
+    """Canonical form of a prompt: NFKC, lowercase, single spaces, no edge punctuation."""
+    text = unicodedata.normalize('NFKC', message).lower()
+    text = _WHITESPACE.sub(' ', text)
+    text = _LEADING_PUNCTUATION.sub('', text)
+    return _TRAILING_PUNCTUATION.sub('', text)
+
+
+def prompt_digest(message, model, tone, language):
+    """Stable SHA-256 digest over everything that changes the answer."""
+    payload = "\x1f".join([normalize_prompt(message), model or '', tone or '', language or ''])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SemanticIndex:
+    """In-process vector index with TTL and LRU eviction, partitioned by scope.
+
+    Vectors are L2-normalised on insert so cosine similarity is a dot product.
+    """
+
+    def __init__(self, max_entries=5000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # digest -> (scope, vector, expires_at)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, scope, digest, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return
+        with self._lock:
+            self._entries[digest] = (scope, vector / norm, time.time() + self.ttl)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, digest):
+        with self._lock:
+            self._entries.pop(digest, None)
+
+    def nearest(self, scope, vector, threshold):
+        """Return (digest, similarity) of the closest live entry in scope, or None."""
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if not norm:
+            return None
+        query = query / norm
+        now = time.time()
+        with self._lock:
+            expired = [d for d, (_, _, expires_at) in self._entries.items() if expires_at <= now]
+            for digest in expired:
+                del self._entries[digest]
+            candidates = [(d, v) for d, (s, v, _) in self._entries.items() if s == scope]
+            if not candidates:
+                return None
+            scores = np.stack([v for _, v in candidates]) @ query
+            best = int(np.argmax(scores))
+            if scores[best] < threshold:
+                return None
+            digest = candidates[best][0]
+            self._entries.move_to_end(digest)
+            return digest, float(scores[best])
+
+
+class ResponseCache:
+    """Two-tier chat response cache.
+
+    The exact tier keys Redis by a stable digest of the normalised prompt, model,
+    tone and language. The optional semantic tier maps near-duplicate prompts onto
+    an existing exact entry through embedding similarity.
+
+    The embedding computed by a missed lookup is kept (for up to max_pending
+    prompts) and reused by the set() that follows, so a miss costs one
+    embedding call rather than two.
+    """
+
+    def __init__(self, redis_client, ttl=3600, embed=None, threshold=0.92, max_entries=5000, scope='user',
+                 max_pending=1024):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.embed = embed
+        self.threshold = threshold
+        self.scope = scope
+        self.index = SemanticIndex(max_entries=max_entries, ttl=ttl) if embed else None
+        self._stats = {'exact_hits': 0, 'semantic_hits': 0, 'misses': 0}
+        self._stats_lock = threading.Lock()
+        self.max_pending = max_pending
+        self._pending = OrderedDict()  # (scope, digest) -> vector of a missed lookup
+        self._pending_lock = threading.Lock()
+
+    def _scope(self, user_id, model, tone, language):
+        owner = str(user_id) if self.scope == 'user' else '*'
+        return f"{owner}:{model}:{tone}:{language}"
+
+    def _key(self, user_id, digest):
+        owner = str(user_id) if self.scope == 'user' else 'global'
+        return f"chat:{owner}:{digest}"
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = sum(stats.values())
+        stats['hit_ratio'] = (stats['exact_hits'] + stats['semantic_hits']) / lookups if lookups else 0.0
+        stats['semantic_entries'] = len(self.index) if self.index else 0
+        return stats
+
+    def get(self, user_id, message, model, tone, language):
+        """Return the cached response payload for a prompt, or None."""
+        digest = prompt_digest(message, model, tone, language)
+        try:
+            cached = self.redis.get(self._key(user_id, digest))
+            if cached:
+                self._count('exact_hits')
+                return json.loads(cached)
+            if self.index is not None:
+                scope = self._scope(user_id, model, tone, language)
+                vector = self.embed(normalize_prompt(message))
+                match = self.index.nearest(scope, vector, self.threshold)
+                if match:
+                    cached = self.redis.get(self._key(user_id, match[0]))
+                    if cached:
+                        self._count('semantic_hits')
+                        logger.info(f"Semantic cache hit for user_id: {user_id} (similarity {match[1]:.3f})")
+                        return json.loads(cached)
+                    self.index.discard(match[0])
+                self._remember(scope, digest, vector)
+        except Exception as e:
+            logger.error(f"Response cache lookup failed: {e}")
+        self._count('misses')
+        return None
+
+    def _remember(self, scope, digest, vector):
+        with self._pending_lock:
+            self._pending[(scope, digest)] = vector
+            self._pending.move_to_end((scope, digest))
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+
+    def _take(self, scope, digest):
+        with self._pending_lock:
+            return self._pending.pop((scope, digest), None)
+
+    def set(self, user_id, message, model, tone, language, response_data):
+        digest = prompt_digest(message, model, tone, language)
+        try:
+            self.redis.setex(self._key(user_id, digest), self.ttl, json.dumps(response_data))
+            if self.index is not None:
+                scope = self._scope(user_id, model, tone, language)
+                vector = self._take(scope, digest)
+                if vector is None:
+                    vector = self.embed(normalize_prompt(message))
+                self.index.add(scope, digest, vector)
+        except Exception as e:
+            logger.error(f"Response cache store failed: {e}")
@@ -0,0 +1,132 @@
+import logging
+import os
+import threading
+import uuid
+
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+
+logger = logging.getLogger(__name__)
+
+JOBS_TABLE = 'apscheduler_jobs'
+
+_handlers = {}
+
+
+def dispatch(handler, *args):
+    """Job entry point. Jobs reference handlers by name so stored jobs survive
+    refactors and work whatever module name the app was started under."""
+    _handlers[handler](*args)
+
+
+def sqlalchemy_url(database_url):
+    """SQLAlchemy only accepts the postgresql:// scheme."""
+    if database_url and database_url.startswith('postgres://'):
+        return 'postgresql://' + database_url[len('postgres://'):]
+    return database_url
+
+
+class SchedulerService:
+    """One process-wide scheduler backed by a shared job store.
+
+    Every worker starts the scheduler paused so it can add and remove jobs in
+    the shared store, but only the worker holding the Redis leader lock resumes
+    it and actually fires jobs. The leader renews the lock on a heartbeat; if it
+    dies the lock expires and another worker takes over.
+    """
+
+    def __init__(self, redis_client, jobstore_url=None, lock_key='scheduler:leader',
+                 lock_ttl=30, heartbeat=10, max_workers=10, misfire_grace_time=300):
+        self.redis = redis_client
+        self.lock_key = lock_key
+        self.lock_ttl = lock_ttl
+        self.heartbeat = heartbeat
+        self.node_id = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._stop = threading.Event()
+        jobstore = SQLAlchemyJobStore(url=sqlalchemy_url(jobstore_url), tablename=JOBS_TABLE) \
+            if jobstore_url else MemoryJobStore()
+        self.scheduler = BackgroundScheduler(
+            jobstores={'default': jobstore},
+            executors={'default': ThreadPoolExecutor(max_workers)},
+            job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': misfire_grace_time}
+        )
+
+    def register(self, name, func):
+        _handlers[name] = func
+
+    def start(self):
+        if self.scheduler.running:
+            return
+        self.scheduler.start(paused=True)
+        self._renew_leadership()
+        threading.Thread(target=self._heartbeat_loop, name='scheduler-heartbeat', daemon=True).start()
+        logger.info(f"Scheduler started on node {self.node_id} (leader: {self.is_leader})")
+
+    def shutdown(self):
+        self._stop.set()
+        if self.is_leader:
+            self._release_leadership()
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat):
+            self._renew_leadership()
+            if self.is_leader:
+                # Pick up jobs other workers added to the shared store since the last wakeup.
+                self.scheduler.wakeup()
+
+    def _renew_leadership(self):
+        try:
+            if self.is_leader:
+                holder = self.redis.get(self.lock_key)
+                leader = holder == self.node_id and self.redis.expire(self.lock_key, self.lock_ttl)
+            else:
+                leader = bool(self.redis.set(self.lock_key, self.node_id, nx=True, ex=self.lock_ttl))
+        except Exception as e:
+            logger.error(f"Scheduler leader lock check failed: {e}")
+            leader = False
+        if leader and not self.is_leader:
+            self.scheduler.resume()
+            logger.info(f"Node {self.node_id} became scheduler leader")
+        elif not leader and self.is_leader:
+            self.scheduler.pause()
+            logger.warning(f"Node {self.node_id} lost scheduler leadership")
+        self.is_leader = bool(leader)
+
+    def _release_leadership(self):
+        try:
+            if self.redis.get(self.lock_key) == self.node_id:
+                self.redis.delete(self.lock_key)
+        except Exception as e:
+            logger.error(f"Failed to release scheduler leader lock: {e}")
+        self.is_leader = False
+
+    @staticmethod
+    def task_job_id(task_id):
+        return f"task:{task_id}"
+
+    def schedule_task(self, task_id, run_date, *args):
+        """Schedule a one-off reminder; rescheduling the same task replaces its job."""
+        self.scheduler.add_job(
+            dispatch, 'date', run_date=run_date, args=['notify_task', *args],
+            id=self.task_job_id(task_id), replace_existing=True
+        )
+
+    def remove_task(self, task_id):
+        try:
+            self.scheduler.remove_job(self.task_job_id(task_id))
+        except JobLookupError:
+            pass
+
+    def schedule_now(self, name, job_id, *args):
+        """Queue a one-off handler to run as soon as the leader picks it up."""
+        self.scheduler.add_job(dispatch, 'date', args=[name, *args], id=job_id, replace_existing=True)
+
+    def schedule_interval(self, name, **trigger_args):
+        """Schedule a recurring handler; one job per name across all workers."""
+        self.scheduler.add_job(dispatch, 'interval', args=[name], id=name, replace_existing=True, **trigger_args)
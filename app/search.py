@@ -0,0 +1,44 @@
+from markupsafe import escape
+
+# ts_headline marks matches with these, so the text can be HTML-escaped before they become <mark>.
+HIGHLIGHT_START, HIGHLIGHT_STOP = '\x02', '\x03'
+HIGHLIGHT_OPTIONS = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxWords=30, MinWords=10, MaxFragments=2"
+
+# Matches are ranked over search_vector (GIN-indexed) first; the costlier ts_headline
+# only runs on the rows of the requested page. Each row is matched against the query
+# parsed with its own language's configuration, the one its search_vector was built
+# with, so stemming and -term exclusions hold whatever language the query looks like.
+# That per-row tsquery can't use the index, so candidates are first found through the
+# OR of the query parsed with every configuration search_config() returns.
+SEARCH_SQL = """
+    WITH q AS (
+        SELECT websearch_to_tsquery('spanish', %(query)s) AS spanish,
+               websearch_to_tsquery('english', %(query)s) AS english,
+               websearch_to_tsquery('french', %(query)s) AS french,
+               websearch_to_tsquery('simple', %(query)s) AS simple
+    ), candidates AS (
+        SELECT c.id, c.user_message, c.ai_response, c.timestamp, c.language, c.search_vector,
+               websearch_to_tsquery(search_config(c.language), %(query)s) AS query
+        FROM conversations c, q
+        WHERE c.user_id = %(user_id)s
+          AND (c.search_vector @@ q.spanish OR c.search_vector @@ q.english
+               OR c.search_vector @@ q.french OR c.search_vector @@ q.simple)
+    ), page AS (
+        SELECT id, user_message, ai_response, timestamp, language, query,
+               ts_rank_cd(search_vector, query) AS rank
+        FROM candidates
+        WHERE search_vector @@ query
+        ORDER BY rank DESC, id DESC
+        LIMIT %(limit)s OFFSET %(offset)s
+    )
+    SELECT p.id, p.timestamp, p.rank,
+           ts_headline(search_config(p.language), p.user_message, p.query, %(options)s),
+           ts_headline(search_config(p.language), p.ai_response, p.query, %(options)s)
+    FROM page p
+    ORDER BY p.rank DESC, p.id DESC
+"""
+
+
+def highlight(fragment):
+    """HTML-escape a ts_headline fragment and turn its match markers into <mark> tags."""
+    return str(escape(fragment)).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_STOP, '</mark>')
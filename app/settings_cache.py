@@ -0,0 +1,177 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {'model': 'gpt-3.5-turbo', 'tone': 'formal', 'language': 'auto', 'avatar': None, 'bio': ''}
+INVALIDATION_CHANNEL = 'settings:changed'
+
+
+def fetch_settings(cur, user_id):
+    """Preferences and profile for one user, with defaults for missing rows."""
+    cur.execute(
+        "SELECT p.model, p.tone, p.language, pr.avatar, pr.bio, pr.user_id IS NOT NULL FROM users u "
+        "LEFT JOIN user_preferences p ON p.user_id = u.id "
+        "LEFT JOIN user_profiles pr ON pr.user_id = u.id WHERE u.id = %s",
+        (user_id,)
+    )
+    row = cur.fetchone()
+    if not row:
+        return dict(DEFAULT_SETTINGS)
+    return {
+        'model': row[0] or DEFAULT_SETTINGS['model'],
+        'tone': row[1] or DEFAULT_SETTINGS['tone'],
+        'language': row[2] or DEFAULT_SETTINGS['language'],
+        'avatar': row[3],
+        'bio': row[4] if row[5] else DEFAULT_SETTINGS['bio'],
+    }
+
+
+class SettingsCache:
+    """Per-user settings in an in-process LRU in front of Redis.
+
+    Every write bumps a per-user version counter in Redis, overwrites the cached
+    entry and publishes the new version, so each worker drops its local copy
+    straight away. Entries filled from the database carry the version read
+    before the query, and are only stored if no newer version exists: a read
+    that raced a write can't put old settings back. The local tier is used only
+    while this worker is subscribed to invalidations; otherwise reads go to Redis.
+
+    Subscribing, losing the subscription and invalidate() each start a new
+    epoch. A read or write stores its result locally only if the epoch it
+    started in is still current, so an entry read before a purge can't
+    reappear after it when that purge covered a missed invalidation.
+    """
+
+    def __init__(self, redis_client, max_entries=10000, ttl=3600, channel=INVALIDATION_CHANNEL):
+        self.redis = redis_client
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.channel = channel
+        self._local = OrderedDict()
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self._subscribed = False
+        self._listener = None
+        self.metrics = {'local_hits': 0, 'redis_hits': 0, 'misses': 0, 'invalidations': 0}
+
+    @staticmethod
+    def _key(user_id):
+        return f"settings:{user_id}"
+
+    @staticmethod
+    def _version_key(user_id):
+        return f"settings:version:{user_id}"
+
+    def start(self):
+        """Subscribe to invalidations from other workers (idempotent)."""
+        if self._listener is None:
+            self._listener = threading.Thread(target=self._listen, name='settings-invalidation', daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                with self._lock:
+                    self._epoch += 1
+                    self._subscribed = True
+                for message in pubsub.listen():
+                    user_id, version = message['data'].split(':')
+                    self._evict(int(user_id), int(version))
+            except Exception as e:
+                logger.error(f"Settings invalidation listener failed: {e}")
+            finally:
+                # Missed messages would leave stale local copies; start over empty.
+                with self._lock:
+                    self._subscribed = False
+                    self._epoch += 1
+                    self._local.clear()
+            time.sleep(1)
+
+    def _evict(self, user_id, version):
+        with self._lock:
+            self._latest[user_id] = max(version, self._latest.get(user_id, 0))
+            entry = self._local.get(user_id)
+            if entry and entry[0] < version:
+                del self._local[user_id]
+                self.metrics['invalidations'] += 1
+
+    def _remember(self, user_id, version, settings, epoch):
+        with self._lock:
+            if not self._subscribed or epoch != self._epoch or version < self._latest.get(user_id, 0):
+                return
+            entry = self._local.get(user_id)
+            if entry and entry[0] > version:
+                return
+            self._local[user_id] = (version, settings)
+            self._local.move_to_end(user_id)
+            if len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def get(self, user_id, loader):
+        """Return the user's settings; loader() reads them from the database on a miss."""
+        with self._lock:
+            epoch = self._epoch
+            if self._subscribed:
+                entry = self._local.get(user_id)
+                if entry:
+                    self._local.move_to_end(user_id)
+                    self.metrics['local_hits'] += 1
+                    return dict(entry[1])
+        try:
+            cached, version = self.redis.mget(self._key(user_id), self._version_key(user_id))
+            if cached:
+                entry = json.loads(cached)
+                self.metrics['redis_hits'] += 1
+                self._remember(user_id, entry['version'], entry['settings'], epoch)
+                return dict(entry['settings'])
+        except Exception as e:
+            logger.error(f"Settings cache lookup failed for user_id {user_id}: {e}")
+            return loader()
+        self.metrics['misses'] += 1
+        settings = loader()
+        version = int(version or 0)
+        try:
+            # NX: a concurrent write-through may already have stored newer settings.
+            self.redis.set(self._key(user_id), json.dumps({'version': version, 'settings': settings}),
+                           ex=self.ttl, nx=True)
+        except Exception as e:
+            logger.error(f"Settings cache store failed for user_id {user_id}: {e}")
+        self._remember(user_id, version, settings, epoch)
+        return dict(settings)
+
+    def put(self, user_id, settings):
+        """Write through after the database commit and notify the other workers."""
+        with self._lock:
+            epoch = self._epoch
+        try:
+            version = self.redis.incr(self._version_key(user_id))
+            pipe = self.redis.pipeline()
+            pipe.set(self._key(user_id), json.dumps({'version': version, 'settings': settings}), ex=self.ttl)
+            pipe.publish(self.channel, f"{user_id}:{version}")
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Settings write-through failed for user_id {user_id}: {e}")
+            self.invalidate(user_id)
+            return
+        self._evict(user_id, version)
+        self._remember(user_id, version, settings, epoch)
+
+    def invalidate(self, user_id):
+        try:
+            self.redis.delete(self._key(user_id))
+        except Exception as e:
+            logger.error(f"Settings cache invalidation failed for user_id {user_id}: {e}")
+        with self._lock:
+            self._epoch += 1
+            self._local.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._local), 'subscribed': int(self._subscribed), **self.metrics}
@@ -0,0 +1,62 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def retry(func, what, attempts=8, backoff=0.5, max_backoff=8.0):
+    """Call func until it succeeds, sleeping backoff, 2*backoff, ... (capped) between attempts.
+
+    Used for dependencies that may still be booting alongside us (Postgres and
+    Redis on a cold start). The last error is raised after `attempts` tries.
+    """
+    delay = backoff
+    for attempt in range(1, attempts + 1):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == attempts:
+                logger.error(f"{what} failed after {attempts} attempts: {e}")
+                raise
+            logger.warning(f"{what} failed (attempt {attempt}/{attempts}), retrying in {delay:.1f}s: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, max_backoff)
+
+
+class Warmup:
+    """Runs the named startup steps once and records how long each took.
+
+    The process is live as soon as it serves requests; it is ready only after
+    every step has succeeded. A failed step leaves it unready with the error
+    recorded, so an orchestrator keeps traffic away and can restart it.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.steps = {}
+        self.ready = False
+        self.error = None
+        self._lock = threading.Lock()
+        self._ran = False
+
+    def run(self, steps):
+        with self._lock:
+            if self._ran:
+                return
+            self._ran = True
+        for name, func in steps:
+            started = time.perf_counter()
+            try:
+                func()
+            except Exception as e:
+                self.error = f"{name}: {e}"
+                logger.error(f"Warmup step {name} failed: {e}")
+                return
+            self.steps[name] = round(time.perf_counter() - started, 3)
+        self.ready = True
+        logger.info(f"Warmup finished in {time.monotonic() - self.started:.2f}s since process start ({self.steps})")
+
+    def status(self):
+        return {'ready': self.ready, 'error': self.error, 'steps': dict(self.steps),
+                'uptime': round(time.monotonic() - self.started, 3)}
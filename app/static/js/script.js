@@ -162,46 +162,122 @@ async function savePreferences() {
     }
 }
 
+const historyState = { nextCursor: null, syncToken: null, loading: false };
+
+function createDateSeparator(date) {
+    const separator = document.createElement('div');
+    separator.className = 'date-separator';
+    separator.dataset.date = date;
+    separator.textContent = new Date(`${date}T00:00:00`).toLocaleDateString();
+    return separator;
+}
+
+function renderHistoryMessage(msg) {
+    const fragment = document.createDocumentFragment();
+    const userMessage = document.createElement('div');
+    userMessage.className = 'message user-message';
+    userMessage.dataset.messageId = msg.id;
+    userMessage.innerHTML = `
+        <div class="message-content">${msg.user_message}${msg.file_url ? `<br><a href="${msg.file_url}" target="_blank">Archivo: ${msg.file_name}</a>` : ''}${msg.edited ? '<div class="edited-label">Editado</div>' : ''}</div>
+        <div class="avatar"><img src="${msg.avatar || '/static/uploads/default.png'}" alt="Avatar"></div>
+        <div class="message-timestamp">${msg.timestamp}</div>
+        <div class="edit-button" onclick="editMessage(${msg.id}, this)">✏️</div>
+        <div class="delete-button" onclick="deleteMessage(${msg.id}, this)">🗑️</div>
+    `;
+    fragment.appendChild(userMessage);
+    const aiMessage = document.createElement('div');
+    aiMessage.className = 'message ai-message';
+    aiMessage.innerHTML = `
+        <div class="avatar">IA</div>
+        <div class="message-content">${marked.parse(msg.ai_response)}</div>
+        <div class="message-timestamp">${msg.timestamp}</div>
+    `;
+    fragment.appendChild(aiMessage);
+    return fragment;
+}
+
+function renderHistoryPage(messages) {
+    const fragment = document.createDocumentFragment();
+    let lastDate = null;
+    messages.forEach(msg => {
+        if (msg.date !== lastDate) {
+            fragment.appendChild(createDateSeparator(msg.date));
+            lastDate = msg.date;
+        }
+        fragment.appendChild(renderHistoryMessage(msg));
+    });
+    return fragment;
+}
+
+async function fetchHistory(params) {
+    const response = await fetch(`/history?${new URLSearchParams(params)}`);
+    const data = await response.json();
+    if (!response.ok) throw new Error(data.error || response.statusText);
+    return data;
+}
+
 async function loadHistory() {
     const chatBox = document.getElementById('chatBox');
     try {
-        const response = await fetch('/history');
-        const messages = await response.json();
-        if (response.ok) {
-            let lastDate = null;
-            messages.forEach(msg => {
-                const messageDate = new Date(msg.timestamp).toLocaleDateString();
-                if (messageDate !== lastDate) {
-                    const separator = document.createElement('div');
-                    separator.className = 'date-separator';
-                    separator.textContent = messageDate;
-                    chatBox.appendChild(separator);
-                    lastDate = messageDate;
-                }
-                const userMessage = document.createElement('div');
-                userMessage.className = 'message user-message';
-                userMessage.dataset.messageId = msg.id;
-                userMessage.innerHTML = `
-                    <div class="message-content">${msg.user_message}${msg.file_url ? `<br><a href="${msg.file_url}" target="_blank">Archivo: ${msg.file_name}</a>` : ''}${msg.edited ? '<div class="edited-label">Editado</div>' : ''}</div>
-                    <div class="avatar"><img src="${msg.avatar || '/static/uploads/default.png'}" alt="Avatar"></div>
-                    <div class="message-timestamp">${msg.timestamp}</div>
-                    <div class="edit-button" onclick="editMessage(${msg.id}, this)">✏️</div>
-                    <div class="delete-button" onclick="deleteMessage(${msg.id}, this)">🗑️</div>
-                `;
-                chatBox.appendChild(userMessage);
-                const aiMessage = document.createElement('div');
-                aiMessage.className = 'message ai-message';
-                aiMessage.innerHTML = `
-                    <div class="avatar">IA</div>
-                    <div class="message-content">${marked.parse(msg.ai_response)}</div>
-                    <div class="message-timestamp">${msg.timestamp}</div>
-                `;
-                chatBox.appendChild(aiMessage);
-            });
-            chatBox.scrollTop = chatBox.scrollHeight;
+        const data = await fetchHistory({ limit: 50 });
+        chatBox.appendChild(renderHistoryPage(data.messages));
+        historyState.nextCursor = data.next_cursor;
+        historyState.syncToken = data.sync_token;
+        chatBox.scrollTop = chatBox.scrollHeight;
+        chatBox.addEventListener('scroll', () => {
+            if (chatBox.scrollTop < 100) loadOlderHistory();
+        });
+        document.addEventListener('visibilitychange', () => {
+            if (document.visibilityState === 'visible') syncHistory();
+        });
+    } catch (error) {
+        showNotification('Error al cargar historial: ' + error.message, 'error');
+    }
+}
+
+async function loadOlderHistory() {
+    if (!historyState.nextCursor || historyState.loading) return;
+    historyState.loading = true;
+    const chatBox = document.getElementById('chatBox');
+    try {
+        const data = await fetchHistory({ limit: 50, before: historyState.nextCursor });
+        const firstSeparator = chatBox.querySelector('.date-separator');
+        const lastMessage = data.messages[data.messages.length - 1];
+        if (firstSeparator && lastMessage && firstSeparator.dataset.date === lastMessage.date) {
+            firstSeparator.remove();
         }
+        const previousHeight = chatBox.scrollHeight;
+        const anchor = chatBox.querySelector('.date-separator, .message');
+        chatBox.insertBefore(renderHistoryPage(data.messages), anchor);
+        chatBox.scrollTop += chatBox.scrollHeight - previousHeight;
+        historyState.nextCursor = data.next_cursor;
     } catch (error) {
         showNotification('Error al cargar historial: ' + error.message, 'error');
+    } finally {
+        historyState.loading = false;
+    }
+}
+
+async function syncHistory() {
+    if (!historyState.syncToken) return;
+    const chatBox = document.getElementById('chatBox');
+    try {
+        let data;
+        do {
+            data = await fetchHistory({ since: historyState.syncToken, limit: 200 });
+            data.messages.forEach(msg => {
+                const existing = chatBox.querySelector(`.user-message[data-message-id="${msg.id}"]`);
+                if (existing) {
+                    existing.nextElementSibling.remove();
+                    existing.replaceWith(renderHistoryMessage(msg));
+                } else if (!chatBox.querySelector(`[data-message-id="${msg.id}"]`)) {
+                    chatBox.appendChild(renderHistoryMessage(msg));
+                }
+            });
+            historyState.syncToken = data.sync_token;
+        } while (data.has_more);
+    } catch (error) {
+        console.error('Error syncing history:', error);
     }
 }
 
@@ -333,19 +409,28 @@ async function sendMessage(message = null, file = null) {
 
     const formData = new FormData();
     formData.append('message', inputMessage);
+    formData.append('stream', '1');
     if (file) formData.append('file', file);
 
     try {
         const response = await fetch('/chat', {
             method: 'POST',
-            body: formData
+            body: formData,
+            headers: { 'Accept': 'text/event-stream, application/json' }
         });
+
+        if (response.ok && (response.headers.get('Content-Type') || '').startsWith('text/event-stream')) {
+            await renderStreamedResponse(response, inputMessage, userMessage, typingIndicator, clearProgress);
+            return;
+        }
+
         const data = await response.json();
         clearProgress();
         typingIndicator.remove();
         updateStatus('online');
 
         if (response.ok) {
+            assignMessageId(userMessage, data.message_id);
             socket.emit('new_message', { user_message: inputMessage, ai_response: data.response, timestamp: new Date().toLocaleTimeString(), avatar: document.getElementById('userAvatar').src });
             const aiMessage = document.createElement('div');
             aiMessage.className = 'message ai-message typewriter';
@@ -369,15 +454,7 @@ async function sendMessage(message = null, file = null) {
                 } else {
                     aiMessage.classList.remove('typewriter');
                     contentDiv.innerHTML = marked.parse(text);
-                    if (data.quick_replies) {
-                        data.quick_replies.forEach(reply => {
-                            const button = document.createElement('button');
-                            button.className = 'quick-reply';
-                            button.textContent = reply;
-                            button.onclick = () => sendMessage(reply);
-                            quickReplies.appendChild(button);
-                        });
-                    }
+                    renderQuickReplies(data.quick_replies);
                 }
                 chatBox.scrollTop = chatBox.scrollHeight;
             }
@@ -394,6 +471,92 @@ async function sendMessage(message = null, file = null) {
     }
 }
 
+function assignMessageId(userMessage, messageId) {
+    if (!messageId) return;
+    userMessage.dataset.messageId = messageId;
+    userMessage.querySelector('.edit-button').setAttribute('onclick', `editMessage(${messageId}, this)`);
+    userMessage.querySelector('.delete-button').setAttribute('onclick', `deleteMessage(${messageId}, this)`);
+}
+
+function renderQuickReplies(replies) {
+    const quickReplies = document.getElementById('quickReplies');
+    (replies || []).forEach(reply => {
+        const button = document.createElement('button');
+        button.className = 'quick-reply';
+        button.textContent = reply;
+        button.onclick = () => sendMessage(reply);
+        quickReplies.appendChild(button);
+    });
+}
+
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let event = 'message';
+            let data = '';
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            });
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
+async function renderStreamedResponse(response, inputMessage, userMessage, typingIndicator, clearProgress) {
+    const chatBox = document.getElementById('chatBox');
+    const aiMessage = document.createElement('div');
+    aiMessage.className = 'message ai-message';
+    aiMessage.innerHTML = `
+        <div class="avatar">IA</div>
+        <div class="message-content"></div>
+        <div class="message-timestamp">${new Date().toLocaleTimeString()}</div>
+    `;
+    const contentDiv = aiMessage.querySelector('.message-content');
+    let text = '';
+    let started = false;
+
+    await readEventStream(response, (event, data) => {
+        if (event === 'error') {
+            showNotification(data.error || 'Error al procesar el mensaje', 'error');
+            return;
+        }
+        if (!started) {
+            started = true;
+            clearProgress();
+            typingIndicator.remove();
+            chatBox.appendChild(aiMessage);
+        }
+        if (event === 'done') {
+            text = data.response;
+            contentDiv.innerHTML = marked.parse(text);
+            assignMessageId(userMessage, data.message_id);
+            renderQuickReplies(data.quick_replies);
+            socket.emit('new_message', { user_message: inputMessage, ai_response: text, timestamp: new Date().toLocaleTimeString(), avatar: document.getElementById('userAvatar').src });
+            checkAchievements();
+        } else {
+            text += data.delta;
+            contentDiv.innerHTML = marked.parse(text);
+        }
+        chatBox.scrollTop = chatBox.scrollHeight;
+    });
+
+    if (!started) {
+        clearProgress();
+        typingIndicator.remove();
+    }
+    updateStatus('online');
+}
+
 function setupFileUpload() {
     const attachButton = document.getElementById('attachButton');
     const fileInput = document.getElementById('fileInput');
@@ -406,6 +569,10 @@ function setupFileUpload() {
 }
 
 function setupSocketIO() {
+    // With SOCKETIO_BATCH_MS set the server coalesces events into [event, data] pairs.
+    socket.on('batch', (events) => {
+        events.forEach(([event, data]) => socket.listeners(event).forEach(handler => handler(data)));
+    });
     socket.on('new_message', (data) => {
         const chatBox = document.getElementById('chatBox');
         const userMessage = document.createElement('div');
@@ -0,0 +1,139 @@
+import logging
+import time
+
+from flask import Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+from chat_loader import StageTimer
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def otel_tracer(service_name):
+    """Tracer exporting over OTLP/HTTP (OTEL_EXPORTER_OTLP_ENDPOINT), or None when
+    the optional opentelemetry-sdk and opentelemetry-exporter-otlp packages are missing."""
+    try:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning("OpenTelemetry is not installed; tracing disabled")
+        return None
+    provider = TracerProvider(resource=Resource.create({'service.name': service_name}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    return trace.get_tracer(service_name)
+
+
+class StatsCollector:
+    """Exposes the stats() dicts of long-lived components as gauges at scrape time,
+    so the request path pays nothing for them."""
+
+    def __init__(self):
+        self.sources = {}
+
+    def add(self, name, stats):
+        self.sources[name] = stats
+
+    def collect(self):
+        for name, stats in self.sources.items():
+            try:
+                values = stats()
+            except Exception as e:
+                logger.error(f"Failed to collect {name} stats: {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    yield GaugeMetricFamily(f"chatbot_{name}_{key}", f"{name} {key.replace('_', ' ')}", value=value)
+
+
+class Telemetry:
+    """Prometheus metrics for the app and optional OpenTelemetry spans for /chat stages.
+
+    Request and stage latencies, model latency and token usage are recorded as
+    they happen. Cache, pool, queue and gateway counters are read from their
+    stats() only when /metrics is scraped.
+    """
+
+    def __init__(self, tracer=None, registry=None):
+        self.tracer = tracer
+        self.registry = registry or CollectorRegistry()
+        self.request_latency = Histogram(
+            'chatbot_http_request_duration_seconds', 'HTTP request latency by route',
+            ['route', 'method', 'status'], registry=self.registry, buckets=LATENCY_BUCKETS)
+        self.stage_latency = Histogram(
+            'chatbot_chat_stage_duration_seconds', 'Latency of each /chat pipeline stage',
+            ['stage'], registry=self.registry, buckets=LATENCY_BUCKETS)
+        self.llm_latency = Histogram(
+            'chatbot_llm_request_duration_seconds', 'Model call latency per attempt',
+            ['model', 'outcome'], registry=self.registry, buckets=LATENCY_BUCKETS)
+        self.llm_tokens = Counter(
+            'chatbot_llm_tokens', 'Tokens used by model', ['model', 'kind'], registry=self.registry)
+        self.scheduler_lag = Histogram(
+            'chatbot_scheduler_lag_seconds', 'Delay between a job\'s scheduled and actual run time',
+            ['job'], registry=self.registry, buckets=LATENCY_BUCKETS)
+        self.stats = StatsCollector()
+        self.registry.register(self.stats)
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        if self.tracer:
+            app.teardown_request(self._end_span)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    def _before_request(self):
+        g.request_started = time.perf_counter()
+        if self.tracer:
+            # Parent span for the stage spans StageTimer opens inside the handler.
+            g.request_span = self.tracer.start_as_current_span(f"{request.method} {request.path}")
+            g.request_span.__enter__()
+
+    def _end_span(self, error=None):
+        span = g.pop('request_span', None)
+        if span is not None:
+            span.__exit__(None, None, None)
+
+    def _after_request(self, response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            self.request_latency.labels(route, request.method, response.status_code).observe(
+                time.perf_counter() - started)
+        return response
+
+    def metrics_view(self):
+        return Response(generate_latest(self.registry), mimetype=CONTENT_TYPE_LATEST)
+
+    def observe_stage(self, stage, seconds):
+        self.stage_latency.labels(stage).observe(seconds)
+
+    def stage_timer(self):
+        return StageTimer(observe=self.observe_stage, tracer=self.tracer)
+
+    def observe_llm(self, model, outcome, seconds):
+        self.llm_latency.labels(model, outcome).observe(seconds)
+
+    def record_usage(self, model, prompt_tokens, completion_tokens):
+        self.llm_tokens.labels(model, 'prompt').inc(prompt_tokens or 0)
+        self.llm_tokens.labels(model, 'completion').inc(completion_tokens or 0)
+
+    def instrument_llm(self, gateway):
+        gateway.instrument(observe=self.observe_llm, record_usage=self.record_usage)
+        self.stats.add('llm', gateway.stats)
+
+    def instrument_scheduler(self, scheduler_service):
+        from apscheduler.events import EVENT_JOB_SUBMITTED
+
+        def on_submitted(event):
+            # Reminders are one job per task ("task:42"); label by kind to bound cardinality.
+            job = event.job_id.split(':', 1)[0]
+            lag = time.time() - min(event.scheduled_run_times).timestamp()
+            self.scheduler_lag.labels(job).observe(max(0.0, lag))
+
+        scheduler_service.scheduler.add_listener(on_submitted, EVENT_JOB_SUBMITTED)
@@ -0,0 +1,58 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing the app opens no connections, so these only need to parse. Nothing
+# listens on port 1: Redis-backed helpers fail open and the pool is replaced per test.
+os.environ.setdefault("REDIS_URL", "redis://127.0.0.1:1")
+os.environ.setdefault("SOCKETIO_MESSAGE_QUEUE", "")
+os.environ.setdefault("DATABASE_URL", "postgresql://postgres@127.0.0.1:1/chatbot_test")
+os.environ.setdefault("LLM_BACKEND", "mock")
+
+
+@pytest.fixture
+def chatbot():
+    """The app module, skipped where its dependencies aren't installed."""
+    return pytest.importorskip("app")
+
+
+@pytest.fixture
+def client(chatbot):
+    chatbot.app.config['TESTING'] = True
+    with chatbot.app.test_client() as client:
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+            session['username'] = 'tester'
+        yield client
+
+
+@pytest.fixture
+def db():
+    """A connection to an empty, migrated database at TEST_DATABASE_URL (wiped first)."""
+    dsn = os.getenv("TEST_DATABASE_URL")
+    if not dsn:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    psycopg2 = pytest.importorskip("psycopg2")
+    from migrations import migrate
+
+    conn = psycopg2.connect(dsn)
+    with conn.cursor() as cur:
+        cur.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public")
+    conn.commit()
+    migrate(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def make_user(db):
+    def make_user(username):
+        with db.cursor() as cur:
+            cur.execute("INSERT INTO users (username, password) VALUES (%s, '\\x00') RETURNING id", (username,))
+            user_id = cur.fetchone()[0]
+        db.commit()
+        return user_id
+    return make_user
@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+
+class EmptyBucket:
+    def take(self, key='', cost=1):
+        return 60.0
+
+
+def test_chat_is_rejected_once_its_model_bucket_is_empty(chatbot, client, db, monkeypatch):
+    from database import ConnectionPool
+
+    with db.cursor() as cur:
+        cur.execute("INSERT INTO users (id, username, password) VALUES (1, 'tester', '\\x00')")
+        cur.execute("INSERT INTO user_preferences (user_id, model) VALUES (1, 'gpt-4o')")
+    db.commit()
+    pool = ConnectionPool(os.environ["TEST_DATABASE_URL"], maxconn=2)
+    monkeypatch.setattr(chatbot, 'db_pool', pool)
+    monkeypatch.setattr(chatbot.admission, 'model_buckets', {'gpt-4o': EmptyBucket()})
+
+    response = client.post('/chat', data={'message': 'hola'})
+    pool.closeall()
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '60'
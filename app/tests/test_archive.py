@@ -0,0 +1,71 @@
+import io
+import json
+import os
+
+import pytest
+
+archive = pytest.importorskip("archive")
+from achievements import AchievementEngine  # noqa: E402
+
+CONVERSATION = {'table': 'conversations', 'user_message': 'hola', 'ai_response': 'hola, ¿qué tal?',
+                'timestamp': '2024-01-01T10:00:00'}
+
+
+def ndjson(*records):
+    return io.BytesIO("\n".join(r if isinstance(r, str) else json.dumps(r) for r in records).encode())
+
+
+def import_ndjson(db, user_id, stream, engine=None):
+    try:
+        return archive.import_records(db, user_id, archive.parse_ndjson(stream), engine)
+    finally:
+        db.rollback()
+
+
+@pytest.mark.parametrize('records', [
+    (CONVERSATION, '{"table": "conversations", '),
+    ({**CONVERSATION, 'timestamp': 'ayer'},),
+    ({**CONVERSATION, 'file_name': 'x' * 500},),
+    ({k: v for k, v in CONVERSATION.items() if k != 'user_message'},),
+    ('[1, 2]',),
+], ids=['bad json after a good line', 'bad timestamp', 'over-long field', 'missing field', 'not an object'])
+def test_malformed_import_raises_value_error(db, make_user, records):
+    with pytest.raises(ValueError):
+        import_ndjson(db, make_user('alice'), ndjson(*records))
+
+
+def test_import_awards_only_the_importing_user(db, make_user):
+    alice, bob = make_user('alice'), make_user('bob')
+    with db.cursor() as cur:
+        # bob is past every threshold but has no badges; importing for alice must not touch him.
+        cur.execute("INSERT INTO user_counters (user_id, name, value) VALUES (%s, 'messages', 1000)", (bob,))
+    db.commit()
+
+    archive.import_records(db, alice, archive.parse_ndjson(ndjson(*[CONVERSATION] * 10)), AchievementEngine())
+    db.commit()
+
+    with db.cursor() as cur:
+        cur.execute("SELECT DISTINCT user_id FROM achievements")
+        assert cur.fetchall() == [(alice,)]
+
+
+def test_imported_rows_reach_clients_holding_an_earlier_sync_token(chatbot, client, db, monkeypatch):
+    from database import ConnectionPool
+
+    with db.cursor() as cur:
+        cur.execute("INSERT INTO users (id, username, password) VALUES (1, 'tester', '\\x00')")
+        cur.execute("INSERT INTO user_profiles (user_id) VALUES (1)")
+        cur.execute("INSERT INTO conversations (user_id, user_message, ai_response) VALUES (1, 'hola', 'hola')")
+    db.commit()
+    pool = ConnectionPool(os.environ["TEST_DATABASE_URL"], maxconn=2)
+    monkeypatch.setattr(chatbot, 'db_pool', pool)
+    token = client.get('/history').get_json()['sync_token']
+
+    # The export carries the updated_at of the database it came from, long before the token.
+    exported = {**CONVERSATION, 'user_message': 'importado', 'updated_at': '2024-01-01T10:00:00'}
+    response = client.post('/import', data=ndjson(exported).getvalue())
+    assert response.status_code == 200
+    page = client.get('/history', query_string={'since': token}).get_json()
+    pool.closeall()
+
+    assert [message['user_message'] for message in page['messages']] == ['importado']
@@ -0,0 +1,91 @@
+import io
+import os
+import threading
+import time
+
+import pytest
+
+blobstore = pytest.importorskip("blobstore")
+uploads = pytest.importorskip("uploads")
+fakeredis = pytest.importorskip("fakeredis")
+
+
+class Upload:
+    def __init__(self, content):
+        self.stream = io.BytesIO(content)
+
+
+@pytest.fixture
+def store(tmp_path):
+    backend = blobstore.LocalBlobBackend(str(tmp_path))
+    return blobstore.BlobStore(backend, fakeredis.FakeStrictRedis(decode_responses=True), ttl=3600)
+
+
+def put(store, content, filename='notas.txt', expires=True):
+    tmp_path, digest, size = uploads.save_upload(Upload(content), store.staging)
+    store.put(tmp_path, digest, filename, 'text/plain', size, expires=expires)
+    return digest
+
+
+def stored_files(store):
+    return sorted(name for _, _, names in os.walk(store.backend.root) for name in names)
+
+
+def test_same_content_is_stored_once_and_refreshes_its_expiry(store):
+    first = put(store, b'hola', 'a.txt')
+    expires_at = store.redis.zscore(blobstore.EXPIRY_INDEX, first)
+    time.sleep(0.01)
+
+    assert put(store, b'hola', 'b.txt') == first
+    assert stored_files(store) == [first]
+    assert os.listdir(store.staging) == []
+    assert store.redis.zscore(blobstore.EXPIRY_INDEX, first) > expires_at
+    assert store.metadata(first)['filename'] == 'b.txt'
+
+
+def test_purge_deletes_only_expired_blobs(store):
+    old, fresh, avatar = put(store, b'viejo'), put(store, b'nuevo'), put(store, b'avatar', expires=False)
+    store.redis.zadd(blobstore.EXPIRY_INDEX, {old: time.time() - 1})
+
+    assert store.purge_expired() == 1
+    assert stored_files(store) == sorted([fresh, avatar])
+    assert store.metadata(old) is None
+    assert store.purge_expired(now=time.time() + 7200) == 1
+    assert stored_files(store) == [avatar]
+
+
+def test_purge_skips_a_blob_uploaded_again_after_the_expired_list_was_read(store, monkeypatch):
+    digest = put(store, b'hola')
+    store.redis.zadd(blobstore.EXPIRY_INDEX, {digest: time.time() - 1})
+    read_expired = store.redis.zrangebyscore
+
+    def read_then_upload_again(*args, **kwargs):
+        expired = read_expired(*args, **kwargs)
+        put(store, b'hola')
+        return expired
+
+    monkeypatch.setattr(store.redis, 'zrangebyscore', read_then_upload_again)
+
+    assert store.purge_expired() == 0
+    assert stored_files(store) == [digest]
+    assert store.metadata(digest) is not None
+
+
+def test_upload_during_a_purge_is_stored_after_it(store, monkeypatch):
+    digest = put(store, b'hola')
+    store.redis.zadd(blobstore.EXPIRY_INDEX, {digest: time.time() - 1})
+    delete = store.backend.delete
+    uploader = threading.Thread(target=put, args=(store, b'hola'))
+
+    def slow_delete(digest):
+        uploader.start()
+        time.sleep(0.2)
+        delete(digest)
+
+    monkeypatch.setattr(store.backend, 'delete', slow_delete)
+
+    assert store.purge_expired() == 1
+    uploader.join(5)
+    assert stored_files(store) == [digest]
+    assert store.metadata(digest) is not None
+    assert store.redis.zscore(blobstore.EXPIRY_INDEX, digest) > time.time()
@@ -0,0 +1,69 @@
+import contextlib
+import os
+import threading
+import time
+
+import pytest
+
+chat_batch = pytest.importorskip("chat_batch")
+
+
+class OpenAdmission:
+    def admit(self, lane=None, model=None):
+        return contextlib.nullcontext()
+
+
+class SlowLLM:
+    def __init__(self, latency):
+        self.latency = latency
+        self.started = 0
+        self._lock = threading.Lock()
+
+    def complete(self, model, messages, **params):
+        with self._lock:
+            self.started += 1
+        time.sleep(self.latency)
+        return f"respuesta a {messages[0]['content']}", model
+
+
+def jobs(count):
+    return [(i, [{'role': 'user', 'content': f'pregunta {i}'}]) for i in range(count)]
+
+
+def test_batch_yields_every_result():
+    batch = chat_batch.ChatBatch(SlowLLM(0.01), OpenAdmission(), concurrency=4)
+    results = list(batch.run('gpt-3.5-turbo', jobs(10)))
+    assert sorted(index for index, _, _, error in results if error is None) == list(range(10))
+
+
+def test_closing_the_batch_early_cancels_pending_calls_without_waiting():
+    llm = SlowLLM(0.5)
+    results = chat_batch.ChatBatch(llm, OpenAdmission(), concurrency=2).run('gpt-3.5-turbo', jobs(20))
+    next(results)
+
+    started = time.perf_counter()
+    results.close()
+
+    assert time.perf_counter() - started < 0.25
+    time.sleep(0.6)
+    # The two calls in flight when the first finished may complete; nothing queued starts.
+    assert llm.started <= 4
+
+
+def test_stopped_batch_saves_the_replies_already_received(chatbot, db, make_user, monkeypatch):
+    from database import ConnectionPool
+
+    user_id = make_user('alice')
+    pool = ConnectionPool(os.environ["TEST_DATABASE_URL"], maxconn=2)
+    monkeypatch.setattr(chatbot, 'db_pool', pool)
+    monkeypatch.setattr(chatbot, 'chat_batch', chat_batch.ChatBatch(SlowLLM(0.2), OpenAdmission(), concurrency=2))
+
+    results = chatbot.run_chat_batch(user_id, [f'pregunta {i}' for i in range(10)])
+    received = [next(results), next(results)]
+    results.close()
+    pool.closeall()
+
+    with db.cursor() as cur:
+        cur.execute("SELECT user_message, ai_response FROM conversations WHERE user_id = %s", (user_id,))
+        saved = set(cur.fetchall())
+    assert saved == {(f"pregunta {r['index']}", r['response']) for r in received}
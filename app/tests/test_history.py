@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+
+def test_delta_sync_pages_through_rows_sharing_one_updated_at(chatbot, client, db, monkeypatch):
+    from database import ConnectionPool
+
+    with db.cursor() as cur:
+        cur.execute("INSERT INTO users (id, username, password) VALUES (1, 'tester', '\\x00')")
+        cur.execute("INSERT INTO user_profiles (user_id) VALUES (1)")
+        # One transaction, so all five rows get the same updated_at (as save_many and /import do).
+        cur.execute("INSERT INTO conversations (user_id, user_message, ai_response) "
+                    "SELECT 1, 'mensaje ' || g, 'respuesta' FROM generate_series(1, 5) g RETURNING id")
+        ids = sorted(row[0] for row in cur.fetchall())
+    db.commit()
+    pool = ConnectionPool(os.environ["TEST_DATABASE_URL"], maxconn=2)
+    monkeypatch.setattr(chatbot, 'db_pool', pool)
+
+    token, seen = '2000-01-01T00:00:00', []
+    while True:
+        page = client.get('/history', query_string={'since': token, 'limit': 2}).get_json()
+        seen += [message['id'] for message in page['messages']]
+        token = page['sync_token']
+        if not page['has_more']:
+            break
+    pool.closeall()
+
+    assert seen == ids
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+memory = pytest.importorskip("memory")
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def turns(*names):
+    return [memory.ConversationMemory._turn(name, f'respuesta {name}') for name in names]
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeStrictRedis()
+
+
+def test_summary_runs_once_when_the_key_is_rewritten_meanwhile(redis_client):
+    calls = []
+
+    def summarize(previous, overflow):
+        calls.append([turn['user'] for turn in overflow])
+        # Another worker touches the key while the model call is in flight.
+        redis_client.set('memory:1', redis_client.get('memory:1'))
+        return f'resumen de {len(overflow)}'
+
+    redis_client.set('memory:1', json.dumps({'summary': '', 'turns': turns('a', 'b')}))
+    memory.ConversationMemory(redis_client, summarize=summarize, max_turns=2).append(1, 'gpt-4o', 'c', 'respuesta c')
+
+    assert calls == [['a']]
+    stored = json.loads(redis_client.get('memory:1'))
+    assert stored['summary'] == 'resumen de 1'
+    assert [turn['user'] for turn in stored['turns']] == ['b', 'c']
+
+
+def test_turn_appended_while_summarizing_is_kept(redis_client):
+    def summarize(previous, overflow):
+        if not previous and len(overflow) == 1:
+            stored = json.loads(redis_client.get('memory:1'))
+            redis_client.set('memory:1', json.dumps({**stored, 'turns': stored['turns'] + turns('d')}))
+        return ' '.join([previous] + [turn['user'] for turn in overflow]).strip()
+
+    redis_client.set('memory:1', json.dumps({'summary': '', 'turns': turns('a', 'b')}))
+    memory.ConversationMemory(redis_client, summarize=summarize, max_turns=2).append(1, 'gpt-4o', 'c', 'respuesta c')
+
+    stored = json.loads(redis_client.get('memory:1'))
+    assert stored['summary'] == 'a b'
+    assert [turn['user'] for turn in stored['turns']] == ['d', 'c']
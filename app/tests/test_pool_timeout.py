@@ -0,0 +1,29 @@
+import pytest
+
+database = pytest.importorskip("database")
+
+
+def exhausted_pool():
+    pool = database.ConnectionPool("postgresql://postgres@127.0.0.1:1/chatbot_test", maxconn=1, timeout=0.05,
+                                   lazy=True)
+    pool._size = pool.maxconn  # the only connection is checked out by another request
+    return pool
+
+
+def test_chat_answers_503_when_the_pool_is_exhausted(chatbot, client, monkeypatch):
+    pool = exhausted_pool()
+    monkeypatch.setattr(chatbot, 'db_pool', pool)
+
+    response = client.post('/chat', data={'message': 'hola'})
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert pool.stats()['timeouts'] == 1
+
+
+def test_login_answers_503_when_the_pool_is_exhausted(chatbot, client, monkeypatch):
+    monkeypatch.setattr(chatbot, 'db_pool', exhausted_pool())
+
+    response = client.post('/login', data={'username': 'tester', 'password': 'secret123'})
+
+    assert response.status_code == 503
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+search = pytest.importorskip("search")
+
+
+def run_search(db, user_id, query):
+    with db.cursor() as cur:
+        cur.execute(search.SEARCH_SQL, {'user_id': user_id, 'query': query, 'limit': 20, 'offset': 0,
+                                        'options': search.HIGHLIGHT_OPTIONS})
+        return cur.fetchall()
+
+
+@pytest.fixture
+def history(db, make_user):
+    user_id = make_user('alice')
+    with db.cursor() as cur:
+        cur.execute(
+            "INSERT INTO conversations (user_id, user_message, ai_response, language) VALUES "
+            "(%(u)s, 'Tengo dudas de Python con las listas', 'Las listas son mutables', 'es'), "
+            "(%(u)s, 'Cómo leo un fichero en Python', 'Usa open() con un bloque with', 'es'), "
+            "(%(u)s, 'python y listas otra vez', 'Sin idioma detectado', NULL) "
+            "RETURNING id",
+            {'u': user_id}
+        )
+        ids = [row[0] for row in cur.fetchall()]
+    db.commit()
+    return user_id, ids
+
+
+def test_stemmed_query_matches_inflected_words(db, history):
+    user_id, (lists, files, untagged) = history
+    assert {row[0] for row in run_search(db, user_id, 'lista')} == {lists}
+
+
+@pytest.mark.parametrize('query', ['listas', 'python listas', 'las listas'])
+def test_short_queries_match_in_the_rows_language(db, history, query):
+    # Short queries are where language detection is least reliable ('listas' alone can
+    # classify as some other language); matching must not depend on it.
+    user_id, (lists, files, untagged) = history
+    assert lists in {row[0] for row in run_search(db, user_id, query)}
+
+
+def test_search_route_finds_a_one_word_spanish_query(chatbot, client, db, history, monkeypatch):
+    from database import ConnectionPool
+
+    user_id, (lists, files, untagged) = history
+    monkeypatch.setattr(chatbot, 'db_pool', ConnectionPool(os.environ["TEST_DATABASE_URL"], maxconn=2))
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+
+    response = client.get('/search?q=listas')
+
+    assert response.status_code == 200
+    assert lists in {result['id'] for result in response.get_json()['results']}
+
+
+def test_rows_without_language_match_through_simple(db, history):
+    user_id, (lists, files, untagged) = history
+    assert untagged in {row[0] for row in run_search(db, user_id, 'listas')}
+
+
+def test_negated_term_excludes_rows_in_every_configuration(db, history):
+    user_id, (lists, files, untagged) = history
+    rows = run_search(db, user_id, 'python -listas')
+    assert [row[0] for row in rows] == [files]
+    assert '<mark>Python</mark>' in search.highlight(rows[0][3])
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+database = pytest.importorskip("database")
+
+
+def show_timeout(conn):
+    with conn.cursor() as cur:
+        cur.execute("SHOW statement_timeout")
+        return cur.fetchone()[0]
+
+
+@pytest.fixture
+def pool(db):
+    pool = database.ConnectionPool(os.environ["TEST_DATABASE_URL"], maxconn=1)
+    yield pool
+    pool.closeall()
+
+
+def test_statement_timeout_survives_a_commit_mid_handler(pool):
+    conn = pool.getconn('interactive')
+    try:
+        assert show_timeout(conn) == '5s'
+        conn.commit()
+        assert show_timeout(conn) == '5s'
+        conn.rollback()
+        assert show_timeout(conn) == '5s'
+    finally:
+        pool.putconn(conn)
+
+
+def test_connection_is_returned_without_an_open_transaction(pool):
+    from psycopg2 import extensions
+
+    with pool.connection('background') as conn:
+        assert show_timeout(conn) == '1min'
+    # The timeout is only set again once a cursor is opened, so the final commit leaves nothing behind.
+    assert conn.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE
+    with pool.connection('bulk') as conn:
+        assert show_timeout(conn) == '0'
@@ -0,0 +1,25 @@
+import datetime
+
+import pytest
+
+write_behind = pytest.importorskip("write_behind")
+
+
+def test_flushed_rows_are_stamped_updated_at_flush_time(db, make_user):
+    user_id = make_user('alice')
+    submitted = datetime.datetime.now() - datetime.timedelta(minutes=5)
+    with db.cursor() as cur:
+        cur.execute("SELECT nextval(pg_get_serial_sequence('conversations', 'id'))")
+        message_id = cur.fetchone()[0]
+        record = {'id': message_id, 'user_id': user_id, 'user_message': 'hola', 'ai_response': 'hola',
+                  'language': 'es', 'timestamp': submitted}
+        cur.execute(write_behind.FLUSH_SQL,
+                    {f"{name}s": [record.get(name)] for name in write_behind.FIELDS})
+        cur.execute("SELECT timestamp, updated_at, CURRENT_TIMESTAMP::timestamp FROM conversations WHERE id = %s",
+                    (message_id,))
+        timestamp, updated_at, now = cur.fetchone()
+    db.rollback()
+
+    assert timestamp == submitted
+    # A client that synced after the submission but before the flush must still see the row.
+    assert updated_at == now
@@ -0,0 +1,138 @@
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+from memory import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# OpenAI vision fits images into 2048x2048 and then scales the shortest side to
+# 768px, so anything larger is bandwidth the model never looks at.
+IMAGE_MAX_SIDE = 2048
+IMAGE_MAX_SHORT_SIDE = 768
+IMAGE_QUALITY = 85
+TEXT_TOKEN_BUDGET = 2000
+TEXT_CHUNK_TOKENS = 500
+TRUNCATION_NOTE = "\n[... archivo truncado ...]"
+
+
+def save_upload(file_storage, staging_dir):
+    """Stream an upload to a staging file in chunks and return (path, sha256 hex digest, size)."""
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=staging_dir, prefix='upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file_storage.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+                out.write(chunk)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+
+def downscale_image(path):
+    """Re-encode an image as a JPEG no larger than the model's useful resolution."""
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image)
+        width, height = image.size
+        scale = min(1.0, IMAGE_MAX_SIDE / max(width, height), IMAGE_MAX_SHORT_SIDE / min(width, height))
+        if scale < 1.0:
+            image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=IMAGE_QUALITY, optimize=True)
+    encoded = base64.b64encode(buffer.getvalue()).decode('ascii')
+    return {'data_url': f"data:image/jpeg;base64,{encoded}", 'width': image.width, 'height': image.height}
+
+
+def chunk_text(text, chunk_tokens=TEXT_CHUNK_TOKENS):
+    """Split text into paragraph-aligned chunks of roughly chunk_tokens each."""
+    chunks, current, current_tokens = [], [], 0
+    for paragraph in text.split('\n'):
+        tokens = estimate_tokens(paragraph)
+        if current and current_tokens + tokens > chunk_tokens:
+            chunks.append('\n'.join(current))
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += tokens
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
+
+
+def extract_text(path, token_budget=TEXT_TOKEN_BUDGET):
+    """Read a text upload and keep the leading chunks that fit the token budget."""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        content = f.read()
+    chunks = chunk_text(content)
+    kept, used = [], 0
+    for chunk in chunks:
+        tokens = estimate_tokens(chunk)
+        if used + tokens > token_budget:
+            break
+        kept.append(chunk)
+        used += tokens
+    if not kept and chunks:
+        # A single paragraph larger than the whole budget.
+        kept = [chunks[0][:token_budget * 4]]
+    text = '\n'.join(kept)
+    truncated = len(text) < len(content)
+    return {'text': text + (TRUNCATION_NOTE if truncated else ''), 'chunks': len(chunks), 'truncated': truncated}
+
+
+class UploadProcessor:
+    """Runs upload processing on a worker pool and caches artifacts by content hash.
+
+    offload, when given, replaces the internal thread pool (e.g. eventlet.tpool.execute
+    so CPU-heavy image work runs on a real OS thread under cooperative workers).
+    """
+
+    def __init__(self, redis_client, max_workers=4, ttl=24 * 3600, timeout=30, offload=None):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.timeout = timeout
+        self.offload = offload
+        self.executor = None if offload else ThreadPoolExecutor(max_workers, thread_name_prefix='upload')
+
+    def _run(self, func, *args):
+        if self.offload:
+            return self.offload(func, *args)
+        return self.executor.submit(func, *args).result(timeout=self.timeout)
+
+    def process(self, path, mimetype, digest):
+        """Return the prompt artifact for an upload, or None for unsupported types."""
+        if mimetype.startswith('image'):
+            kind, func = 'image', downscale_image
+        elif mimetype.startswith('text'):
+            kind, func = 'text', extract_text
+        else:
+            return None
+        key = f"upload:artifact:{kind}:{digest}"
+        try:
+            cached = self.redis.get(key)
+            if cached:
+                logger.info(f"Upload artifact cache hit: {digest[:12]}")
+                return json.loads(cached)
+        except Exception as e:
+            logger.error(f"Upload artifact cache lookup failed: {e}")
+        artifact = self._run(func, path)
+        try:
+            self.redis.setex(key, self.ttl, json.dumps(artifact))
+        except Exception as e:
+            logger.error(f"Upload artifact cache store failed: {e}")
+        return artifact
@@ -0,0 +1,232 @@
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# One statement per batch. Rows carry ids reserved from the conversations
+# sequence, so a replayed entry conflicts on the primary key and is skipped;
+# only rows actually inserted advance the message counters. timestamp is when
+# the exchange happened; updated_at is when the row became visible, so
+# /history?since= clients that synced in between still receive it.
+FLUSH_SQL = """
+    WITH batch AS (
+        SELECT * FROM unnest(%(ids)s::int[], %(user_ids)s::int[], %(user_messages)s::text[],
+                             %(ai_responses)s::text[], %(file_urls)s::varchar[], %(file_names)s::varchar[],
+                             %(avatars)s::varchar[], %(languages)s::varchar[], %(timestamps)s::timestamp[])
+            AS r(id, user_id, user_message, ai_response, file_url, file_name, avatar, language, timestamp)
+    ), inserted AS (
+        INSERT INTO conversations (id, user_id, user_message, ai_response, file_url, file_name, avatar, language,
+                                   timestamp, updated_at)
+        SELECT id, user_id, user_message, ai_response, file_url, file_name, avatar, language, timestamp,
+               CURRENT_TIMESTAMP
+        FROM batch
+        ON CONFLICT (id) DO NOTHING
+        RETURNING user_id
+    ), counts AS (
+        SELECT user_id, COUNT(*) AS added FROM inserted GROUP BY user_id
+    ), bumped AS (
+        INSERT INTO user_counters (user_id, name, value)
+        SELECT user_id, 'messages', added FROM counts
+        ON CONFLICT (user_id, name) DO UPDATE SET value = user_counters.value + EXCLUDED.value
+        RETURNING user_id, value
+    )
+    SELECT b.user_id, b.value - c.added, b.value FROM bumped b JOIN counts c USING (user_id)
+"""
+
+FIELDS = ('id', 'user_id', 'user_message', 'ai_response', 'file_url', 'file_name', 'avatar', 'language', 'timestamp')
+
+
+class ConversationWriter:
+    """Write-behind persistence for chat exchanges.
+
+    submit() reserves the row id, appends the exchange to a Redis stream and
+    returns, so /chat answers as soon as the model is done. A writer thread in
+    every worker reads the stream through a consumer group and inserts each
+    batch with one statement, acknowledging entries only after the commit.
+
+    Delivery is at-least-once: entries left unacknowledged by a failed flush are
+    retried, and those of a writer that died are claimed by another after
+    claim_after seconds. The reserved id doubles as the idempotency key, so a
+    replay never duplicates a row. A batch that keeps failing is split to find
+    the bad entries, which go to a dead-letter stream after max_attempts.
+
+    When the stream already holds max_pending entries, or Redis is unreachable,
+    submit() returns None and the caller writes synchronously instead, which
+    slows requests down rather than growing the backlog without bound.
+    """
+
+    def __init__(self, redis_client, db_pool, achievement_engine, stream='conversations:pending',
+                 group='conversation-writers', batch_size=500, block=0.2, max_pending=100000,
+                 max_attempts=5, claim_after=60.0, retry_delay=1.0, id_block=100, on_awarded=None):
+        self.redis = redis_client
+        self.db_pool = db_pool
+        self.achievement_engine = achievement_engine
+        self.stream = stream
+        self.dead_letter = f"{stream}:dead"
+        self.group = group
+        self.consumer = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.batch_size = batch_size
+        self.block = block
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.claim_after = claim_after
+        self.retry_delay = retry_delay
+        self.id_block = id_block
+        self.on_awarded = on_awarded
+        self.metrics = {'queued': 0, 'fallbacks': 0, 'flushed': 0, 'duplicates': 0, 'batches': 0,
+                        'retries': 0, 'dead_lettered': 0}
+        self._ids = []
+        self._ids_lock = threading.Lock()
+        self._attempts = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def reserve_id(self):
+        """Next conversation id, taken from the sequence id_block at a time."""
+        with self._ids_lock:
+            if not self._ids:
+                with self.db_pool.connection() as conn, conn.cursor() as cur:
+                    cur.execute(
+                        "SELECT nextval(pg_get_serial_sequence('conversations', 'id')) FROM generate_series(1, %s)",
+                        (self.id_block,)
+                    )
+                    self._ids = [row[0] for row in reversed(cur.fetchall())]
+            return self._ids.pop()
+
+    def submit(self, user_id, user_message, ai_response, file_url=None, file_name=None, avatar=None,
+               language=None):
+        """Queue an exchange and return its conversation id, or None to write it synchronously."""
+        try:
+            if self.redis.xlen(self.stream) >= self.max_pending:
+                logger.warning(f"Write-behind queue full, writing synchronously for user_id: {user_id}")
+                self.metrics['fallbacks'] += 1
+                return None
+            message_id = self.reserve_id()
+            entry = {
+                'id': message_id, 'user_id': user_id, 'user_message': user_message, 'ai_response': ai_response,
+                'file_url': file_url, 'file_name': file_name, 'avatar': avatar, 'language': language,
+                'timestamp': datetime.datetime.now().isoformat()
+            }
+            self.redis.xadd(self.stream, {'data': json.dumps(entry)})
+        except Exception as e:
+            logger.error(f"Write-behind enqueue failed, writing synchronously: {e}")
+            self.metrics['fallbacks'] += 1
+            return None
+        self.metrics['queued'] += 1
+        return message_id
+
+    def start(self):
+        """Start this worker's writer thread (idempotent)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='conversation-writer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _ensure_group(self):
+        try:
+            self.redis.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except Exception as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._ensure_group()
+                break
+            except Exception as e:
+                logger.error(f"Write-behind writer cannot create its consumer group: {e}")
+                self._stop.wait(self.retry_delay)
+        last_claim = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                claim = time.monotonic() - last_claim > self.claim_after
+                if claim:
+                    last_claim = time.monotonic()
+                entries = self._read(claim)
+                if entries and not self._flush(entries):
+                    self.metrics['retries'] += 1
+                    self._stop.wait(self.retry_delay)
+            except Exception as e:
+                logger.error(f"Write-behind writer failed: {e}")
+                self._stop.wait(self.retry_delay)
+
+    def _read(self, claim=False):
+        """Entries to flush: our own unacknowledged ones first, then abandoned ones, then new ones."""
+        response = self.redis.xreadgroup(self.group, self.consumer, {self.stream: '0'}, count=self.batch_size)
+        entries = response[0][1] if response else []
+        if not entries and claim:
+            entries = self.redis.xautoclaim(self.stream, self.group, self.consumer,
+                                            min_idle_time=int(self.claim_after * 1000),
+                                            count=self.batch_size)[1]
+        if not entries:
+            response = self.redis.xreadgroup(self.group, self.consumer, {self.stream: '>'},
+                                             count=self.batch_size, block=int(self.block * 1000))
+            entries = response[0][1] if response else []
+        return entries
+
+    def _ack(self, entry_ids):
+        pipe = self.redis.pipeline()
+        pipe.xack(self.stream, self.group, *entry_ids)
+        pipe.xdel(self.stream, *entry_ids)
+        pipe.execute()
+        for entry_id in entry_ids:
+            self._attempts.pop(entry_id, None)
+
+    def _flush(self, entries):
+        """Write a batch; return False if any entry is left for a retry."""
+        # Trimmed or deleted entries come back from the pending list without fields.
+        valid = [(entry_id, fields) for entry_id, fields in entries if fields and 'data' in fields]
+        if len(valid) < len(entries):
+            self._ack([entry_id for entry_id, fields in entries if not fields or 'data' not in fields])
+        if not valid:
+            return True
+        try:
+            self._write([json.loads(fields['data']) for _, fields in valid])
+        except Exception as e:
+            if len(valid) > 1:
+                logger.warning(f"Write-behind batch of {len(valid)} failed ({e}); retrying entries one by one")
+                return all([self._flush([entry]) for entry in valid])
+            entry_id, fields = valid[0]
+            attempts = self._attempts.get(entry_id, 0) + 1
+            self._attempts[entry_id] = attempts
+            if attempts < self.max_attempts:
+                logger.error(f"Write-behind entry {entry_id} failed (attempt {attempts}): {e}")
+                return False
+            logger.error(f"Write-behind entry {entry_id} dead-lettered after {attempts} attempts: {e}")
+            self.redis.xadd(self.dead_letter, {'data': fields['data'], 'error': str(e)})
+            self.metrics['dead_lettered'] += 1
+        self._ack([entry_id for entry_id, _ in valid])
+        return True
+
+    def _write(self, records):
+        awarded = []
+        with self.db_pool.connection('background') as conn, conn.cursor() as cur:
+            cur.execute(FLUSH_SQL, {f"{name}s": [record.get(name) for record in records] for name in FIELDS})
+            bumps = cur.fetchall()
+            for user_id, before, after in bumps:
+                rules = self.achievement_engine.evaluate_range('messages', before, after)
+                if rules:
+                    awarded.append((user_id, self.achievement_engine.award(cur, user_id, rules)))
+        inserted = sum(after - before for _, before, after in bumps)
+        self.metrics['batches'] += 1
+        self.metrics['flushed'] += inserted
+        self.metrics['duplicates'] += len(records) - inserted
+        if self.on_awarded:
+            for user_id, achievements in awarded:
+                if achievements:
+                    self.on_awarded(user_id, achievements)
+
+    def stats(self):
+        try:
+            backlog = self.redis.xlen(self.stream)
+        except Exception:
+            backlog = -1
+        return {'backlog': backlog, **self.metrics}